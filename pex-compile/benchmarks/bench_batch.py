@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Scaling of the parallel batch mode with the number of jobs
+
+Writes a directory of generated modules and compiles it with `pex-compile -j N` for every
+requested N, each time into an empty output directory and without the compile cache. The
+compiler runs as a separate process, so start-up and process pool overheads are included
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate import generate_classes
+
+import subprocess
+import tempfile
+import time
+from argparse import ArgumentParser
+
+
+PACKAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def write_sources(directory, file_count, classes_per_file):
+    for i in range(file_count):
+        with open(os.path.join(directory, f'module{i}.py'), 'w') as f:
+            f.write(generate_classes(classes_per_file))
+
+
+def compile_directory(source_directory, output_directory, jobs):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-m', 'pex_compile', '-j', str(jobs), '-o', output_directory, source_directory],
+        cwd=PACKAGE_DIRECTORY,
+        check=True,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def parse_args():
+    ap = ArgumentParser(description='Measure the batch compile time for several numbers of jobs')
+    ap.add_argument('--files', type=int, default=40, help='Number of generated modules')
+    ap.add_argument('--classes', type=int, default=60, help='Number of classes per module')
+    ap.add_argument('--repeat', type=int, default=3, help='Number of runs, the best one is reported')
+    ap.add_argument(
+        'jobs',
+        type=int,
+        nargs='*',
+        default=[1, 2, 4, os.cpu_count() or 1],
+        help='Numbers of jobs to measure (default: 1, 2, 4 and the number of CPUs)',
+    )
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        source_directory = os.path.join(directory, 'src')
+        os.mkdir(source_directory)
+        write_sources(source_directory, options.files, options.classes)
+        print(f'{options.files} files, {options.classes} classes each, {os.cpu_count()} CPUs')
+
+        baseline = None
+        for jobs in sorted(set(options.jobs)):
+            best = None
+            for run in range(options.repeat):
+                output_directory = os.path.join(directory, f'out-{jobs}-{run}')
+                elapsed = compile_directory(source_directory, output_directory, jobs)
+                best = elapsed if best is None else min(best, elapsed)
+            if baseline is None:
+                baseline = best
+            print(f'-j {jobs:3}: {best:.2f} s, speedup {baseline / best:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""Image size and load time of compressed sections
+
+Every format of bench_size.py is compiled uncompressed and with every registered codec. With
+`--load-sections` the load time includes the decompression by pex-loader
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pex_compile import compression
+
+from bench_size import FORMAT_VARIANTS
+from bench_size import make_argument_parser
+from bench_size import measure_variants
+
+
+def main():
+    options = make_argument_parser('Compare the image size and load time of compressed sections').parse_args()
+    variants = []
+    for name, arguments in FORMAT_VARIANTS:
+        variants.append((name, arguments))
+        for codec_name in sorted(compression.CODECS):
+            variants.append((f'{name} + {codec_name}', [*arguments, '--compress', codec_name]))
+    measure_variants(
+        options.source,
+        variants,
+        common_arguments=['-O'] if options.optimize else [],
+        load_sections=options.load_sections,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Instruction encoding throughput of ByteCompiler
+
+Only ByteCompiler.instructions() is timed, over the instructions of every code object of the
+module, so translation, linking and constant serialization don't count
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pex_compile import ast_to_pykebc
+from pex_compile import pykebc
+
+import ast
+import time
+from argparse import ArgumentParser
+
+
+def iterate_code(code):
+    pending = [code]
+    while pending:
+        code = pending.pop()
+        yield code
+        pending.extend(value for value in code.constants if isinstance(value, pykebc.LinkedCode))
+
+
+def parse_args():
+    ap = ArgumentParser(description='Measure the instruction encoding speed of ByteCompiler')
+    ap.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is reported')
+    ap.add_argument('--compact', action='store_true', help='Measure CompactByteCompiler')
+    ap.add_argument('source', help='Input file name (e.g. made by `generate.py classes 2000`)')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    with open(options.source, 'r') as f:
+        source = f.read()
+    codes = list(iterate_code(ast_to_pykebc.translate(ast.parse(source)).link()))
+    instruction_count = sum(len(code.instructions) for code in codes)
+    byte_compiler = pykebc.CompactByteCompiler() if options.compact else pykebc.ByteCompiler()
+
+    best = None
+    for _ in range(options.repeat):
+        start = time.perf_counter()
+        for code in codes:
+            byte_compiler.instructions(code.instructions)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f'{len(codes)} code objects, {instruction_count} instructions, '
+        f'best of {options.repeat}: {best:.4f} s, {instruction_count / best:,.0f} instructions/s'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""Linking time: label resolution, name resolution and unreachable code removal
+
+Nested functions and classes are linked while their parent is translated, so every Code object
+is captured on its way into Code.link() and all of them are linked again in the timed runs
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pex_compile import ast_to_pykebc
+from pex_compile import cfg
+from pex_compile import pykebc
+
+import ast
+import time
+from argparse import ArgumentParser
+
+
+def translate_capturing_code(tree):
+    codes = []
+    link = pykebc.Code.link
+
+    def capturing_link(code):
+        codes.append(code)
+        return link(code)
+
+    pykebc.Code.link = capturing_link
+    try:
+        ast_to_pykebc.translate(tree).link()
+    finally:
+        pykebc.Code.link = link
+    return codes
+
+
+def parse_args():
+    ap = ArgumentParser(description='Measure the time Code.link() takes')
+    ap.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is reported')
+    ap.add_argument('source', help='Input file name (e.g. made by `generate.py branches 20000`)')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    with open(options.source, 'r') as f:
+        codes = translate_capturing_code(ast.parse(f.read()))
+    instruction_count = 0
+    branch_count = 0
+    for code in codes:
+        for command, argument in code.instructions:
+            instruction_count += 1
+            branch_count += command in cfg.JUMP_COMMANDS
+
+    best = None
+    for _ in range(options.repeat):
+        start = time.perf_counter()
+        for code in codes:
+            code.link()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(
+        f'{len(codes)} code objects, {instruction_count} instructions, {branch_count} branches, '
+        f'best of {options.repeat}: {best:.3f} s'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Image size and load time of the PEX formats
+
+Compiles a module once per variant of compiler options and prints the image sizes. With
+`--load-sections`, the load time of every image is measured by the `load_sections` program of
+pex-loader (see pex-loader/benchmarks), which reads all sections with StreamLoader
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+
+PACKAGE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# (name, extra compiler options)
+FORMAT_VARIANTS = [
+    ('0.2', []),
+    ('compact 0.3', ['--compact']),
+]
+
+
+def compile_image(source_path, output_path, arguments):
+    subprocess.run(
+        [sys.executable, '-m', 'pex_compile', *arguments, '-o', output_path, source_path],
+        cwd=PACKAGE_DIRECTORY,
+        check=True,
+    )
+
+
+def measure_load_times(load_sections, paths):
+    """Best load time of every image in milliseconds"""
+    output = subprocess.run(
+        [load_sections, *paths],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    load_times = {}
+    for line in output.splitlines():
+        path, loaded_size, milliseconds = line.split('\t')
+        load_times[path] = float(milliseconds)
+    return load_times
+
+
+def measure_variants(source_path, variants, common_arguments=(), load_sections=None):
+    """Compile the module with every variant and print the image sizes (and load times)"""
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i, (name, arguments) in enumerate(variants):
+            path = os.path.join(directory, f'variant{i}.pex')
+            compile_image(os.path.abspath(source_path), path, [*common_arguments, *arguments])
+            paths.append(path)
+        load_times = {} if load_sections is None else measure_load_times(load_sections, paths)
+
+        base_size = os.path.getsize(paths[0])
+        for (name, arguments), path in zip(variants, paths):
+            size = os.path.getsize(path)
+            line = f'{name:24} {size:12,} bytes {100 * (size - base_size) / base_size:+7.1f}%'
+            if path in load_times:
+                line += f' {load_times[path]:9.3f} ms'
+            print(line)
+
+
+def make_argument_parser(description):
+    ap = ArgumentParser(description=description)
+    ap.add_argument('--optimize', '-O', action='store_true', help='Compile with -O')
+    ap.add_argument('--load-sections', help='Path to the load_sections program of pex-loader')
+    ap.add_argument('source', help='Input file name (e.g. made by `generate.py classes 2000`)')
+    return ap
+
+
+def main():
+    options = make_argument_parser('Compare the image size and load time of the PEX formats').parse_args()
+    measure_variants(
+        options.source,
+        FORMAT_VARIANTS,
+        common_arguments=['-O'] if options.optimize else [],
+        load_sections=options.load_sections,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Generators of synthetic Python modules used as benchmark inputs
+
+Every generator uses only constructs the compiler supports, so its output can go through the
+whole pipeline
+"""
+
+import sys
+from argparse import ArgumentParser
+
+
+CLASS_TEMPLATE = '''
+class C{i}(object):
+    def method(a, b, c=3):
+        x = a + b * c - {i}
+        y = [a, b, c, (x, {i})]
+        if x < y.first and b >= 2:
+            z = {{'k': x, 'v': y}}
+            a.attr = z
+        else:
+            z = a.attr.other
+        while x > 0:
+            x = x - 1
+            if x == 5:
+                break
+        {loop}
+            z = q
+        try:
+            w = c.d(x, y, z)
+        except ValueError as e:
+            w = None
+        return w
+'''
+
+
+def generate_classes(count, loops=True):
+    """A module of `count` classes with one method each: arithmetic, containers, attributes,
+    branches, loops and exception handling, 21 lines per class
+    """
+    loop = 'for q in y:' if loops else 'if q:'
+    return ''.join(CLASS_TEMPLATE.format(i=i, loop=loop) for i in range(count))
+
+
+def generate_branches(count):
+    """A module of functions with `count` conditional branches in total, 50 per function, mixed
+    with loops and exception handling
+    """
+    lines = ['x = 0']
+    for f in range(count // 50):
+        lines.append(f'def f{f}(a, b):')
+        lines.append('    r = 0')
+        for i in range(25):
+            lines.append(f'    if a < {i} and b > {i} or a == b:')
+            lines.append(f'        r = r + {i}')
+            lines.append('    else:')
+            lines.append('        r = r - 1')
+        lines.extend([
+            '    while r > 10:',
+            '        r = r - 3',
+            '    for i in b:',
+            '        if i:',
+            '            break',
+            '    try:',
+            '        r = a / b',
+            '    except ZeroDivisionError:',
+            '        r = 0',
+            '    return r',
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def parse_args():
+    ap = ArgumentParser(description='Write a synthetic Python module to standard output')
+    ap.add_argument('kind', choices=['branches', 'classes'], help='Kind of module')
+    ap.add_argument('count', type=int, help='Size of the module (number of classes or branches)')
+    ap.add_argument('--no-loops', dest='loops', action='store_false', help='Replace `for` loops with `if` statements')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    if options.kind == 'branches':
+        sys.stdout.write(generate_branches(options.count))
+    elif options.kind == 'classes':
+        sys.stdout.write(generate_classes(options.count, loops=options.loops))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,58 +3,258 @@
 from pex_compile import ast_to_pykebc
 from pex_compile import pykebc
 from pex_compile import build_pex
+from pex_compile import cache
+from pex_compile import compression
+from pex_compile import disassembler
+from pex_compile import peephole
+from pex_compile import superinstructions
+from pex_compile import writer as pex_writer
 
 import ast
-import dis
-from argparse import ArgumentParser
+import contextlib
+import os
+import sys
+from argparse import ArgumentParser, ArgumentTypeError
+from concurrent.futures import ProcessPoolExecutor
+
+
+def alignment(value):
+    value = int(value)
+    if value <= 0 or value & (value - 1) != 0:
+        raise ArgumentTypeError(f'alignment must be a power of two, not {value}')
+    return value
 
 
 def parse_args():
-    ap = ArgumentParser(description='Compile Python file to PEX format')
-    ap.add_argument('--output', '-o', required=True, help='Created PEX file name')
-    ap.add_argument('source', help='Input file name')
-    return ap.parse_args()
-
-
-def indent(string, indent_string=' '*4):
-    lines = string.split('\n')
-    return '\n'.join([
-        indent_string + line
-        for line in lines
-    ])
-
-
-def pretty(code):
-    buf = []
-    for command, argument in code.instructions:
-        if argument is None:
-            buf.append(command + '\n')
-        else:
-            buf.append(command + ' ' + str(argument) + '\n')
-    buf.append('\n')
-    for i, value in enumerate(code.constants):
-        buf.append(
-            'const {} = {}\n'.format(
-                i,
-                pretty(value) if isinstance(value, pykebc.LinkedCode) else repr(value),
-            )
+    ap = ArgumentParser(description='Compile Python file (or all Python files in a directory) to PEX format')
+    ap.add_argument(
+        '--output',
+        '-o',
+        required=True,
+        help='Created PEX file name (output directory if the source is a directory)',
+    )
+    ap.add_argument('--jobs', '-j', type=int, default=1, help='Number of files compiled in parallel')
+    ap.add_argument('--optimize', '-O', action='store_true', help='Fold constants, run the peephole optimizer and use superinstructions')
+    ap.add_argument('--cache-dir', help='Directory of the compile cache (no caching if not specified)')
+    ap.add_argument(
+        '--cache-size',
+        type=int,
+        default=cache.DEFAULT_MAX_SIZE // 2**20,
+        help='Maximal size of the compile cache in MiB',
+    )
+    ap.add_argument(
+        '--align',
+        type=alignment,
+        default=1,
+        help='Align sections to this boundary (e.g. 4096 for mmap-based loading)',
+    )
+    ap.add_argument(
+        '--code-align',
+        type=alignment,
+        help='Align instruction streams to this boundary (default: 4 with --align, 1 otherwise)',
+    )
+    ap.add_argument(
+        '--constant-pool',
+        action='store_true',
+        help=(
+            'Serialize constants into a module-wide pool instead of every code object. Disables '
+            'the caching of single functions and classes'
+        ),
+    )
+    ap.add_argument(
+        '--compact',
+        action='store_true',
+        help='Use the compact format: varint counts and lengths, 2-byte instructions',
+    )
+    ap.add_argument(
+        '--compress',
+        choices=sorted(compression.CODECS),
+        help='Compress every section with this codec',
+    )
+    ap.add_argument(
+        '--debug',
+        '-g',
+        action='store_true',
+        help='Store the source line of every instruction in a `line` debug section',
+    )
+    listing = ap.add_mutually_exclusive_group()
+    listing.add_argument(
+        '--listing',
+        action='store_true',
+        help='Print the listing of the compiled code to standard output',
+    )
+    listing.add_argument('--listing-file', help='Write the listing of the compiled code to this file')
+    ap.add_argument('source', help='Input file or directory name')
+    options = ap.parse_args()
+    if options.code_align is None:
+        options.code_align = 4 if options.align > 1 else 1
+    if (options.listing or options.listing_file is not None) and os.path.isdir(options.source):
+        ap.error('--listing and --listing-file need a single source file')
+    return options
+
+
+def options_key(options):
+    # All options which affect the compiled output
+    return (
+        f'optimize={options.optimize},align={options.align},code_align={options.code_align},'
+        f'constant_pool={options.constant_pool},compact={options.compact},compress={options.compress},'
+        f'debug={options.debug}'
+    )
+
+
+def compile_source(source, options, compile_cache=None, listing=None):
+    tree = ast.parse(source)
+    # Functions and classes are cached as standalone blobs, but aligned code depends on its
+    # position in the image, pooled code on the rest of the module and the line table on both.
+    # Whole images are still cached
+    cacheable = options.code_align == 1 and not options.constant_pool and not options.debug
+    nested_cache = compile_cache if cacheable else None
+    pyke_bytecode = ast_to_pykebc.translate(tree, optimize=options.optimize, cache=nested_cache)
+    linked_code = pyke_bytecode.link()
+    if options.optimize:
+        linked_code = peephole.optimize(linked_code)
+        linked_code = superinstructions.fuse(linked_code)
+    if listing is not None:
+        disassembler.write_listing(linked_code, listing)
+        listing.write('\n')
+    byte_compiler_type = pykebc.CompactByteCompiler if options.compact else pykebc.ByteCompiler
+    byte_compiler = byte_compiler_type(
+        cache=nested_cache,
+        code_alignment=options.code_align,
+        pool=pykebc.ConstantPool() if options.constant_pool else None,
+        line_table=pykebc.LineTable() if options.debug else None,
+    )
+    writer = pex_writer.Writer()
+    build_pex.write(
+        writer,
+        linked_code,
+        byte_compiler,
+        exports=ast_to_pykebc.find_exports(tree),
+        section_alignment=options.align,
+        codec=None if options.compress is None else compression.get_codec(options.compress),
+    )
+    return writer.output
+
+
+def make_cache(options):
+    if options.cache_dir is None:
+        return None
+    return cache.CompileCache(
+        options.cache_dir,
+        options=options_key(options),
+        max_size=options.cache_size * 2**20,
+    )
+
+
+def compile_file(source_path, options, compile_cache=None, listing=None):
+    with open(source_path, 'r') as f:
+        source = f.read()
+    if compile_cache is None:
+        return compile_source(source, options, listing=listing)
+
+    key = compile_cache.module_key(source)
+    # A cached image has no listing, so the module is compiled again when one is requested
+    pex_file = compile_cache.get(key) if listing is None else None
+    if pex_file is None:
+        pex_file = compile_source(source, options, compile_cache, listing=listing)
+        compile_cache.put(key, pex_file)
+    return pex_file
+
+
+def write_if_changed(path, data):
+    """Write the file unless it already has exactly this content. Returns whether the file was written"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def find_sources(directory):
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith('.py'):
+                yield os.path.relpath(os.path.join(root, filename), directory)
+
+
+def compile_batch_task(task):
+    # Runs in a worker process. Errors are returned rather than raised, so that one broken file
+    # doesn't abort the whole batch
+    source_path, output_path, options = task
+    try:
+        pex_file = compile_file(source_path, options, make_cache(options))
+        written = write_if_changed(output_path, pex_file)
+    except Exception as e:
+        return source_path, False, f'{type(e).__name__}: {e}'
+    return source_path, written, None
+
+
+def compile_batch(options):
+    tasks = [
+        (
+            os.path.join(options.source, relative_path),
+            os.path.join(options.output, os.path.splitext(relative_path)[0] + '.pex'),
+            options,
         )
-    return '{\n' + indent(''.join(buf)).rstrip() + '\n' + '}'
+        for relative_path in find_sources(options.source)
+    ]
+
+    if options.jobs == 1:
+        results = [compile_batch_task(task) for task in tasks]
+    else:
+        # Several files per work item amortize the inter-process communication, while
+        # a few items per worker still keep the load balanced
+        chunksize = max(1, len(tasks) // (options.jobs * 4))
+        with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+            results = list(executor.map(compile_batch_task, tasks, chunksize=chunksize))
+
+    failed_count = 0
+    written_count = 0
+    for source_path, written, error in results:
+        if error is not None:
+            print(f'{source_path}: {error}', file=sys.stderr)
+            failed_count += 1
+        elif written:
+            written_count += 1
+    print(
+        f'{len(tasks)} files: {written_count} written, '
+        f'{len(tasks) - written_count - failed_count} unchanged, {failed_count} failed',
+        file=sys.stderr,
+    )
+    return failed_count == 0
+
+
+def open_listing(options):
+    """Context manager giving the file the listing is written to, or None without a listing"""
+    if options.listing_file is not None:
+        return open(options.listing_file, 'w')
+    return contextlib.nullcontext(sys.stdout if options.listing else None)
 
 
 def main():
     options = parse_args()
-    with open(options.source, 'r') as f:
-        code = f.read()
-    tree = ast.parse(code)
-    pyke_bytecode = ast_to_pykebc.translate(tree)
-    linked_code = pyke_bytecode.link()
-    print(pretty(linked_code))
-    byte_compiler = pykebc.ByteCompiler()
-    pyke_bytecode = byte_compiler.compile(linked_code)
-    pex_file = build_pex.build(pyke_bytecode)
-    with open(options.output, 'wb') as f:
-        f.write(pex_file)
+    compile_cache = make_cache(options)
+
+    if os.path.isdir(options.source):
+        success = compile_batch(options)
+    else:
+        with open_listing(options) as listing:
+            pex_file = compile_file(options.source, options, compile_cache, listing=listing)
+        write_if_changed(options.output, pex_file)
+        success = True
+
+    if compile_cache is not None:
+        compile_cache.trim()
+    if not success:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
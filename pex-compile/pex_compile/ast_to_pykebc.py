@@ -1,6 +1,7 @@
 import ast
 import copy
 
+from pex_compile import constant_folding
 from pex_compile import pykebc
 
 
@@ -13,6 +14,10 @@ class LoopFrame(object):
         self.end_label = end_label
 
 
+class TryExceptFrame(object):
+    __slots__ = []
+
+
 class TryFinallyFrame(object):
     __slots__ = ['finally_label']
 
@@ -36,9 +41,10 @@ class ContextManager(object):
 
 
 class TryExcept(object):
-    def __init__(self, body, handlers):
+    def __init__(self, body, handlers, orelse):
         self.body = body
         self.handlers = handlers
+        self.orelse = orelse
 
 
 class TryFinally(object):
@@ -47,12 +53,128 @@ class TryFinally(object):
         self.finalbody = finalbody
 
 
+NESTED_SCOPE_TYPES = (
+    ast.FunctionDef,
+    ast.AsyncFunctionDef,
+    ast.ClassDef,
+    ast.Lambda,
+    ast.GeneratorExp,
+    ast.ListComp,
+    ast.SetComp,
+    ast.DictComp,
+)
+
+
+def find_scope_names(tree):
+    """Find the names of the function `tree` for find_local_names
+
+    Returns the parameters in declaration order (positional ones, then keyword-only ones), all
+    other names the function binds (assignment, `for` and `del` targets, `except ... as` names,
+    nested function and class names) and the set of names which have to be accessed with the
+    `name` instruction: names declared `global` or `nonlocal` and names used by nested scopes
+    """
+    assert isinstance(tree, ast.FunctionDef)
+    parameters = [arg.arg for arg in tree.args.args + tree.args.kwonlyargs]
+    bound_names = []
+    shared_names = set()
+
+    pending = list(reversed(tree.body))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, NESTED_SCOPE_TYPES):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                bound_names.append(node.name)
+            shared_names.update(
+                child.id
+                for child in ast.walk(node)
+                if isinstance(child, ast.Name)
+            )
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            bound_names.append(node.id)
+        elif isinstance(node, ast.ExceptHandler) and node.name is not None:
+            bound_names.append(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            shared_names.update(node.names)
+        pending.extend(reversed(list(ast.iter_child_nodes(node))))
+
+    return parameters, bound_names, shared_names
+
+
+def find_local_names(tree):
+    """Find the names which get fast local slots in the function `tree`"""
+    return select_local_names(*find_scope_names(tree))
+
+
+def select_local_names(parameters, bound_names, shared_names):
+    """Pick the names which get fast local slots from the output of find_scope_names
+
+    Every parameter gets a slot, in declaration order, so `init_function` binds argument i to
+    slot i without knowing the names of the slots. Then come the other bound names, except the
+    shared ones. A shared parameter still gets its slot, but the code accesses it by name: the
+    function prologue copies it from the slot
+    """
+    local_names = list(parameters)
+    for name in bound_names:
+        if name not in shared_names and name not in local_names:
+            local_names.append(name)
+    return local_names
+
+
+def find_exports(tree):
+    """Find the names bound at the top level of the module `tree`
+
+    Returns a list of (name, kind) pairs in the order of first binding, where kind is one of
+    'variable', 'function' and 'class' (the kind of the last binding wins). Bindings inside
+    compound statements count too, bindings inside functions and classes don't
+    """
+    assert isinstance(tree, ast.Module)
+    exports = {}
+
+    pending = list(reversed(tree.body))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            exports[node.name] = 'function'
+            continue
+        if isinstance(node, ast.ClassDef):
+            exports[node.name] = 'class'
+            continue
+        if isinstance(node, NESTED_SCOPE_TYPES):
+            continue
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            exports[node.id] = 'variable'
+        elif isinstance(node, ast.ExceptHandler) and node.name is not None:
+            exports[node.name] = 'variable'
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != '*':
+                    exports[alias.asname or alias.name.split('.')[0]] = 'variable'
+        pending.extend(reversed(list(ast.iter_child_nodes(node))))
+
+    return list(exports.items())
+
+
 class Compiler(object):
-    __slots__ = ['code', 'frames']
+    __slots__ = ['code', 'frames', 'cache', 'optimize']
 
-    def __init__(self):
+    def __init__(self, cache=None, optimize=False):
         self.code = None
         self.frames = None
+        self.cache = cache
+        self.optimize = optimize
+
+    def compile_nested(self, tree, type):
+        # Unchanged functions and classes are taken from the compile cache as a whole
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.code_key(tree)
+            blob = self.cache.get(cache_key)
+            if blob is not None:
+                return pykebc.CompiledCode(blob)
+        comp = Compiler(cache=self.cache, optimize=self.optimize)
+        code = comp.visit(tree, type=type, cache_key=cache_key)
+        return code.link()
 
     def visit_body(self, body):
         assert isinstance(body, list)
@@ -60,38 +182,30 @@ class Compiler(object):
             self.visit_statement(tree)
 
     def visit_statement(self, tree):
-        type_table = [
-            #(ast.AnnAssign,     self.visit_ann_assign),
-            #(ast.Assert,        self.visit_assert),
-            (ast.Assign,        self.visit_assign),
-            #(ast.AugAssign,     self.visit_aug_assign),
-            (ast.Break,         self.visit_break),
-            (ast.ClassDef,      self.visit_class_def),
-            (ast.Continue,      self.visit_continue),
-            (ast.Delete,        self.visit_delete),
-            (ast.Expr,          self.visit_expr),
-            (ast.For,           self.visit_for),
-            (ast.FunctionDef,   self.visit_function_def),
-            #(ast.Global,        self.visit_global),
-            (ast.If,            self.visit_if),
-            #(ast.Import,        self.visit_import),
-            #(ast.ImportFrom,    self.visit_import_from),
-            #(ast.Nonlocal,      self.visit_nonlocal),
-            (ast.Pass,          self.visit_pass),
-            (ast.Raise,         self.visit_raise),
-            (ast.Return,        self.visit_return),
-            (ast.Try,           self.visit_try),
-            (ast.While,         self.visit_while),
-            #(ast.With,          self.visit_with),
-            (TryExcept,         self.visit_try_except),
-            (TryFinally,        self.visit_try_finally),
-        ]
-
-        for Type, func in type_table:
-            if isinstance(tree, Type):
-                func(tree)
-                return
-        raise Exception(f'Unimplemented statement type: {type(tree)}')
+        func = self.find_visitor(self.STATEMENT_VISITORS, tree, 'statement')
+        self.visit_at_line(func, tree)
+
+    @staticmethod
+    def find_visitor(visitors, tree, kind):
+        node_type = type(tree)
+        try:
+            return visitors[node_type]
+        except KeyError:
+            pass
+        # A subclass of a listed type is looked up along its MRO once and then cached under its own type
+        for base in node_type.__mro__[1:]:
+            if base in visitors:
+                visitors[node_type] = visitors[base]
+                return visitors[base]
+        raise Exception(f'Unimplemented {kind} type: {node_type}')
+
+    def visit_at_line(self, func, tree):
+        # Attribute the emitted instructions to the node's line. Nodes made up by the compiler
+        # (TryExcept, TryFinally) have no position and keep the line of the enclosing node
+        line = self.code.line
+        self.code.line = getattr(tree, 'lineno', line)
+        func(self, tree)
+        self.code.line = line
 
     def visit_class_def(self, tree):
         assert isinstance(tree, ast.ClassDef)
@@ -99,13 +213,10 @@ class Compiler(object):
             self.visit_expr(base)
         # TODO: support keyword args (i.e. metaclasses and their kwargs)
         #
-        comp = Compiler()
-        class_code = comp.visit(tree, type='class')
-        linked_class_code = class_code.link()
-        self.code.add_const(linked_class_code)
+        self.code.add_const(self.compile_nested(tree, type='class'))
 
         self.code.add('make_class', len(tree.bases))
-        self.code.add('name', ('store', tree.name))
+        self.emit_name('store', tree.name)
 
     
     def visit_raise(self, tree):
@@ -116,9 +227,11 @@ class Compiler(object):
             self.visit_expr(tree.exc)
 
         if tree.cause is not None:
-            self.code.add_const(None)
-            self.code.add('attribute', ('set', self.code.get_const_id('__context__')))
+            # Stack: exc
+            self.code.add('stack', 'dup')
             self.visit_expr(tree.cause)
+            self.code.add('stack', 'swap2')
+            # Stack: exc cause exc
             self.code.add('attribute', ('set', self.code.get_const_id('__cause__')))
         self.code.add('raise', None)
     
@@ -132,11 +245,8 @@ class Compiler(object):
 
     def visit_function_def(self, tree):
         assert isinstance(tree, ast.FunctionDef)
-        comp = Compiler()
-        function_code = comp.visit(tree, type='function')
-        linked_function_code = function_code.link()
-        self.code.add_const(linked_function_code)
-        self.code.add('name', ('store', tree.name))
+        self.code.add_const(self.compile_nested(tree, type='function'))
+        self.emit_name('store', tree.name)
 
     def visit_delete(self, tree):
         assert isinstance(tree, ast.Delete)
@@ -148,7 +258,10 @@ class Compiler(object):
         frames = copy.copy(self.frames)
         while frames:
             frame = frames.pop()
-            if isinstance(frame, TryFinallyFrame):
+            if isinstance(frame, TryExceptFrame):
+                self.code.add('end_try', None)
+            elif isinstance(frame, TryFinallyFrame):
+                self.code.add('end_try', None)
                 self.code.add('finally', (False, frame.finally_label))
             elif isinstance(frame, LoopFrame):
                 self.code.add('jump', frame.start_label)
@@ -162,7 +275,10 @@ class Compiler(object):
         frames = copy.copy(self.frames)
         while frames:
             frame = frames.pop()
-            if isinstance(frame, TryFinallyFrame):
+            if isinstance(frame, TryExceptFrame):
+                self.code.add('end_try', None)
+            elif isinstance(frame, TryFinallyFrame):
+                self.code.add('end_try', None)
                 self.code.add('finally', (False, frame.finally_label))
             elif isinstance(frame, LoopFrame):
                 self.code.add('jump', frame.end_label)
@@ -200,8 +316,10 @@ class Compiler(object):
         exit_label = self.code.new_label('try-except_exit')
 
         self.code.add('try', try_label)
-        self.visit_body(tree.body)
+        with self.enter_try_except():
+            self.visit_body(tree.body)
         self.code.add('end_try', None)
+        self.visit_body(tree.orelse)
         self.code.add('jump', exit_label)
         
         self.code.add_label(try_label)
@@ -219,7 +337,7 @@ class Compiler(object):
             if handler.name is None:
                 self.code.add('stack', 'pop')
             else:
-                self.code.add('name', ('store', handler.name))
+                self.emit_name('store', handler.name)
             self.visit_body(handler.body)
             self.code.add('jump', exit_label)
 
@@ -232,8 +350,8 @@ class Compiler(object):
                 TryExcept(
                     body=tree.body,
                     handlers=tree.handlers,
+                    orelse=tree.orelse,
                 ),
-                *tree.orelse,
             ],
             finalbody = tree.finalbody,
         )
@@ -246,11 +364,9 @@ class Compiler(object):
     def visit_for(self, tree):
         assert isinstance(tree, ast.For)
         start_label = self.code.new_label('for_start')
-        try_label = self.code.new_label('for_try')
-        except_label = self.code.new_label('for_except')
+        break_label = self.code.new_label('for_break')
         else_label = self.code.new_label('for_else')
         end_label = self.code.new_label('for_end')
-        bogus_label = self.code.new_label('for_bogus')
 
         # Stack: ...
         self.visit_expr(tree.iter)
@@ -260,15 +376,11 @@ class Compiler(object):
 
         self.code.add_label(start_label)
         # === REPEATED ===
-        with self.enter_loop(start_label, else_label, end_label):
-            self.code.add('try', try_label)
+        with self.enter_loop(start_label, else_label, break_label):
             # Stack: ... iter
-            self.code.add('stack', 'dup')
-            # Stack: ... iter iter
-
-            self.code.add('pseudo_call', 'next')
+            self.code.add('for_iter', else_label)
             # Stack: ... iter element
-            self.code.add('end_try', None)
+            # (when the iterator is exhausted, it is popped and execution continues at else_label)
 
             # Save the current value into the specified variable/tuple/etc.
             self.visit_expr(tree.target)
@@ -277,25 +389,16 @@ class Compiler(object):
             self.visit_body(tree.body)
             self.code.add('jump', start_label)
 
-        self.code.add_label(else_label)
+        # `break` jumps here with the iterator still on the stack
+        self.code.add_label(break_label)
         # Stack: ... iter
         self.code.add('stack', 'pop')
         # Stack: ...
-        self.visit_body(tree.orelse)
-        # Stack: ...
         self.code.add('jump', end_label)
-    
-        self.code.add_label(try_label)
-        # Stack: ... iter iter exc
-        self.code.add('name', ('load_global', 'StopIteration'))
-        self.code.add('except', except_label)
-        self.code.add('raise', None)
 
-        self.code.add_label(except_label)
-        # Stack: ... iter exc
-        self.code.add('stack', 'pop')
-        # Stack: ... iter
-        self.code.add('jump', else_label)
+        self.code.add_label(else_label)
+        # Stack: ...
+        self.visit_body(tree.orelse)
 
         self.code.add_label(end_label)
         # Stack: ...
@@ -307,6 +410,13 @@ class Compiler(object):
             self.frames.pop()
         return ContextManager(enter, exit)
 
+    def enter_try_except(self):
+        def enter():
+            self.frames.append(TryExceptFrame())
+        def exit(*args):
+            self.frames.pop()
+        return ContextManager(enter, exit)
+
     def enter_try_finally(self, finally_label):
         def enter():
             self.frames.append(TryFinallyFrame(finally_label))
@@ -321,8 +431,11 @@ class Compiler(object):
         end_label = self.code.new_label('while_end')
 
         self.code.add_label(start_label)
-        self.visit_expr(tree.test)
-        self.code.add('cjump', (False, True, else_label))
+        # With -O, like the constant folder drops `while <false constant>`, an always true test
+        # is not evaluated at all
+        if not (self.optimize and constant_folding.is_true_constant(tree.test)):
+            self.visit_expr(tree.test)
+            self.code.add('cjump', (False, True, else_label))
 
         with self.enter_loop(start_label, else_label, end_label):
             self.visit_body(tree.body)
@@ -367,49 +480,39 @@ class Compiler(object):
             self.code.add('stack', 'pop')
             return
 
-        type_table = [
-            (ast.Attribute,     self.visit_attribute),
-            (ast.BinOp,         self.visit_bin_op),
-            (ast.BoolOp,        self.visit_bool_op),
-            (ast.Bytes,         self.visit_bytes),
-            (ast.Call,          self.visit_call),
-            (ast.Compare,       self.visit_compare),
-            (ast.Dict,          self.visit_dict),
-            #(ast.DictComp,      self.visit_dict_comp),
-            #(ast.Ellipsis,      self.visit_ellipsis),
-            #(ast.FormattedStr,  self.visit_formatted_str),
-            #(ast.GeneratorExp,  self.visit_generator_exp),
-            (ast.IfExp,         self.visit_if_exp),
-            #(ast.JoinedStr,     self.visit_joined_str),
-            (ast.List,          self.visit_list),
-            #(ast.ListComp,      self.visit_list_comp),
-            (ast.Name,          self.visit_name),
-            (ast.NameConstant,  self.visit_name_constant),
-            (ast.Num,           self.visit_num),
-            (ast.Set,           self.visit_set),
-            #(ast.SetComp,       self.visit_set_comp),
-            (ast.Starred,       self.visit_starred),
-            (ast.Str,           self.visit_str),
-            (ast.Subscript,     self.visit_subscript),
-            (ast.Tuple,         self.visit_tuple),
-            (ast.UnaryOp,       self.visit_unary_op),
-        ]
-
-        for Type, func in type_table:
-            if isinstance(tree, Type):
-                func(tree)
+        # Expression visitors are generators yielding the subexpressions to be visited in their
+        # place. Running them from an explicit stack limits the nesting depth by memory rather
+        # than by Python's stack, e.g. for machine-generated `a + b + c + ...` chains
+        code = self.code
+        pending = []
+        while True:
+            if tree is not None:
+                func = self.find_visitor(self.EXPRESSION_VISITORS, tree, 'expression')
+                line = code.line
+                code.line = getattr(tree, 'lineno', line)
+                visitor = func(self, tree)
+                if visitor is None:
+                    # Leaves (names, constants) are plain functions
+                    code.line = line
+                else:
+                    pending.append((visitor, line))
+            if not pending:
                 return
-        raise Exception(f'Unimplemented expression type: {type(tree)}')
+            visitor, line = pending[-1]
+            tree = next(visitor, None)
+            if tree is None:
+                pending.pop()
+                code.line = line
 
     def visit_dict(self, tree):
         assert isinstance(tree, ast.Dict)
         for key, value in zip(tree.keys, tree.values):
             if key is None:
-                self.visit_expr(value)
+                yield value
                 self.code.add('unpack', 'dict')
             else:
-                self.visit_expr(key)
-                self.visit_expr(value)
+                yield key
+                yield value
         self.code.add('make_struct', ('dict', len(tree.keys)))
 
     def visit_if_exp(self, tree):
@@ -418,16 +521,16 @@ class Compiler(object):
         exit_label = self.code.new_label('if_exp_exit')
 
         # Test
-        self.visit_expr(tree.test)
+        yield tree.test
         self.code.add('cjump', (False, True, false_label))
 
         # True branch
-        self.visit_expr(tree.body)
+        yield tree.body
         self.code.add('jump', exit_label)
 
         # False branch
         self.code.add_label(false_label)
-        self.visit_expr(tree.orelse)
+        yield tree.orelse
 
         # Exit
         self.code.add_label(exit_label)
@@ -435,7 +538,7 @@ class Compiler(object):
     def visit_subscript(self, tree):
         assert isinstance(tree, ast.Subscript)
         if isinstance(tree.slice, ast.Index):
-            self.visit_subscript_index(tree)
+            yield from self.visit_subscript_index(tree)
         elif isinstance(tree.slice, ast.Slice):
             self.visit_subscript_slice(tree)
         elif isinstance(tree.slice, ast.ExtSlice):
@@ -449,8 +552,8 @@ class Compiler(object):
     def visit_subscript_index(self, tree):
         assert isinstance(tree, ast.Subscript)
         assert isinstance(tree.slice, ast.Index)
-        self.visit_expr(tree.value)
-        self.visit_expr(tree.slice.value)
+        yield tree.value
+        yield tree.slice.value
         if isinstance(tree.ctx, ast.Load):
             self.code.add('index', 'get')
         elif isinstance(tree.ctx, ast.Store):
@@ -460,6 +563,13 @@ class Compiler(object):
         else:
             raise Exception(f'Unimplemented context: {type(tree.ctx)}')
 
+    def visit_constant(self, tree):
+        # Since Python 3.8 all literals are parsed into ast.Constant
+        assert isinstance(tree, ast.Constant)
+        if tree.value is not None and not isinstance(tree.value, (int, float, complex, str, bytes)):
+            raise Exception(f'Unimplemented constant type: {type(tree.value)}')
+        self.code.add_const(tree.value)
+
     def visit_name_constant(self, tree):
         assert isinstance(tree, ast.NameConstant)
         self.code.add_const(tree.value)
@@ -467,7 +577,7 @@ class Compiler(object):
     def visit_starred(self, tree):
         assert isinstance(tree, ast.Starred)
         if isinstance(tree.ctx, ast.Load):
-            self.visit_expr(tree.value)
+            yield tree.value
             self.code.add('unpack', 'iterable')
         elif isinstance(tree.ctx, ast.Store):
             self.visit_name(tree.value)
@@ -476,7 +586,7 @@ class Compiler(object):
 
     def visit_attribute(self, tree):
         assert isinstance(tree, ast.Attribute)
-        self.visit_expr(tree.value)
+        yield tree.value
         if isinstance(tree.ctx, ast.Load):
             self.code.add('attribute', ('get', self.code.get_const_id(tree.attr)))
         elif isinstance(tree.ctx, ast.Store):
@@ -493,22 +603,29 @@ class Compiler(object):
         if tree.keywords:
             self.visit_extended_call()
             return
-        self.visit_expr(tree.func)
+        yield tree.func
         for argument in tree.args:
-            self.visit_expr(argument)
+            yield argument
         self.code.add('call_function', len(tree.args))
 
     def visit_name(self, tree):
         assert isinstance(tree, ast.Name)
         if isinstance(tree.ctx, ast.Load):
-            self.code.add('name', ('load', tree.id))
+            self.emit_name('load', tree.id)
         elif isinstance(tree.ctx, ast.Store):
-            self.code.add('name', ('store', tree.id))
+            self.emit_name('store', tree.id)
         elif isinstance(tree.ctx, ast.Del):
-            self.code.add('name', ('del', tree.id))
+            self.emit_name('del', tree.id)
         else:
             raise Exception(f'Unimplemented context: {type(tree.ctx)}')
 
+    def emit_name(self, action, name):
+        slot = self.code.get_local_slot(name)
+        if slot is None:
+            self.code.add('name', (action, name))
+        else:
+            self.code.add(action + '_fast', slot)
+
     def visit_num(self, tree):
         assert isinstance(tree, ast.Num)
         self.code.add_const(tree.n)
@@ -521,16 +638,16 @@ class Compiler(object):
         assert isinstance(tree, ast.Tuple)
         if isinstance(tree.ctx, ast.Load):
             for element in tree.elts:
-                self.visit_expr(element)
+                yield element
             self.code.add('make_struct', ('tuple', len(tree.elts)))
         elif isinstance(tree.ctx, ast.Store):
             self.code.add('eager_unpack_list', len(tree.elts))
             for element in reversed(tree.elts):
-                self.visit_expr(element)
+                yield element
         elif isinstance(tree.ctx, ast.Del):
             self.code.add('eager_unpack_list', len(tree.elts))
             for element in reversed(tree.elts):
-                self.visit_expr(element)
+                yield element
         else:
             raise Exception(f'Unimplemented context: {type(tree.ctx)}')
 
@@ -538,21 +655,21 @@ class Compiler(object):
         assert isinstance(tree, ast.List)
         if isinstance(tree.ctx, ast.Load):
             for element in tree.elts:
-                self.visit_expr(element)
+                yield element
             self.code.add('make_struct', ('list', len(tree.elts)))
         elif isinstance(tree.ctx, ast.Store):
             self.code.add('eager_unpack_list', len(tree.elts))
             for element in reversed(tree.elts):
-                self.visit_expr(element)
+                yield element
         elif isinstance(tree.ctx, ast.Del):
             self.code.add('eager_unpack_list', len(tree.elts))
             for element in reversed(tree.elts):
-                self.visit_expr(element)
+                yield element
 
     def visit_set(self, tree):
         assert isinstance(tree, ast.Set)
         for element in tree.elts:
-            self.visit_expr(element)
+            yield element
         self.code.add('make_struct', ('set', len(tree.elts)))
 
     def visit_str(self, tree):
@@ -575,9 +692,15 @@ class Compiler(object):
         }[type(op)]
 
     def visit_compare(self, tree):
-        # TODO: Optimize for simple comparisons
         assert isinstance(tree, ast.Compare)
 
+        if len(tree.ops) == 1:
+            # A single comparison doesn't need the accumulator: evaluate `lhs op rhs` directly
+            yield tree.left
+            yield tree.comparators[0]
+            self.code.add('binop', self.get_comparison_operator(tree.ops[0]))
+            return
+
         # Comparisons are lazy-evaluated. `1 < 2 < 3` is semantically equivalent to `1 < 2 and 2 < 3`.
         # When a comparison evaluates to False, other comparison are not evaluated and the overall result is
         # False. To achive this, the following is being done:
@@ -606,7 +729,7 @@ class Compiler(object):
         # Stack: ... accum
 
         # Place the first operand on the stack.
-        self.visit_expr(tree.left)
+        yield tree.left
         # Stack: ... accum v0   (equiv. to: ... accum lhs)
 
         # Comparison index (from 0 inclusively to len(tree.comparators) not inclusively)
@@ -616,7 +739,7 @@ class Compiler(object):
             # Stack: ... accum lhs
     
             # Place the right operand of the current comparison
-            self.visit_expr(value)
+            yield value
             # Stack: ... accum lhs rhs
 
             # Save the current rhs value to use it in the next comparison
@@ -663,8 +786,8 @@ class Compiler(object):
 
     def visit_bin_op(self, tree):
         assert isinstance(tree, ast.BinOp)
-        self.visit_expr(tree.left)
-        self.visit_expr(tree.right)
+        yield tree.left
+        yield tree.right
         if isinstance(tree.op, ast.Add):
             self.code.add('binop', '+')
         elif isinstance(tree.op, ast.Sub):
@@ -702,18 +825,18 @@ class Compiler(object):
             op = 'or'
         else:
             raise Exception(f'Unsupported bool operator type: {type(tree)}')
-        self.visit_expr(tree.values[0])
+        yield tree.values[0]
         label = self.code.new_label('bool_op_exit')
         for operand in tree.values[1:]:
             # Skip evaluating what is not needed
             self.code.add('cjump', ({'and': False, 'or': True}[op], False, label))
-            self.visit_expr(operand)
+            yield operand
             self.code.add('binop', op)
         self.code.add_label(label)
 
     def visit_unary_op(self, tree):
         assert isinstance(tree, ast.UnaryOp)
-        self.visit_expr(tree.operand)
+        yield tree.operand
         if isinstance(tree.op, ast.UAdd):
             self.code.add('unop', '+')
         elif isinstance(tree.op, ast.USub):
@@ -745,15 +868,85 @@ class Compiler(object):
         self.code.add('init_function', None)
         
 
-    def visit(self, tree, type='module'):
-        self.code = pykebc.Code(type=type)
+    def visit(self, tree, type='module', cache_key=None):
+        self.code = pykebc.Code(type=type, cache_key=cache_key)
         if type == 'function':
+            parameters, bound_names, shared_names = find_scope_names(tree)
+            for name in select_local_names(parameters, bound_names, shared_names):
+                self.code.add_local(name, shared=name in shared_names)
+            self.code.line = tree.lineno
             self.emit_function_prologue(tree)
+            # Parameters used by nested scopes are bound to their slots like all others, and
+            # the code accesses them by name
+            for slot, name in enumerate(parameters):
+                if name in shared_names:
+                    self.code.add('load_fast', slot)
+                    self.code.add('name', ('store', name))
         self.frames = []
         self.visit_body(tree.body)
         return self.code
 
 
-def translate(tree):
-    gen = Compiler()
+# Resolved once at import time: node type -> visitor
+Compiler.STATEMENT_VISITORS = {
+    #ast.AnnAssign:     Compiler.visit_ann_assign,
+    #ast.Assert:        Compiler.visit_assert,
+    ast.Assign:         Compiler.visit_assign,
+    #ast.AugAssign:     Compiler.visit_aug_assign,
+    ast.Break:          Compiler.visit_break,
+    ast.ClassDef:       Compiler.visit_class_def,
+    ast.Continue:       Compiler.visit_continue,
+    ast.Delete:         Compiler.visit_delete,
+    ast.Expr:           Compiler.visit_expr,
+    ast.For:            Compiler.visit_for,
+    ast.FunctionDef:    Compiler.visit_function_def,
+    #ast.Global:        Compiler.visit_global,
+    ast.If:             Compiler.visit_if,
+    #ast.Import:        Compiler.visit_import,
+    #ast.ImportFrom:    Compiler.visit_import_from,
+    #ast.Nonlocal:      Compiler.visit_nonlocal,
+    ast.Pass:           Compiler.visit_pass,
+    ast.Raise:          Compiler.visit_raise,
+    ast.Return:         Compiler.visit_return,
+    ast.Try:            Compiler.visit_try,
+    ast.While:          Compiler.visit_while,
+    #ast.With:          Compiler.visit_with,
+    TryExcept:          Compiler.visit_try_except,
+    TryFinally:         Compiler.visit_try_finally,
+}
+
+Compiler.EXPRESSION_VISITORS = {
+    ast.Attribute:      Compiler.visit_attribute,
+    ast.BinOp:          Compiler.visit_bin_op,
+    ast.BoolOp:         Compiler.visit_bool_op,
+    ast.Bytes:          Compiler.visit_bytes,
+    ast.Call:           Compiler.visit_call,
+    ast.Compare:        Compiler.visit_compare,
+    ast.Constant:       Compiler.visit_constant,
+    ast.Dict:           Compiler.visit_dict,
+    #ast.DictComp:      Compiler.visit_dict_comp,
+    #ast.Ellipsis:      Compiler.visit_ellipsis,
+    #ast.FormattedStr:  Compiler.visit_formatted_str,
+    #ast.GeneratorExp:  Compiler.visit_generator_exp,
+    ast.IfExp:          Compiler.visit_if_exp,
+    #ast.JoinedStr:     Compiler.visit_joined_str,
+    ast.List:           Compiler.visit_list,
+    #ast.ListComp:      Compiler.visit_list_comp,
+    ast.Name:           Compiler.visit_name,
+    ast.NameConstant:   Compiler.visit_name_constant,
+    ast.Num:            Compiler.visit_num,
+    ast.Set:            Compiler.visit_set,
+    #ast.SetComp:       Compiler.visit_set_comp,
+    ast.Starred:        Compiler.visit_starred,
+    ast.Str:            Compiler.visit_str,
+    ast.Subscript:      Compiler.visit_subscript,
+    ast.Tuple:          Compiler.visit_tuple,
+    ast.UnaryOp:        Compiler.visit_unary_op,
+}
+
+
+def translate(tree, optimize=False, cache=None):
+    if optimize:
+        tree = constant_folding.fold(tree)
+    gen = Compiler(cache=cache, optimize=optimize)
     return gen.visit(tree)
@@ -1,22 +1,130 @@
-def build(bytecode, type='exec'):
-    pex = []
+from pex_compile import pykebc
+from pex_compile import writer as pex_writer
 
+
+# The header: magic, file type, format version and section count (16 bytes), then section
+# alignment (u32) and instruction stream alignment (u32)
+HEADER_SIZE = 24
+
+# Section directory entry: name (4 bytes), flags (u32), offset (u64), size (u64). Offsets are
+# relative to the beginning of the image
+DIRECTORY_ENTRY_SIZE = 24
+
+# Sections a loader may skip without affecting execution, e.g. debug information
+SECTION_FLAG_DEBUG = 1
+
+# Bits 8-15 of the flags hold the id of the codec the section is compressed with (0 for none).
+# A compressed section is the uncompressed size (u64) followed by the compressed data
+SECTION_CODEC_SHIFT = 8
+SECTION_CODEC_MASK = 0xFF << SECTION_CODEC_SHIFT
+
+EXPORT_KINDS = ['variable', 'function', 'class']
+
+
+def write_header(writer, type, section_count, format_version, section_alignment=1, code_alignment=1):
+    start = writer.tell()
     magic = b'PEX'
-    pex.append(magic)
+    writer.write(magic)
     encoded_type = ['other', 'exec', 'lib'].index(type)
-    pex.append(bytes([encoded_type]))
-    
-    format_version = b'\x00\x00\x00\x00'
-    pex.append(format_version)
-
-    section_count = (1).to_bytes(8, 'big')
-    pex.append(section_count)
-
-    assert len(b''.join(pex)) == 16
-    section = []
-    section.append(b'code')
-    section.append(bytecode)
-    section_bytes = b''.join(section)
-    pex.append(len(section_bytes).to_bytes(8, 'big'))
-    pex.append(section_bytes)
-    return b''.join(pex)
+    writer.write(bytes([encoded_type]))
+
+    major, minor = format_version
+    writer.write_uint(major, 2)
+    writer.write_uint(minor, 2)
+
+    writer.write_uint(section_count)
+    writer.write_uint(section_alignment, 4)
+    writer.write_uint(code_alignment, 4)
+    assert writer.tell() - start == HEADER_SIZE
+
+
+def write_sections(
+    writer,
+    sections,
+    type='exec',
+    format_version=pykebc.ByteCompiler.FORMAT_VERSION,
+    section_alignment=1,
+    code_alignment=1,
+    codec=None,
+):
+    """Stream a PEX image made of the given sections
+
+    `sections` is a list of (name, flags, write_data), where `write_data(writer)` writes the
+    section contents. The directory is written as a placeholder and filled in afterwards.
+    Every section starts at a multiple of `section_alignment` from the beginning of the image;
+    `code_alignment` is only recorded in the header, the code objects are padded by ByteCompiler.
+
+    With a `codec` (see compression.py) every section is compressed. The contents are then
+    written to a separate buffer first, so the code alignment of compressed sections is relative
+    to the beginning of the section
+    """
+    start = writer.tell()
+    assert start == writer.origin
+    write_header(writer, type, len(sections), format_version, section_alignment, code_alignment)
+    directory = writer.tell()
+    writer.write(bytes(DIRECTORY_ENTRY_SIZE * len(sections)))
+
+    for i, (name, flags, write_data) in enumerate(sections):
+        assert len(name) == 4
+        writer.align(section_alignment)
+        offset = writer.tell()
+        if codec is None:
+            write_data(writer)
+        else:
+            section_writer = pex_writer.Writer()
+            write_data(section_writer)
+            writer.write_uint(len(section_writer.output))
+            writer.write(codec.compress(section_writer.output))
+            flags |= codec.id << SECTION_CODEC_SHIFT
+        size = writer.tell() - offset
+        entry = (
+            name
+            + flags.to_bytes(4, 'big')
+            + (offset - start).to_bytes(8, 'big')
+            + size.to_bytes(8, 'big')
+        )
+        writer.patch(directory + i * DIRECTORY_ENTRY_SIZE, entry)
+
+
+def write_exports(writer, exports, byte_compiler):
+    byte_compiler.write_count(writer, len(exports))
+    for name, kind in exports:
+        encoded_name = name.encode('utf-8')
+        byte_compiler.write_count(writer, len(encoded_name))
+        writer.write(encoded_name)
+        writer.write(bytes([EXPORT_KINDS.index(kind)]))
+
+
+def write(writer, code, byte_compiler, exports=(), type='exec', section_alignment=1, codec=None):
+    """Stream a PEX image with LinkedCode compiled straight into its code section
+
+    If `byte_compiler` has a constant pool, the pool is filled while the code is written
+    and is stored in the `pool` section after it. Likewise its line table is stored in the
+    `line` debug section at the end
+    """
+    def write_code(writer):
+        if byte_compiler.line_table is not None:
+            byte_compiler.line_table.origin = writer.tell()
+        byte_compiler.write(code, writer)
+
+    sections = [(b'code', 0, write_code)]
+    if byte_compiler.pool is not None:
+        sections.append((b'pool', 0, lambda writer: byte_compiler.pool.write(writer, byte_compiler)))
+    sections.append((b'syms', 0, lambda writer: write_exports(writer, exports, byte_compiler)))
+    if byte_compiler.line_table is not None:
+        sections.append((b'line', SECTION_FLAG_DEBUG, lambda writer: byte_compiler.line_table.write(writer)))
+    write_sections(
+        writer,
+        sections,
+        type=type,
+        format_version=byte_compiler.FORMAT_VERSION,
+        section_alignment=section_alignment,
+        code_alignment=byte_compiler.code_alignment,
+        codec=codec,
+    )
+
+
+def build(bytecode, type='exec', codec=None):
+    writer = pex_writer.Writer()
+    write_sections(writer, [(b'code', 0, lambda writer: writer.write(bytecode))], type=type, codec=codec)
+    return writer.output
@@ -0,0 +1,100 @@
+import ast
+import functools
+import hashlib
+import os
+import sys
+import tempfile
+
+
+DEFAULT_MAX_SIZE = 256 * 2**20
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_fingerprint():
+    """Digest of the compiler's own source code, so any change to the compiler invalidates the cache"""
+    digest = hashlib.sha256(sys.version.encode('utf-8'))
+    package_directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_directory)):
+        if name.endswith('.py'):
+            with open(os.path.join(package_directory, name), 'rb') as f:
+                digest.update(name.encode('utf-8') + b'\0' + f.read())
+    return digest.hexdigest()
+
+
+class CompileCache(object):
+    """On-disk cache of compiled PEX images and code objects
+
+    Entries are keyed by a hash of the compiler fingerprint, the compile options and the
+    source (the whole module text for images, the AST of a function or class for code objects).
+    The least recently used entries are evicted by `trim()` once the total size exceeds `max_size`
+    """
+
+    def __init__(self, directory, options='', max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.prefix = (compiler_fingerprint() + '\0' + options + '\0').encode('utf-8')
+
+    def key(self, kind, source):
+        digest = hashlib.sha256(self.prefix)
+        digest.update(kind.encode('utf-8') + b'\0')
+        digest.update(source.encode('utf-8'))
+        return digest.hexdigest()
+
+    def module_key(self, source):
+        return self.key('module', source)
+
+    def code_key(self, tree):
+        return self.key('code', ast.dump(tree))
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return blob
+
+    def put(self, key, blob):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        fd, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(blob)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.unlink(temporary_path)
+            raise
+
+    def entries(self):
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, entry.path
+
+    def trim(self):
+        """Evict the least recently used entries until the cache fits into `max_size`"""
+        if not os.path.isdir(self.directory):
+            return
+        entries = sorted(self.entries())
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
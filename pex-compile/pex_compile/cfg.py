@@ -0,0 +1,460 @@
+from array import array
+
+
+# Commands whose argument contains an instruction address. The address is either the whole
+# argument or the last element of the argument tuple
+JUMP_COMMANDS = {
+    'cjump',
+    'except',
+    'except_all',
+    'finally',
+    'for_iter',
+    'jump',
+    'try',
+}
+
+# Commands after which execution never continues with the next instruction
+TERMINATOR_COMMANDS = {
+    'end_finally',
+    'jump',
+    'raise',
+    'return',
+}
+
+
+def get_address(argument):
+    if isinstance(argument, tuple):
+        return argument[-1]
+    else:
+        return argument
+
+
+def set_address(argument, address):
+    if isinstance(argument, tuple):
+        return argument[:-1] + (address,)
+    else:
+        return address
+
+
+def remove_instructions(instructions, removed):
+    """Remove instructions with the given indices and fix all addresses
+
+    An address pointing to a removed instruction is redirected to the next instruction that is kept
+    """
+    new_addresses = []
+    address = 0
+    for i in range(len(instructions)):
+        new_addresses.append(address)
+        if i not in removed:
+            address += 1
+    new_addresses.append(address)
+
+    result = []
+    for i, (command, argument) in enumerate(instructions):
+        if i in removed:
+            continue
+        if command in JUMP_COMMANDS:
+            argument = set_address(argument, new_addresses[get_address(argument)])
+        result.append((command, argument))
+    return tuple(result)
+
+
+def remove_lines(lines, removed):
+    """Remove the line numbers of the instructions removed by remove_instructions
+
+    An array of lines stays an array, other sequences become tuples
+    """
+    if lines is None:
+        return None
+    kept = (line for i, line in enumerate(lines) if i not in removed)
+    if isinstance(lines, array):
+        return array(lines.typecode, kept)
+    return tuple(kept)
+
+
+def falls_through(command, argument):
+    """Whether execution can continue with the next instruction after the given one"""
+    if command in TERMINATOR_COMMANDS:
+        # `end_finally` either re-raises the exception or returns to the instruction following
+        # the `finally` that entered the block, which is a successor of that `finally`
+        return False
+    if command == 'finally':
+        # With an exception being handled `end_finally` re-raises it, so execution never
+        # comes back here
+        is_handling_exception, address = argument
+        return not is_handling_exception
+    return True
+
+
+def get_successors(address, command, argument):
+    """Addresses of the instructions which can be executed right after the given one"""
+    successors = []
+    if falls_through(command, argument):
+        successors.append(address + 1)
+    if command in JUMP_COMMANDS:
+        successors.append(get_address(argument))
+    return tuple(successors)
+
+
+def stack_effect(command, argument, jump=False):
+    """Change of the value stack depth caused by an instruction
+
+    `jump` selects the effect along the edge to the instruction's address (for commands in
+    JUMP_COMMANDS) instead of the fall-through edge.
+
+    When an exception is raised inside a `try` block, the runtime unwinds the value stack to the
+    depth it had at the `try` instruction and pushes the exception, so the handler edge of `try`
+    is +1. `finally (True, ...)` takes the exception off the stack and keeps it until
+    `end_finally`, so a finally block is entered with the same depth from both paths.
+
+    `init_function` is not covered here: it consumes everything the prologue has pushed
+    """
+    if command == 'attribute':
+        action, name_id = argument
+        return {'get': 0, 'set': -2, 'del': -1}[action]
+    elif command == 'index':
+        return {'get': -1, 'set': -3, 'del': -2}[argument]
+    elif command == 'name':
+        action, name_id = argument
+        return {'load': 1, 'load_global': 1, 'store': -1, 'del': 0}[action]
+    elif command == 'make_struct':
+        struct, elements_count = argument
+        if struct == 'dict':
+            return 1 - 2 * elements_count
+        return 1 - elements_count
+    elif command == 'stack':
+        return {'pop': -1, 'dup': 1, 'dupdown3': 1, 'swap2': 0}[argument]
+    elif command == 'unpack':
+        # `**mapping` occupies one stack slot, but `make_struct dict` counts every entry as
+        # a key/value pair. Counting the unpacked mapping as two slots keeps the depth an upper bound
+        return 1 if argument == 'dict' else 0
+    elif command == 'eager_unpack_list':
+        return argument - 1
+    elif command in ('call_function', 'make_class'):
+        return -argument
+    elif command == 'cjump':
+        jump_if, pop_value, address = argument
+        return -1 if pop_value else 0
+    elif command == 'finally':
+        is_handling_exception, address = argument
+        return -1 if is_handling_exception else 0
+    elif command == 'try':
+        return 1 if jump else 0
+    elif command == 'for_iter':
+        # Pushes the next element, or pops the exhausted iterator and jumps
+        return -1 if jump else 1
+    else:
+        return STACK_EFFECTS[command]
+
+
+STACK_EFFECTS = {
+    'nop':              0,
+    'del_fast':         0,
+    'get_exception':    1,
+    'load_const':       1,
+    'load_fast':        1,
+    'store_fast':       -1,
+    'binop':            -1,
+    'pseudo_call':      0,
+    'unop':             0,
+    'end_finally':      0,
+    'end_try':          0,
+    'except':           -1,
+    'except_all':       0,
+    'jump':             0,
+    'raise':            -1,
+    'return':           -1,
+    'binop_const':      0,
+    'binop_fast':       1,
+    'load_attr_fast':   1,
+    'load_attr_name':   1,
+}
+
+
+class BasicBlock(object):
+    """A maximal straight-line run of instructions
+
+    Inside `instructions`, addresses are replaced with the target BasicBlock objects (or None for
+    the address just past the end of the code), so blocks can be removed without renumbering.
+    `lines` holds the source line of every instruction
+    """
+    __slots__ = [
+        'start',
+        'instructions',
+        'lines',
+        'successors',
+        'predecessors',
+        'stack_depth',
+        'max_stack_depth',
+    ]
+
+    def __init__(self, start):
+        self.start = start
+        self.instructions = []
+        self.lines = []
+        self.successors = []
+        self.predecessors = []
+        self.stack_depth = None
+        self.max_stack_depth = None
+
+    def __repr__(self):
+        return f'BasicBlock(start={self.start}, size={len(self.instructions)})'
+
+
+class ControlFlowGraph(object):
+    __slots__ = ['blocks']
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    @classmethod
+    def build(cls, instructions, lines=None):
+        count = len(instructions)
+        if lines is None:
+            lines = (None,) * count
+
+        # Find the first instruction of every block
+        is_leader = bytearray(count + 1)
+        is_leader[0] = 1
+        for address, (command, argument) in enumerate(instructions):
+            if command in JUMP_COMMANDS:
+                is_leader[get_address(argument)] = 1
+                is_leader[address + 1] = 1
+            elif command in TERMINATOR_COMMANDS:
+                is_leader[address + 1] = 1
+
+        blocks = []
+        block_at = {}
+        for address in range(count):
+            if is_leader[address]:
+                block_at[address] = BasicBlock(address)
+                blocks.append(block_at[address])
+
+        for block, next_block in zip(blocks, blocks[1:] + [None]):
+            end = count if next_block is None else next_block.start
+            for address in range(block.start, end):
+                command, argument = instructions[address]
+                if command in JUMP_COMMANDS:
+                    argument = set_address(argument, block_at.get(get_address(argument)))
+                block.instructions.append((command, argument))
+                block.lines.append(lines[address])
+            command, argument = instructions[end - 1]
+            for successor in get_successors(end - 1, command, argument):
+                if successor in block_at and block_at[successor] not in block.successors:
+                    block.successors.append(block_at[successor])
+            for successor in block.successors:
+                successor.predecessors.append(block)
+
+        return cls(blocks)
+
+    @classmethod
+    def from_linked_code(cls, code):
+        # Decoded once: build() reads every instruction more than once
+        return cls.build(tuple(code.instructions), code.lines)
+
+    def reachable_blocks(self):
+        if not self.blocks:
+            return set()
+        reachable = {self.blocks[0]}
+        pending = [self.blocks[0]]
+        while pending:
+            block = pending.pop()
+            for successor in block.successors:
+                if successor not in reachable:
+                    reachable.add(successor)
+                    pending.append(successor)
+        return reachable
+
+    def remove_unreachable(self):
+        reachable = self.reachable_blocks()
+        for block in self.blocks:
+            block.predecessors = [p for p in block.predecessors if p in reachable]
+        self.blocks = [block for block in self.blocks if block in reachable]
+        return self
+
+    def to_instructions(self):
+        """Serialize the graph back into a linked instruction list"""
+        addresses = {}
+        address = 0
+        for block in self.blocks:
+            addresses[block] = address
+            address += len(block.instructions)
+        addresses[None] = address
+
+        instructions = []
+        for block in self.blocks:
+            for command, argument in block.instructions:
+                if command in JUMP_COMMANDS:
+                    argument = set_address(argument, addresses[get_address(argument)])
+                instructions.append((command, argument))
+        return tuple(instructions)
+
+    def to_lines(self):
+        """Source lines of the instructions returned by `to_instructions`"""
+        return tuple(line for block in self.blocks for line in block.lines)
+
+    def compute_stack_depths(self):
+        """Compute the stack depth at the start of every reachable block and the maximal depth inside it"""
+        for block in self.blocks:
+            block.stack_depth = None
+            block.max_stack_depth = None
+        if not self.blocks:
+            return
+
+        # A block is revisited only when its entry depth grows, so on correct code every block is
+        # visited a few times at most. Endless growth means that a loop leaves values on the stack
+        visits = dict.fromkeys(self.blocks, 0)
+        next_blocks = dict(zip(self.blocks, self.blocks[1:] + [None]))
+        self.blocks[0].stack_depth = 0
+        pending = [self.blocks[0]]
+        while pending:
+            block = pending.pop()
+            visits[block] += 1
+            if visits[block] > len(self.blocks) + 1:
+                raise Exception(f'Unbounded stack growth in {block}')
+
+            depth = block.stack_depth
+            max_depth = depth
+            for command, argument in block.instructions:
+                if command == 'init_function':
+                    depth = 0
+                    continue
+                if command in JUMP_COMMANDS:
+                    target = get_address(argument)
+                    if target is not None:
+                        self.propagate_depth(target, depth + stack_effect(command, argument, jump=True), pending)
+                depth += stack_effect(command, argument)
+                max_depth = max(max_depth, depth)
+                if depth < 0:
+                    raise Exception(f'Stack underflow in {block}')
+            block.max_stack_depth = max(max_depth, block.max_stack_depth or 0)
+
+            command, argument = block.instructions[-1]
+            if falls_through(command, argument):
+                # The jump edge has been handled above; only the fall-through edge is left
+                next_block = next_blocks[block]
+                if next_block is not None:
+                    self.propagate_depth(next_block, depth, pending)
+
+    @staticmethod
+    def propagate_depth(block, depth, pending):
+        if block.stack_depth is None or block.stack_depth < depth:
+            block.stack_depth = depth
+            pending.append(block)
+
+    def max_stack_depth(self):
+        self.compute_stack_depths()
+        return max(
+            (block.max_stack_depth for block in self.blocks if block.max_stack_depth is not None),
+            default=0,
+        )
+
+
+# The analyses below run on an InstructionBuffer (pex_compile.pykebc) without decoding it into
+# a list of instructions: blocks are ranges of addresses and the instructions are read from the
+# opcode and argument arrays through the buffer's per-opcode tables. Only the arguments which
+# the analyses need are decoded, one instruction at a time
+
+
+def find_block_starts(buffer):
+    """Addresses of the first instructions of the basic blocks of an InstructionBuffer, followed
+    by the address just past its end"""
+    count = len(buffer)
+    is_leader = bytearray(count + 1)
+    is_leader[0] = 1
+    is_leader[count] = 1
+    address_shifts = buffer.OPCODE_ADDRESS_SHIFTS
+    terminators = buffer.OPCODE_TERMINATORS
+    arguments = buffer.arguments
+    for address, opcode in enumerate(buffer.opcodes):
+        shift = address_shifts[opcode]
+        if shift is not None:
+            is_leader[arguments[address] >> shift] = 1
+            is_leader[address + 1] = 1
+        elif terminators[opcode]:
+            is_leader[address + 1] = 1
+    return [address for address in range(count + 1) if is_leader[address]]
+
+
+def get_block_ends(buffer):
+    """Map of the start of every basic block of an InstructionBuffer to the address past its end"""
+    starts = find_block_starts(buffer)
+    return dict(zip(starts, starts[1:]))
+
+
+def find_unreachable(buffer):
+    """Addresses of the instructions of an InstructionBuffer which can't be reached from the first one"""
+    block_ends = get_block_ends(buffer)
+    if not block_ends:
+        return set()
+    reachable = {0}
+    pending = [0]
+    while pending:
+        last = block_ends[pending.pop()] - 1
+        for successor in get_successors(last, *buffer[last]):
+            if successor in block_ends and successor not in reachable:
+                reachable.add(successor)
+                pending.append(successor)
+    return {
+        address
+        for start, end in block_ends.items()
+        if start not in reachable
+        for address in range(start, end)
+    }
+
+
+def max_stack_depth(buffer):
+    """Maximal value stack depth reachable in an InstructionBuffer, like ControlFlowGraph.max_stack_depth"""
+    block_ends = get_block_ends(buffer)
+    if not block_ends:
+        return 0
+    opcodes = buffer.opcodes
+    arguments = buffer.arguments
+    address_shifts = buffer.OPCODE_ADDRESS_SHIFTS
+    fixed_effects = buffer.OPCODE_STACK_EFFECTS
+
+    # Same worklist as in ControlFlowGraph.compute_stack_depths, over block start addresses
+    entry_depths = {0: 0}
+    visits = dict.fromkeys(block_ends, 0)
+    pending = [0]
+    max_depth = 0
+
+    def propagate(start, depth):
+        if start in block_ends and entry_depths.get(start, -1) < depth:
+            entry_depths[start] = depth
+            pending.append(start)
+
+    while pending:
+        start = pending.pop()
+        visits[start] += 1
+        if visits[start] > len(block_ends) + 1:
+            raise Exception(f'Unbounded stack growth in the block at {start}')
+
+        depth = entry_depths[start]
+        max_depth = max(max_depth, depth)
+        end = block_ends[start]
+        for address in range(start, end):
+            opcode = opcodes[address]
+            effect = fixed_effects[opcode]
+            if effect is None:
+                command, argument = buffer[address]
+                if command == 'init_function':
+                    depth = 0
+                    continue
+                if address_shifts[opcode] is not None:
+                    propagate(buffer.get_address(address), depth + stack_effect(command, argument, jump=True))
+                effect = stack_effect(command, argument)
+            elif address_shifts[opcode] is not None:
+                # A fixed effect is the same along the jump edge
+                propagate(arguments[address] >> address_shifts[opcode], depth + effect)
+            depth += effect
+            if depth > max_depth:
+                max_depth = depth
+            elif depth < 0:
+                raise Exception(f'Stack underflow in the block at {start}')
+
+        # The jump edge has been handled above; only the fall-through edge is left
+        if falls_through(*buffer[end - 1]):
+            propagate(end, depth)
+
+    return max_depth
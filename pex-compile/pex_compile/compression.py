@@ -0,0 +1,47 @@
+import zlib
+
+
+class ZlibCodec(object):
+    id = 1
+    name = 'zlib'
+
+    def __init__(self, level=9):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+CODECS = {}
+
+
+def register_codec(codec):
+    """Make a section compression codec available by its name
+
+    A codec is any object with `id`, `name`, `compress()` and `decompress()`. `id` is stored
+    in the section directory flags and must be known to the loader. `compress()` returns the
+    compressed form of the whole section contents, `decompress()` restores them (e.g. for
+    the disassembler)
+    """
+    assert 0 < codec.id < 2**8
+    CODECS[codec.name] = codec
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f'Unknown compression codec: {name}')
+
+
+def get_codec_by_id(codec_id):
+    for codec in CODECS.values():
+        if codec.id == codec_id:
+            return codec
+    raise ValueError(f'Unknown compression codec id: {codec_id}')
+
+
+register_codec(ZlibCodec())
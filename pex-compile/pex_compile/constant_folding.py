@@ -0,0 +1,242 @@
+import ast
+import math
+import operator
+
+
+# Limits on the size of folded values. Folding `2 ** 100000` or `'x' * 10**9` would make the
+# compiled file huge (or the compiler hang), so such expressions are left for the runtime
+MAX_INT_BITS = 128
+MAX_SEQUENCE_LENGTH = 4096
+
+
+BINARY_OPERATORS = {
+    ast.Add:        operator.add,
+    ast.Sub:        operator.sub,
+    ast.Mult:       operator.mul,
+    ast.Div:        operator.truediv,
+    ast.FloorDiv:   operator.floordiv,
+    ast.Mod:        operator.mod,
+    ast.Pow:        operator.pow,
+    ast.LShift:     operator.lshift,
+    ast.RShift:     operator.rshift,
+    ast.BitOr:      operator.or_,
+    ast.BitXor:     operator.xor,
+    ast.BitAnd:     operator.and_,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd:       operator.pos,
+    ast.USub:       operator.neg,
+    ast.Not:        operator.not_,
+    ast.Invert:     operator.invert,
+}
+
+# `is` and `is not` are not folded: their result depends on object identity at runtime
+COMPARISON_OPERATORS = {
+    ast.Eq:         operator.eq,
+    ast.NotEq:      operator.ne,
+    ast.Lt:         operator.lt,
+    ast.LtE:        operator.le,
+    ast.Gt:         operator.gt,
+    ast.GtE:        operator.ge,
+    ast.In:         lambda a, b: a in b,
+    ast.NotIn:      lambda a, b: a not in b,
+}
+
+
+def is_constant(tree):
+    return isinstance(tree, (ast.Num, ast.Str, ast.Bytes, ast.NameConstant))
+
+
+def get_constant(tree):
+    if isinstance(tree, ast.Num):
+        return tree.n
+    elif isinstance(tree, (ast.Str, ast.Bytes)):
+        return tree.s
+    else:
+        return tree.value
+
+
+def make_constant(value, location):
+    if value is None or isinstance(value, bool):
+        tree = ast.NameConstant(value=value)
+    elif isinstance(value, (int, float, complex)):
+        tree = ast.Num(n=value)
+    elif isinstance(value, str):
+        tree = ast.Str(s=value)
+    elif isinstance(value, bytes):
+        tree = ast.Bytes(s=value)
+    else:
+        raise TypeError(f'Invalid constant type: {type(value)}')
+    return ast.copy_location(tree, location)
+
+
+def is_constant_type(value):
+    return value is None or isinstance(value, (bool, int, float, complex, str, bytes))
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_sequence(value):
+    return isinstance(value, (str, bytes))
+
+
+def is_small_enough(op, left, right):
+    if op is ast.Pow and is_int(left) and is_int(right) and right > 0:
+        return left.bit_length() * right <= MAX_INT_BITS
+    if op is ast.LShift and is_int(left) and is_int(right) and right > 0:
+        return left.bit_length() + right <= MAX_INT_BITS
+    if op is ast.Mult:
+        if is_int(left) and is_int(right):
+            return left.bit_length() + right.bit_length() <= MAX_INT_BITS
+        if is_sequence(left) and is_int(right):
+            return len(left) * right <= MAX_SEQUENCE_LENGTH
+        if is_int(left) and is_sequence(right):
+            return left * len(right) <= MAX_SEQUENCE_LENGTH
+    if op is ast.Add and is_sequence(left) and is_sequence(right):
+        return len(left) + len(right) <= MAX_SEQUENCE_LENGTH
+    if op is ast.Mod and is_sequence(left):
+        # This is string formatting, not an arithmetic operation
+        return False
+    return True
+
+
+def has_negative_zero(value):
+    # Constants are deduplicated by value, and -0.0 == 0.0, so a folded -0.0 could be
+    # merged with 0.0. Such results are left for the runtime
+    if isinstance(value, float):
+        return value == 0 and math.copysign(1, value) < 0
+    if isinstance(value, complex):
+        return has_negative_zero(value.real) or has_negative_zero(value.imag)
+    return False
+
+
+def evaluate(function, *args):
+    """Evaluate a folded operation. Returns (success, value)"""
+    try:
+        value = function(*args)
+    except Exception:
+        # E.g. division by zero. Raising the exception is the runtime's job
+        return False, None
+    if not is_constant_type(value) or has_negative_zero(value):
+        return False, None
+    return True, value
+
+
+class ConstantFolder(object):
+    """Bottom-up AST transformer: `visit_<NodeType>` methods see nodes whose children are already
+    folded and return the replacement like in ast.NodeTransformer (a node, a list of nodes or None)
+
+    The tree is walked with an explicit stack instead of recursion, so deeply nested expressions
+    (e.g. machine-generated `a + b + c + ...` chains) don't exhaust Python's stack
+    """
+
+    def visit(self, tree):
+        # In reversed pre-order every node comes after all of its descendants
+        order = []
+        pending = [tree]
+        while pending:
+            node = pending.pop()
+            order.append(node)
+            pending.extend(ast.iter_child_nodes(node))
+
+        results = {}
+        for node in reversed(order):
+            self.replace_children(node, results)
+            visitor = getattr(self, 'visit_' + type(node).__name__, None)
+            results[node] = node if visitor is None else visitor(node)
+        return results[tree]
+
+    @staticmethod
+    def replace_children(node, results):
+        # Same rules as ast.NodeTransformer.generic_visit
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST):
+                        value = results[value]
+                        if value is None:
+                            continue
+                        elif not isinstance(value, ast.AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST):
+                new_node = results[old_value]
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+
+    def visit_BinOp(self, tree):
+        op = type(tree.op)
+        if not (is_constant(tree.left) and is_constant(tree.right) and op in BINARY_OPERATORS):
+            return tree
+        left = get_constant(tree.left)
+        right = get_constant(tree.right)
+        if not is_small_enough(op, left, right):
+            return tree
+        success, value = evaluate(BINARY_OPERATORS[op], left, right)
+        return make_constant(value, tree) if success else tree
+
+    def visit_UnaryOp(self, tree):
+        if not is_constant(tree.operand):
+            return tree
+        success, value = evaluate(UNARY_OPERATORS[type(tree.op)], get_constant(tree.operand))
+        return make_constant(value, tree) if success else tree
+
+    def visit_BoolOp(self, tree):
+        stops_on = isinstance(tree.op, ast.Or)
+        values = list(tree.values)
+        # Leading constants either decide the result or don't affect it at all
+        while len(values) > 1 and is_constant(values[0]):
+            if bool(get_constant(values[0])) == stops_on:
+                return values[0]
+            values.pop(0)
+        if len(values) == 1:
+            return values[0]
+        tree.values = values
+        return tree
+
+    def visit_Compare(self, tree):
+        operands = [tree.left, *tree.comparators]
+        if not all(is_constant(operand) for operand in operands):
+            return tree
+        if not all(type(op) in COMPARISON_OPERATORS for op in tree.ops):
+            return tree
+        for op, left, right in zip(tree.ops, operands, operands[1:]):
+            success, value = evaluate(COMPARISON_OPERATORS[type(op)], get_constant(left), get_constant(right))
+            if not success:
+                return tree
+            if not value:
+                break
+        return make_constant(value, tree)
+
+    def visit_If(self, tree):
+        if not is_constant(tree.test):
+            return tree
+        return tree.body if get_constant(tree.test) else tree.orelse
+
+    def visit_IfExp(self, tree):
+        if not is_constant(tree.test):
+            return tree
+        return tree.body if get_constant(tree.test) else tree.orelse
+
+    def visit_While(self, tree):
+        if is_constant(tree.test) and not get_constant(tree.test):
+            # The body is never executed, but the else branch is
+            return tree.orelse
+        return tree
+
+
+def is_true_constant(tree):
+    return is_constant(tree) and bool(get_constant(tree))
+
+
+def fold(tree):
+    """Evaluate operations on constant operands and drop branches with constant conditions"""
+    return ConstantFolder().visit(tree)
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+from pex_compile import build_pex
+from pex_compile import compression
+from pex_compile import pykebc
+from pex_compile.reader import Reader
+
+import struct
+import sys
+from argparse import ArgumentParser
+from array import array
+
+
+def write_listing(code, file, depth=0):
+    """Write the listing of LinkedCode to a file, line by line
+
+    Nested code objects are listed in place of their constants, indented one level deeper.
+    The closing brace is not followed by a newline
+    """
+    prefix = '    ' * (depth + 1)
+    file.write('{\n')
+    for command, argument in code.instructions:
+        if argument is None:
+            file.write(f'{prefix}{command}\n')
+        else:
+            file.write(f'{prefix}{command} {argument}\n')
+    if code.constants or code.local_names:
+        file.write(prefix + '\n')
+    for i, value in enumerate(code.constants):
+        file.write(f'{prefix}const {i} = ')
+        if isinstance(value, pykebc.LinkedCode):
+            write_listing(value, file, depth + 1)
+        else:
+            file.write(repr(value))
+        file.write('\n')
+    for i, name in enumerate(code.local_names):
+        file.write(f'{prefix}local {i} = {name}\n')
+    file.write('    ' * depth + '}')
+
+
+class Section(object):
+    __slots__ = ['name', 'flags', 'offset', 'size', 'data']
+
+    def __init__(self, name, flags, offset, size, data):
+        self.name = name
+        self.flags = flags
+        self.offset = offset
+        self.size = size
+        # Decompressed contents
+        self.data = data
+
+
+class Image(object):
+    """A PEX image read back by `read_image()`"""
+
+    def __init__(self, type, format_version, section_alignment, code_alignment, sections):
+        self.type = type
+        self.format_version = format_version
+        self.section_alignment = section_alignment
+        self.code_alignment = code_alignment
+        self.sections = sections
+
+    def get_section(self, name):
+        for section in self.sections:
+            if section.name == name:
+                return section
+        return None
+
+
+def read_image(data):
+    reader = Reader(data)
+    if reader.read(3) != b'PEX':
+        raise ValueError('Not a PEX image')
+    type = ['other', 'exec', 'lib'][reader.read_uint(1)]
+    format_version = reader.read_uint(2), reader.read_uint(2)
+    section_count = reader.read_uint()
+    section_alignment = reader.read_uint(4)
+    code_alignment = reader.read_uint(4)
+    assert reader.tell() == build_pex.HEADER_SIZE
+
+    sections = []
+    for _ in range(section_count):
+        name = reader.read(4)
+        flags = reader.read_uint(4)
+        offset = reader.read_uint()
+        size = reader.read_uint()
+        if offset + size > len(data):
+            raise EOFError(f'Section {name} ends past the end of the image')
+        section_data = data[offset:offset + size]
+        codec_id = (flags & build_pex.SECTION_CODEC_MASK) >> build_pex.SECTION_CODEC_SHIFT
+        if codec_id != 0:
+            section_reader = Reader(section_data)
+            uncompressed_size = section_reader.read_uint()
+            codec = compression.get_codec_by_id(codec_id)
+            section_data = codec.decompress(section_data[section_reader.tell():])
+            if len(section_data) != uncompressed_size:
+                raise ValueError(f'Section {name} decompresses to a wrong size')
+        sections.append(Section(name, flags, offset, size, section_data))
+    return Image(type, format_version, section_alignment, code_alignment, sections)
+
+
+class ByteDecoder(object):
+    """Reader of the format 0.2 code objects back into LinkedCode, the inverse of ByteCompiler
+
+    Local names are not stored in images, so the LinkedCode has only the local count. Constant pool references
+    are resolved with `pool`
+    """
+
+    FORMAT_VERSION = (0, 2)
+
+    def __init__(self, pool=()):
+        self.pool = pool
+
+    @staticmethod
+    def read_count(reader):
+        return reader.read_uint()
+
+    @staticmethod
+    def read_length(reader):
+        return reader.read_uint()
+
+    @staticmethod
+    def read_padding(reader):
+        reader.skip(reader.read_uint(4))
+
+    @staticmethod
+    def read_instructions(reader, unit_count):
+        words = array('I', reader.read(4 * unit_count))
+        if sys.byteorder == 'little':
+            words.byteswap()
+        return pykebc.InstructionBuffer(
+            array('B', [word >> 24 for word in words]),
+            array('I', [word & 0xFFFFFF for word in words]),
+        )
+
+    def read_code(self, reader):
+        type = ['module', 'function', 'class'][reader.read_uint(1)]
+        local_count = self.read_count(reader)
+        self.read_count(reader)     # Maximal stack depth
+        unit_count = self.read_count(reader)
+        self.read_padding(reader)
+        instructions = self.read_instructions(reader, unit_count)
+        for opcode in instructions.opcodes:
+            if opcode >= len(pykebc.ByteCompiler.COMMANDS):
+                raise ValueError(f'Invalid opcode: {opcode}')
+        constants = [self.read_const(reader) for _ in range(self.read_count(reader))]
+        return pykebc.LinkedCode(
+            type=type,
+            instructions=instructions,
+            constants=constants,
+            local_count=local_count,
+        )
+
+    def read_const(self, reader):
+        tag = reader.read(1)
+        if tag == b'#':
+            code_reader = Reader(reader.read(self.read_length(reader)))
+            return self.read_code(code_reader)
+        elif tag == b'p':
+            return self.pool[self.read_pool_reference(reader)]
+        elif tag == b'i':
+            return self.read_int(reader)
+        elif tag == b'f':
+            return struct.unpack('d', reader.read(8))[0]
+        elif tag == b'c':
+            real, imag = struct.unpack('dd', reader.read(16))
+            return complex(real, imag)
+        elif tag == b'0':
+            return True
+        elif tag == b'1':
+            return False
+        elif tag == b'n':
+            return None
+        elif tag == b'b':
+            # The image may be a bytearray, e.g. straight from the compiler
+            return bytes(reader.read(self.read_length(reader)))
+        elif tag == b'u':
+            return reader.read(self.read_length(reader)).decode('utf-8')
+        else:
+            raise ValueError(f'Invalid constant tag: {tag}')
+
+    @staticmethod
+    def read_pool_reference(reader):
+        return reader.read_uint(4)
+
+    @staticmethod
+    def read_int(reader):
+        return reader.read_int(reader.read_uint())
+
+
+class CompactByteDecoder(ByteDecoder):
+    """Reader of the compact format 0.3 code objects, the inverse of CompactByteCompiler"""
+
+    FORMAT_VERSION = (0, 3)
+
+    @staticmethod
+    def read_count(reader):
+        return reader.read_uvarint()
+
+    @staticmethod
+    def read_length(reader):
+        return reader.read_uvarint()
+
+    @staticmethod
+    def read_padding(reader):
+        reader.skip(reader.read_uvarint())
+
+    @staticmethod
+    def read_instructions(reader, unit_count):
+        # Fold the `extended_arg` prefixes into the arguments, then turn the jump addresses from
+        # unit offsets back into instruction indices
+        units = reader.read(2 * unit_count)
+        opcodes = array('B')
+        arguments = array('I')
+        indices = {}
+        argument_repr = 0
+        start = 0
+        for unit in range(unit_count):
+            opcode, byte = units[2 * unit], units[2 * unit + 1]
+            argument_repr = (argument_repr << 8) | byte
+            if opcode == pykebc.CompactByteCompiler.EXTENDED_ARG_OPCODE:
+                continue
+            indices[start] = len(opcodes)
+            opcodes.append(opcode)
+            arguments.append(argument_repr)
+            argument_repr = 0
+            start = unit + 1
+        indices[unit_count] = len(opcodes)
+
+        instructions = pykebc.InstructionBuffer(opcodes, arguments)
+        address_shifts = pykebc.InstructionBuffer.OPCODE_ADDRESS_SHIFTS
+        for i, opcode in enumerate(opcodes):
+            if opcode < len(address_shifts) and address_shifts[opcode] is not None:
+                instructions.set_address(i, indices[instructions.get_address(i)])
+        return instructions
+
+    @staticmethod
+    def read_pool_reference(reader):
+        return reader.read_uvarint()
+
+    @staticmethod
+    def read_int(reader):
+        return reader.read_svarint()
+
+
+DECODERS = {decoder.FORMAT_VERSION: decoder for decoder in [ByteDecoder, CompactByteDecoder]}
+
+
+def read_exports(reader, decoder):
+    exports = []
+    for _ in range(decoder.read_count(reader)):
+        name = reader.read(decoder.read_count(reader)).decode('utf-8')
+        exports.append((name, build_pex.EXPORT_KINDS[reader.read_uint(1)]))
+    return exports
+
+
+def disassemble(data, file):
+    """Write the header, sections, code listing and exports of a PEX image to a file"""
+    image = read_image(data)
+    major, minor = image.format_version
+    file.write(
+        f'; PEX {image.type} image, format {major}.{minor}, '
+        f'section alignment {image.section_alignment}, code alignment {image.code_alignment}\n'
+    )
+    for section in image.sections:
+        file.write(
+            f'; section {section.name.decode("ascii", "replace")}: '
+            f'offset {section.offset}, size {section.size}, flags {section.flags:#x}\n'
+        )
+
+    decoder_type = DECODERS.get(image.format_version)
+    if decoder_type is None:
+        raise ValueError(f'Unsupported format version: {major}.{minor}')
+    decoder = decoder_type()
+    pool_section = image.get_section(b'pool')
+    if pool_section is not None:
+        reader = Reader(pool_section.data)
+        decoder.pool = [decoder.read_const(reader) for _ in range(decoder.read_count(reader))]
+
+    code_section = image.get_section(b'code')
+    if code_section is not None:
+        write_listing(decoder.read_code(Reader(code_section.data)), file)
+        file.write('\n')
+
+    syms_section = image.get_section(b'syms')
+    if syms_section is not None:
+        for name, kind in read_exports(Reader(syms_section.data), decoder):
+            file.write(f'; export {kind} {name}\n')
+
+
+def parse_args():
+    ap = ArgumentParser(description='Print the listing of a PEX image')
+    ap.add_argument('--output', '-o', help='Listing file name (standard output if not specified)')
+    ap.add_argument('image', help='PEX file name')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    with open(options.image, 'rb') as f:
+        data = f.read()
+    if options.output is None:
+        disassemble(data, sys.stdout)
+    else:
+        with open(options.output, 'w') as f:
+            disassemble(data, f)
+
+
+if __name__ == '__main__':
+    main()
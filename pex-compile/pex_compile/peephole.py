@@ -0,0 +1,124 @@
+from pex_compile import cfg
+from pex_compile import pykebc
+
+
+def jump_targets(instructions):
+    return {
+        cfg.get_address(argument)
+        for command, argument in instructions
+        if command in cfg.JUMP_COMMANDS
+    }
+
+
+def resolve_jump_chains(instructions):
+    """Map the address of every unconditional jump to the address its chain of jumps ends at
+
+    Every jump is walked once: a chain stops at an address resolved earlier. Jumps forming
+    an infinite loop resolve to themselves, and the jumps leading into the loop to its entry
+    """
+    count = len(instructions)
+    resolved = {}
+    for start in range(count):
+        if instructions[start][0] != 'jump' or start in resolved:
+            continue
+        path = []
+        positions = {}
+        address = start
+        while address < count and instructions[address][0] == 'jump' and address not in resolved:
+            if address in positions:
+                break
+            positions[address] = len(path)
+            path.append(address)
+            address = instructions[address][1]
+        if address in positions:
+            # An infinite loop made of jumps, leave it as it is
+            loop = path[positions[address]:]
+            del path[positions[address]:]
+            for loop_address in loop:
+                resolved[loop_address] = loop_address
+        final = resolved.get(address, address)
+        for path_address in path:
+            resolved[path_address] = final
+    return resolved
+
+
+def thread_jumps(instructions, lines):
+    # Redirect jumps whose target is an unconditional jump straight to the final destination
+    resolved = resolve_jump_chains(instructions)
+    result = list(instructions)
+    for i, (command, argument) in enumerate(instructions):
+        if command not in cfg.JUMP_COMMANDS:
+            continue
+        address = cfg.get_address(argument)
+        final = resolved.get(address, address)
+        if final != address:
+            result[i] = command, cfg.set_address(argument, final)
+    return tuple(result), lines
+
+
+def remove_jumps_to_next(instructions, lines):
+    removed = set()
+    result = list(instructions)
+    for i, (command, argument) in enumerate(instructions):
+        if command == 'jump' and argument == i + 1:
+            removed.add(i)
+        elif command == 'cjump' and argument[2] == i + 1:
+            jump_if, pop_value, address = argument
+            if pop_value:
+                # Both branches just drop the value
+                result[i] = 'stack', 'pop'
+            else:
+                removed.add(i)
+    return cfg.remove_instructions(tuple(result), removed), cfg.remove_lines(lines, removed)
+
+
+def remove_push_pop(instructions, lines):
+    # `load_const x; stack pop` and `stack dup; stack pop` have no effect at all
+    targets = jump_targets(instructions)
+    removed = set()
+    i = 0
+    while i + 1 < len(instructions):
+        pushes = instructions[i][0] == 'load_const' or instructions[i] == ('stack', 'dup')
+        if pushes and instructions[i + 1] == ('stack', 'pop') and i + 1 not in targets:
+            removed.update((i, i + 1))
+            i += 2
+        else:
+            i += 1
+    return cfg.remove_instructions(instructions, removed), cfg.remove_lines(lines, removed)
+
+
+def remove_nops(instructions, lines):
+    removed = {i for i, (command, argument) in enumerate(instructions) if command == 'nop'}
+    return cfg.remove_instructions(instructions, removed), cfg.remove_lines(lines, removed)
+
+
+PASSES = [
+    thread_jumps,
+    remove_jumps_to_next,
+    remove_push_pop,
+    remove_nops,
+]
+
+
+def optimize_instructions(instructions, lines=None):
+    """Run the passes until nothing changes. Returns the instructions and their source lines"""
+    while True:
+        old_instructions = instructions
+        for optimization_pass in PASSES:
+            instructions, lines = optimization_pass(instructions, lines)
+        if instructions == old_instructions:
+            return instructions, lines
+
+
+def optimize(code):
+    """Apply peephole optimizations to LinkedCode and all code objects nested into it"""
+    constants = [
+        optimize(value) if isinstance(value, pykebc.LinkedCode) else value
+        for value in code.constants
+    ]
+    instructions, lines = optimize_instructions(tuple(code.instructions), code.lines)
+    return code.replace(
+        instructions=instructions,
+        constants=constants,
+        lines=lines,
+    )
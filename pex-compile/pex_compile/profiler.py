@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+from pex_compile import pykebc
+from pex_compile import vm
+from pex_compile.superinstructions import opcode_key
+
+import contextlib
+import os
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+
+
+def name_code_objects(code, name='<module>', names=None):
+    """Map every code object of a LinkedCode tree to a dotted name
+
+    Names come from the store that follows the code object's `load_const`. Code objects which are
+    not stored right away are named after their type and the address of the `load_const`
+    """
+    if names is None:
+        names = {}
+    names.setdefault(code, name)
+    prefix = '' if code.type == 'module' else name + '.'
+    for address, (command, argument) in enumerate(code.instructions):
+        if command != 'load_const':
+            continue
+        value = code.constants[argument]
+        if not isinstance(value, pykebc.LinkedCode) or value in names:
+            continue
+        nested_name = f'<{value.type} at {address}>'
+        # A function is stored right after it is loaded, a class after `make_class`
+        for next_command, next_argument in code.instructions[address + 1:address + 3]:
+            if next_command == 'name' and next_argument[0] == 'store':
+                nested_name = code.constants[next_argument[1]]
+            elif next_command == 'store_fast':
+                nested_name = code.local_names[next_argument]
+            elif next_command == 'make_class':
+                continue
+            break
+        name_code_objects(value, prefix + nested_name, names)
+    return names
+
+
+def get_line(code, address):
+    # Unknown lines are 0
+    return None if code.lines is None else code.lines[address] or None
+
+
+def format_instruction(command, argument):
+    return command if argument is None else f'{command} {argument}'
+
+
+class Profile(object):
+    """Execution counts collected by running code on the VirtualMachine
+
+    Pass a Profile as the VM's tracer. Pairs are counted between consecutive instructions of the
+    same frame, so a call doesn't pair the caller's instruction with the callee's first one
+    """
+
+    def __init__(self):
+        self.opcodes = Counter()
+        self.pairs = Counter()
+        # Code objects are counted by id: LinkedCode hashes its whole instruction stream, which
+        # would cost time proportional to the code size on every step. `code_objects` maps the
+        # ids back and keeps the code objects alive, so the ids stay unique
+        self.code_objects = {}
+        # id(code object) -> number of instructions executed in it
+        self.code_totals = Counter()
+        # (id(code object), address) -> number of executions
+        self.instructions = Counter()
+        self.previous_keys = []
+
+    def enter_frame(self, frame):
+        self.code_objects[id(frame.code)] = frame.code
+        self.previous_keys.append(None)
+
+    def leave_frame(self, frame):
+        self.previous_keys.pop()
+
+    def instruction(self, frame, address):
+        command, argument = frame.code.instructions[address]
+        key = opcode_key(command, argument)
+        self.opcodes[key] += 1
+        previous_key = self.previous_keys[-1]
+        if previous_key is not None:
+            self.pairs[previous_key, key] += 1
+        self.previous_keys[-1] = key
+        code_id = id(frame.code)
+        self.code_totals[code_id] += 1
+        self.instructions[code_id, address] += 1
+
+    def report(self, names, top=20, file=sys.stdout):
+        total = sum(self.opcodes.values())
+
+        print(f'Executed instructions: {total}', file=file)
+        print('\nOpcodes:', file=file)
+        for key, count in self.opcodes.most_common(top):
+            print(f'{count:10} {100 * count / total:6.2f}%  {key}', file=file)
+
+        pairs_total = sum(self.pairs.values()) or 1
+        print('\nOpcode pairs:', file=file)
+        for (first, second), count in self.pairs.most_common(top):
+            print(f'{count:10} {100 * count / pairs_total:6.2f}%  {first} -> {second}', file=file)
+
+        print('\nCode objects:', file=file)
+        for code_id, count in self.code_totals.most_common(top):
+            code = self.code_objects[code_id]
+            print(f'{count:10} {100 * count / total:6.2f}%  {names.get(code, "?")}', file=file)
+
+        print('\nHot lines:', file=file)
+        for (code_id, line), count in self.line_counts().most_common(top):
+            code = self.code_objects[code_id]
+            location = f'{names.get(code, "?")}:{"?" if line is None else line}'
+            print(f'{count:10} {100 * count / total:6.2f}%  {location}', file=file)
+
+        print('\nHot instructions:', file=file)
+        for (code_id, address), count in self.instructions.most_common(top):
+            code = self.code_objects[code_id]
+            location = f'{names.get(code, "?")}+{address}'
+            line = get_line(code, address)
+            instruction = format_instruction(*code.instructions[address])
+            print(
+                f'{count:10} {100 * count / total:6.2f}%  {location:30} '
+                f'line {"?" if line is None else line:<6} {instruction}',
+                file=file,
+            )
+
+    def line_counts(self):
+        """Executions per (id(code object), source line)"""
+        counter = Counter()
+        for (code_id, address), count in self.instructions.items():
+            counter[code_id, get_line(self.code_objects[code_id], address)] += count
+        return counter
+
+
+def static_profile(code):
+    """Opcode mix of every code object of a LinkedCode tree, as {name: Counter}"""
+    return {
+        name: Counter(opcode_key(command, argument) for command, argument in code.instructions)
+        for code, name in name_code_objects(code).items()
+    }
+
+
+def print_static_profile(code, top=5, file=sys.stdout):
+    for name, counter in static_profile(code).items():
+        total = sum(counter.values())
+        mix = ', '.join(
+            f'{key} {100 * count / total:.0f}%'
+            for key, count in counter.most_common(top)
+        )
+        print(f'{total:8}  {name}: {mix}', file=file)
+
+
+def parse_args():
+    ap = ArgumentParser(description='Profile opcode execution of Python files on the reference VM')
+    ap.add_argument('--optimize', '-O', action='store_true', help='Optimize the code before profiling')
+    ap.add_argument(
+        '--static',
+        action='store_true',
+        help='Report the opcode mix of every function without executing anything',
+    )
+    ap.add_argument('--top', '-n', type=int, default=20, help='Number of entries to print per table')
+    ap.add_argument('sources', nargs='+', help='Input file names')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    for source_path in options.sources:
+        with open(source_path, 'r') as f:
+            source = f.read()
+        linked_code = vm.compile_linked(source, optimize=options.optimize)
+        print(f'== {source_path}')
+        if options.static:
+            print_static_profile(linked_code, top=options.top)
+            continue
+
+        profile = Profile()
+        machine = vm.VirtualMachine(tracer=profile)
+        # The program's own output would get mixed with the report
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            machine.run_module(linked_code)
+        profile.report(name_code_objects(linked_code), top=options.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,124 @@
 import struct
+import sys
+from array import array
+
+from pex_compile import cfg
+from pex_compile import writer as pex_writer
+
 
 def cid(x):
     return type(x), x
 
 
 class Label(object):
-    __slots__ = ['name']
+    """Jump target inside a Code object, identified by its index in `Code.label_addresses`
 
-    def __init__(self, name):
-        self.name = name
+    Labels compare and hash by identity. The comment is only formatted into a name for display
+    """
+    __slots__ = ['id', 'comment']
 
-    def __hash__(self):
-        return hash(('Label', self.name))
+    def __init__(self, id, comment=None):
+        self.id = id
+        self.comment = comment
 
+    def __repr__(self):
+        return f'L{self.id}' if self.comment is None else f'L{self.id}_{self.comment}'
+
+
+def enumerate_names(names):
+    return {name: i for i, name in enumerate(names)}
+
+
+ATTRIBUTE_ACTIONS = enumerate_names([
+    'get',
+    'set',
+    'del',
+])
+
+BINARY_OPERATORS = enumerate_names([
+    '+',
+    '-',
+    '*',
+    '/',
+    '//',
+    '%',
+    '**',
+    '<<',
+    '>>',
+    '|',
+    '^',
+    '&',
+    '@',
+    'and',
+    'or',
+    '==',
+    '!=',
+    '<',
+    '<=',
+    '>',
+    '>=',
+    'is',
+    'is_not',
+    'in',
+    'not_in',
+])
+
+INDEX_ACTIONS = enumerate_names([
+    'get',
+    'set',
+    'del',
+])
+
+STRUCT_TYPES = enumerate_names([
+    'list',
+    'tuple',
+    'dict',
+    'set',
+])
+
+NAME_ACTIONS = enumerate_names([
+    'load',
+    'store',
+    'del',
+    'load_global',
+])
+
+PSEUDO_FUNCTIONS = enumerate_names([
+    'iter',
+    'next',
+])
+
+STACK_ACTIONS = enumerate_names([
+    'pop',
+    'dup',
+    'dupdown3',
+    'swap2',
+])
+
+UNARY_OPERATORS = enumerate_names([
+    '+',
+    '-',
+    '!',
+    '~',
+])
+
+UNPACK_TYPES = enumerate_names([
+    'dict',
+    'iterable',
+])
 
-def recursive_map(tree, func):
-    if isinstance(tree, tuple):
-        return tuple((recursive_map(x, func) for x in tree))
-    else:
-        return func(tree)
 
+class ByteCompiler(object):
+    """Compiler of LinkedCode to the format 0.2 code objects: fixed-width 4-byte instruction
+    words and 64-bit big-endian counts and lengths"""
 
-def find_log(value, base):
-    log = 0
-    x = 1
-    while x <= value:
-        x *= base
-        log += 1
-    return log
+    FORMAT_VERSION = (0, 2)
 
+    # Size of the unit instruction counts are measured in
+    INSTRUCTION_UNIT = 4
 
-class ByteCompiler(object):
+    # Opcodes are indices in this list. Commands are only ever appended, so that the opcodes
+    # of existing commands stay the same in every format version
     COMMANDS = [
         'nop',
 
@@ -63,8 +151,25 @@ class ByteCompiler(object):
 
         'init_function',
         'make_class',
+
+        'del_fast',
+        'load_fast',
+        'store_fast',
+
+        'binop_const',
+        'binop_fast',
+        'load_attr_fast',
+        'load_attr_name',
+
+        'for_iter',
     ]
 
+    def __init__(self, cache=None, code_alignment=1, pool=None, line_table=None):
+        self.cache = cache
+        self.code_alignment = code_alignment
+        self.pool = pool
+        self.line_table = line_table
+
     def encode_const(self, value):
         if isinstance(value, int):
             return self.encode_int(value)
@@ -82,18 +187,72 @@ class ByteCompiler(object):
             return self.encode_none(value)
         elif isinstance(value, LinkedCode):
             return self.encode_linked_code(value)
+        elif isinstance(value, CompiledCode):
+            return self.encode_compiled_code(value)
         else:
             raise TypeError(f'Invalid constant type: {type(value)}')
 
+    def write_const(self, value, writer):
+        if isinstance(value, LinkedCode):
+            self.write_linked_code(value, writer)
+        elif isinstance(value, CompiledCode):
+            self.write_code_blob(value.blob, writer)
+        elif self.pool is not None and ConstantPool.is_poolable(value):
+            writer.write(self.encode_pool_reference(self.pool.add(value)))
+        else:
+            writer.write(self.encode_const(value))
+
+    def write_linked_code(self, value, writer):
+        # Aligned code depends on its position in the image and pooled code on the other code
+        # objects of the module, so such code is never cached. Neither is code whose lines are
+        # recorded: the line table needs the position of every nested code object
+        cacheable = (
+            self.cache is not None
+            and value.cache_key is not None
+            and self.code_alignment == 1
+            and self.pool is None
+            and self.line_table is None
+        )
+        if cacheable:
+            blob = self.cache.get(value.cache_key)
+            if blob is not None:
+                self.write_code_blob(blob, writer)
+                return
+        # The code is written in place even when it is cached: the cache entry is read back
+        # from the stream, so nested code objects are encoded once and never copied
+        writer.write(b'#')
+        position = self.begin_length(writer)
+        start = writer.tell()
+        self.write(value, writer)
+        self.end_length(writer, position)
+        if cacheable:
+            self.cache.put(value.cache_key, writer.read(start, writer.tell() - start))
+
+    def write_code_blob(self, blob, writer):
+        # Same layout as code written in place, so images are identical with and without the cache
+        writer.write(b'#')
+        position = self.begin_length(writer)
+        writer.write(blob)
+        self.end_length(writer, position)
+
+    def encode_linked_code(self, value):
+        writer = pex_writer.Writer()
+        self.write_linked_code(value, writer)
+        return bytes(writer.output)
+
+    def encode_compiled_code(self, value):
+        writer = pex_writer.Writer()
+        self.write_code_blob(value.blob, writer)
+        return bytes(writer.output)
+
     @staticmethod
-    def encode_linked_code(value):
-        bc = ByteCompiler()
-        blob = bc.compile(value)
-        return b'#' + len(blob).to_bytes(8, 'big') + blob
+    def encode_pool_reference(index):
+        # A reference should be smaller than the constants it replaces, so the index is 32-bit
+        return b'p' + index.to_bytes(4, 'big')
 
     @staticmethod
     def encode_int(value):
-        num_bytes = find_log(value, 256)
+        num_bytes = (value.bit_length() + 8) // 8     # One extra bit for the sign
         return b'i' + num_bytes.to_bytes(8, 'big') + value.to_bytes(num_bytes, 'big', signed=True)
 
     @staticmethod
@@ -124,44 +283,26 @@ class ByteCompiler(object):
     @staticmethod
     def argument_attribute(arg):
         action, num = arg
-        action_id = {
-            'get': 0,
-            'set': 1,
-            'del': 2,
-        }[action]
+        action_id = ATTRIBUTE_ACTIONS[action]
         return (num << 2) | action_id
 
     @staticmethod
     def argument_binop(arg):
-        operator_id = [
-            '+',
-            '-',
-            '*',
-            '/',
-            '//',
-            '%',
-            '**',
-            '<<',
-            '>>',
-            '|',
-            '^',
-            '&',
-            '@',
-            'and',
-            'or',
-            '==',
-            '!=',
-            '<',
-            '<=',
-            '>',
-            '>=',
-            'is',
-            'is_not',
-            'in',
-            'not_in',
-        ].index(arg)
+        operator_id = BINARY_OPERATORS[arg]
         return operator_id
     
+    @staticmethod
+    def argument_binop_const(arg):
+        operator, const_id = arg
+        assert const_id < 2**19
+        return (const_id << 5) | BINARY_OPERATORS[operator]
+
+    @staticmethod
+    def argument_binop_fast(arg):
+        operator, lhs_slot, rhs_slot = arg
+        assert lhs_slot < 2**9 and rhs_slot < 2**9
+        return (lhs_slot << 14) | (rhs_slot << 5) | BINARY_OPERATORS[operator]
+
     @staticmethod
     def argument_call_function(arg):
         function_argument_count = arg
@@ -172,6 +313,11 @@ class ByteCompiler(object):
         jump_if, pop_value, address = arg
         return (address << 2) | (pop_value << 1) | jump_if
 
+    @staticmethod
+    def argument_del_fast(arg):
+        slot = arg
+        return slot
+
     @staticmethod
     def argument_eager_unpack_list(arg):
         expected_elements_count = arg
@@ -200,14 +346,15 @@ class ByteCompiler(object):
         is_handling_exception, address = arg
         return (address << 1) | is_handling_exception
 
+    @staticmethod
+    def argument_for_iter(arg):
+        address = arg
+        return address
+
     @staticmethod
     def argument_index(arg):
         action = arg
-        action_id = [
-            'get',
-            'set',
-            'del',
-        ].index(arg)
+        action_id = INDEX_ACTIONS[action]
         return action_id
 
     @staticmethod
@@ -219,11 +366,28 @@ class ByteCompiler(object):
         address = arg
         return address
 
+    @staticmethod
+    def argument_load_attr_fast(arg):
+        slot, attribute_id = arg
+        assert slot < 2**12 and attribute_id < 2**12
+        return (slot << 12) | attribute_id
+
+    @staticmethod
+    def argument_load_attr_name(arg):
+        name_id, attribute_id = arg
+        assert name_id < 2**12 and attribute_id < 2**12
+        return (name_id << 12) | attribute_id
+
     @staticmethod
     def argument_load_const(arg):
         const_id = arg
         return const_id
     
+    @staticmethod
+    def argument_load_fast(arg):
+        slot = arg
+        return slot
+
     @staticmethod
     def argument_make_class(arg):
         base_classes_count = arg
@@ -232,22 +396,13 @@ class ByteCompiler(object):
     @staticmethod
     def argument_make_struct(arg):
         struct, elements_count = arg
-        struct_id = [
-            'list',
-            'tuple',
-            'dict',
-            'set',
-        ].index(struct)
+        struct_id = STRUCT_TYPES[struct]
         return (elements_count << 2) | struct_id
 
     @staticmethod
     def argument_name(arg):
         action, name_id = arg
-        action_id = [
-            'load',
-            'store',
-            'del',
-        ].index(action)
+        action_id = NAME_ACTIONS[action]
         return (name_id << 2) | action_id
 
     @staticmethod
@@ -257,10 +412,7 @@ class ByteCompiler(object):
     @staticmethod
     def argument_pseudo_call(arg):
         pseudo_function = arg
-        pseudo_function_id = [
-            'iter',
-            'next',
-        ].index(arg)
+        pseudo_function_id = PSEUDO_FUNCTIONS[pseudo_function]
         return pseudo_function_id
 
     @staticmethod
@@ -278,14 +430,14 @@ class ByteCompiler(object):
     @staticmethod
     def argument_stack(arg):
         action = arg
-        action_id = [
-            'pop',
-            'dup',
-            'dupdown3',
-            'swap2',
-        ].index(arg)
+        action_id = STACK_ACTIONS[action]
         return action_id
 
+    @staticmethod
+    def argument_store_fast(arg):
+        slot = arg
+        return slot
+
     @staticmethod
     def argument_try(arg):
         address = arg
@@ -294,83 +446,491 @@ class ByteCompiler(object):
     @staticmethod
     def argument_unop(arg):
         unop = arg
-        unop_id = [
-            '+',
-            '-',
-            '!',
-            '~',
-        ].index(unop)
+        unop_id = UNARY_OPERATORS[unop]
         return unop_id
 
     @staticmethod
     def argument_unpack(arg):
         unpack_type = arg
-        unpack_type_id = [
-            'dict',
-            'iterable',
-        ].index(unpack_type)
+        unpack_type_id = UNPACK_TYPES[unpack_type]
         return unpack_type_id
 
     def instructions(self, instructions):
-        return b''.join(self.instruction(instr) for instr in instructions)
+        # An InstructionBuffer holds the arguments already encoded, so the stream is built with
+        # array operations: the arguments as big-endian words, with the opcodes written into
+        # their (free) most significant bytes
+        instructions = InstructionBuffer.from_instructions(instructions)
+        assert not instructions.arguments or max(instructions.arguments) < 2**24
+        words = array('I', instructions.arguments)
+        if sys.byteorder == 'little':
+            words.byteswap()
+        buffer = bytearray(words.tobytes())
+        buffer[0::4] = instructions.opcodes.tobytes()
+        return buffer
+
+    def instruction_offsets(self, buffer):
+        """Offset of every instruction of an encoded stream, in units like jump addresses"""
+        return range(len(buffer) // self.INSTRUCTION_UNIT)
+        
+    @staticmethod
+    def write_count(writer, value):
+        writer.write_uint(value)
 
-    def instruction(self, instruction):
-        command, argument = instruction
-        command_repr = self.COMMANDS.index(command)
-        argument_repr = self.argument(command, argument)
+    @staticmethod
+    def begin_length(writer):
+        return writer.begin_length()
+
+    @staticmethod
+    def end_length(writer, position):
+        writer.end_length(position)
+
+    def write_padding(self, writer):
+        # Zero padding, so that the instruction stream starts at a multiple of code_alignment
+        # from the beginning of the image
+        padding = writer.padding_size(self.code_alignment, offset=4)
+        writer.write_uint(padding, 4)
+        writer.write(bytes(padding))
+
+    def write(self, code, writer):
+        """Write a code object into a Writer. Nested code objects are written in place"""
+        start = writer.tell()
+        writer.write(bytes([['module', 'function', 'class'].index(code.type)]))
+        self.write_count(writer, code.local_count)
+        self.write_count(writer, cfg.max_stack_depth(code.buffer))
+        instructions = self.instructions(code.instructions)
+        if self.line_table is not None:
+            self.line_table.add(start, code.lines, self.instruction_offsets(instructions))
+        self.write_count(writer, len(instructions) // self.INSTRUCTION_UNIT)
+        self.write_padding(writer)
+        writer.write(instructions)
+        self.write_count(writer, len(code.constants))
+        for value in code.constants:
+            self.write_const(value, writer)
 
-        assert command_repr < 2**8
-        assert argument_repr < 2**24
-        
-        instruction_repr = (command_repr << 24) | argument_repr
-        return instruction_repr.to_bytes(4, 'big')
-
-    def argument(self, command, argument):
-        argmap = {
-            'attribute':            self.argument_attribute,
-            'binop':                self.argument_binop,
-            'call_function':        self.argument_call_function,
-            'cjump':                self.argument_cjump,
-            'eager_unpack_list':    self.argument_eager_unpack_list,
-            'end_finally':          self.argument_end_finally,
-            'end_try':              self.argument_end_try,
-            'except':               self.argument_except,
-            'except_all':           self.argument_except_all,
-            'finally':              self.argument_finally,
-            'get_exception':        self.argument_get_exception,
-            'index':                self.argument_index,
-            'init_function':        self.argument_init_function,
-            'jump':                 self.argument_jump,
-            'load_const':           self.argument_load_const,
-            'make_class':           self.argument_make_class,
-            'make_struct':          self.argument_make_struct,
-            'name':                 self.argument_name,
-            'nop':                  self.argument_nop,
-            'pseudo_call':          self.argument_pseudo_call,
-            'raise':                self.argument_raise,
-            'return':               self.argument_return,
-            'stack':                self.argument_stack,
-            'try':                  self.argument_try,
-            'unop':                 self.argument_unop,
-            'unpack':               self.argument_unpack,
-        }
-        assert set(argmap.keys()) == set(self.COMMANDS)
-        return argmap[command](argument)
-        
     def compile(self, code):
-        compiled_instructions = len(code.instructions).to_bytes(8, 'big') + self.instructions(code.instructions)
-        compiled_constants = len(code.constants).to_bytes(8, 'big') + b''.join(self.encode_const(c) for c in code.constants)
-        compiled_type = ['module', 'function', 'class'].index(code.type).to_bytes(1, 'big')
-        return compiled_type + compiled_instructions + compiled_constants
+        writer = pex_writer.Writer()
+        self.write(code, writer)
+        return writer.output
+
+
+# Resolved once at import time: command -> (opcode, argument encoder)
+ByteCompiler.ENCODING = {
+    command: (opcode, getattr(ByteCompiler, 'argument_' + command))
+    for opcode, command in enumerate(ByteCompiler.COMMANDS)
+}
+assert len(ByteCompiler.ENCODING) < 2**8
+
+
+class CompactByteCompiler(ByteCompiler):
+    """Compiler of LinkedCode to the compact format 0.3 code objects
+
+    Counts, lengths and integer constants are LEB128 varints. An instruction is a 1-byte opcode
+    and a 1-byte argument; larger arguments are split into bytes, and all but the lowest one
+    are carried by `extended_arg` prefixes (most significant first). Jump addresses are offsets
+    in 2-byte units
+    """
+
+    FORMAT_VERSION = (0, 3)
+
+    INSTRUCTION_UNIT = 2
+
+    # Not in COMMANDS: it never appears in LinkedCode and has the same opcode in every version
+    EXTENDED_ARG_OPCODE = 0xFF
+
+    @staticmethod
+    def write_count(writer, value):
+        writer.write_uvarint(value)
+
+    @staticmethod
+    def begin_length(writer):
+        return writer.begin_varint_length()
+
+    @staticmethod
+    def end_length(writer, position):
+        writer.end_varint_length(position)
+
+    def write_padding(self, writer):
+        # The padding size is a varint itself. Find the shortest encoding that fits the padding
+        # it implies, using redundant continuation bytes if the padding would fit in fewer
+        size = 1
+        while len(pex_writer.encode_uvarint(writer.padding_size(self.code_alignment, offset=size))) > size:
+            size += 1
+        padding = writer.padding_size(self.code_alignment, offset=size)
+        writer.write(pex_writer.encode_uvarint(padding, size))
+        writer.write(bytes(padding))
+
+    def instructions(self, instructions):
+        # An instruction takes more units the larger its argument is, and jump arguments are unit
+        # offsets, so sizes and offsets depend on each other. Starting from one unit per
+        # instruction, sizes can only grow, so re-encoding until nothing changes terminates
+        instructions = InstructionBuffer.from_instructions(instructions)
+        address_shifts = InstructionBuffer.OPCODE_ADDRESS_SHIFTS
+        sizes = [1] * len(instructions)
+        while True:
+            offsets = [0]
+            for size in sizes:
+                offsets.append(offsets[-1] + size)
+
+            arguments = []
+            new_sizes = []
+            for opcode, argument_repr in zip(instructions.opcodes, instructions.arguments):
+                shift = address_shifts[opcode]
+                if shift is not None:
+                    flags = argument_repr & ((1 << shift) - 1)
+                    argument_repr = (offsets[argument_repr >> shift] << shift) | flags
+                assert argument_repr < 2**24
+                arguments.append((opcode, argument_repr))
+                new_sizes.append(max(1, (argument_repr.bit_length() + 7) // 8))
+
+            if new_sizes == sizes:
+                break
+            sizes = new_sizes
+
+        buffer = bytearray()
+        for (opcode, argument_repr), size in zip(arguments, sizes):
+            for shift in range(8 * (size - 1), 0, -8):
+                buffer.append(self.EXTENDED_ARG_OPCODE)
+                buffer.append((argument_repr >> shift) & 0xFF)
+            buffer.append(opcode)
+            buffer.append(argument_repr & 0xFF)
+        return buffer
+
+    def instruction_offsets(self, buffer):
+        # An instruction ends with the first unit that is not an `extended_arg` prefix
+        offsets = []
+        start = 0
+        for unit in range(len(buffer) // self.INSTRUCTION_UNIT):
+            if buffer[unit * self.INSTRUCTION_UNIT] != self.EXTENDED_ARG_OPCODE:
+                offsets.append(start)
+                start = unit + 1
+        return offsets
+
+    @staticmethod
+    def encode_pool_reference(index):
+        return b'p' + pex_writer.encode_uvarint(index)
+
+    @staticmethod
+    def encode_int(value):
+        return b'i' + pex_writer.encode_svarint(value)
+
+    @staticmethod
+    def encode_bytes(value):
+        return b'b' + pex_writer.encode_uvarint(len(value)) + value
+
+    @staticmethod
+    def encode_str(value):
+        utf8_encoded = value.encode('utf-8')
+        return b'u' + pex_writer.encode_uvarint(len(utf8_encoded)) + utf8_encoded
+
+
+assert len(ByteCompiler.COMMANDS) < CompactByteCompiler.EXTENDED_ARG_OPCODE
+
+
+def decode_none(argument_repr):
+    return None
+
+
+def decode_int(argument_repr):
+    return argument_repr
+
+
+def decode_enum(names):
+    names = list(names)
+    return lambda argument_repr: names[argument_repr]
+
+
+def decode_enum_and_int(names, bits):
+    # (name, number) encoded as (number << bits) | name id
+    names = list(names)
+    mask = (1 << bits) - 1
+    return lambda argument_repr: (names[argument_repr & mask], argument_repr >> bits)
+
+
+def decode_binop_fast(argument_repr, operators=list(BINARY_OPERATORS)):
+    return operators[argument_repr & 0x1F], argument_repr >> 14, (argument_repr >> 5) & 0x1FF
+
+
+class InstructionBuffer(object):
+    """Compact storage of instructions: parallel arrays of opcodes (indices into
+    ByteCompiler.COMMANDS) and of arguments encoded like in the format 0.2 instruction words
+
+    Indexing and iteration decode (command, argument) tuples on the fly, so a buffer can be used
+    wherever a sequence of instructions is read. Jump addresses can be read and patched in place
+    """
+    __slots__ = ['opcodes', 'arguments']
+
+    # Inverses of the ByteCompiler.argument_<command> encoders
+    DECODERS = {
+        'attribute':         decode_enum_and_int(ATTRIBUTE_ACTIONS, 2),
+        'binop':             decode_enum(BINARY_OPERATORS),
+        'binop_const':       decode_enum_and_int(BINARY_OPERATORS, 5),
+        'binop_fast':        decode_binop_fast,
+        'call_function':     decode_int,
+        'cjump':             lambda r: (bool(r & 1), bool(r & 2), r >> 2),
+        'del_fast':          decode_int,
+        'eager_unpack_list': decode_int,
+        'end_finally':       decode_none,
+        'end_try':           decode_none,
+        'except':            decode_int,
+        'except_all':        decode_int,
+        'finally':           lambda r: (bool(r & 1), r >> 1),
+        'for_iter':          decode_int,
+        'get_exception':     decode_none,
+        'index':             decode_enum(INDEX_ACTIONS),
+        'init_function':     decode_none,
+        'jump':              decode_int,
+        'load_attr_fast':    lambda r: (r >> 12, r & 0xFFF),
+        'load_attr_name':    lambda r: (r >> 12, r & 0xFFF),
+        'load_const':        decode_int,
+        'load_fast':         decode_int,
+        'make_class':        decode_int,
+        'make_struct':       decode_enum_and_int(STRUCT_TYPES, 2),
+        'name':              decode_enum_and_int(NAME_ACTIONS, 2),
+        'nop':               decode_none,
+        'pseudo_call':       decode_enum(PSEUDO_FUNCTIONS),
+        'raise':             decode_none,
+        'return':            decode_none,
+        'stack':             decode_enum(STACK_ACTIONS),
+        'store_fast':        decode_int,
+        'try':               decode_int,
+        'unop':              decode_enum(UNARY_OPERATORS),
+        'unpack':            decode_enum(UNPACK_TYPES),
+    }
+
+    # Position of the address in the encoded arguments of jump commands (cfg.JUMP_COMMANDS)
+    ADDRESS_SHIFTS = {
+        'cjump':      2,
+        'except':     0,
+        'except_all': 0,
+        'finally':    1,
+        'for_iter':   0,
+        'jump':       0,
+        'try':        0,
+    }
+
+    def __init__(self, opcodes=None, arguments=None):
+        self.opcodes = array('B') if opcodes is None else opcodes
+        self.arguments = array('I') if arguments is None else arguments
+
+    @classmethod
+    def from_instructions(cls, instructions):
+        """Encode a sequence of (command, argument) tuples. A buffer is returned as it is"""
+        if isinstance(instructions, cls):
+            return instructions
+        buffer = cls()
+        for command, argument in instructions:
+            buffer.append(command, argument)
+        return buffer
+
+    def copy(self):
+        return InstructionBuffer(array('B', self.opcodes), array('I', self.arguments))
+
+    def append(self, command, argument):
+        opcode, encode_argument = ByteCompiler.ENCODING[command]
+        self.opcodes.append(opcode)
+        self.arguments.append(encode_argument(argument))
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        command, decode_argument = self.DECODING[self.opcodes[index]]
+        return command, decode_argument(self.arguments[index])
+
+    def __setitem__(self, index, instruction):
+        command, argument = instruction
+        opcode, encode_argument = ByteCompiler.ENCODING[command]
+        self.opcodes[index] = opcode
+        self.arguments[index] = encode_argument(argument)
+
+    def __iter__(self):
+        decoding = self.DECODING
+        for opcode, argument_repr in zip(self.opcodes, self.arguments):
+            command, decode_argument = decoding[opcode]
+            yield command, decode_argument(argument_repr)
+
+    def __repr__(self):
+        return f'InstructionBuffer({list(self)!r})'
+
+    def key(self):
+        """Hashable value equal for buffers with equal contents"""
+        return self.opcodes.tobytes(), self.arguments.tobytes()
+
+    def get_address(self, index):
+        """Jump address of the jump instruction at `index`"""
+        return self.arguments[index] >> self.OPCODE_ADDRESS_SHIFTS[self.opcodes[index]]
+
+    def set_address(self, index, address):
+        shift = self.OPCODE_ADDRESS_SHIFTS[self.opcodes[index]]
+        flags = self.arguments[index] & ((1 << shift) - 1)
+        self.arguments[index] = (address << shift) | flags
+
+    def remove(self, removed):
+        """Like cfg.remove_instructions, but without decoding: a new buffer without the
+        instructions with the given indices and with all addresses fixed"""
+        new_addresses = []
+        kept = []
+        for i in range(len(self) + 1):
+            new_addresses.append(len(kept))
+            if i < len(self) and i not in removed:
+                kept.append(i)
+
+        result = InstructionBuffer(
+            array('B', [self.opcodes[i] for i in kept]),
+            array('I', [self.arguments[i] for i in kept]),
+        )
+        address_shifts = self.OPCODE_ADDRESS_SHIFTS
+        for i, opcode in enumerate(result.opcodes):
+            if address_shifts[opcode] is not None:
+                result.set_address(i, new_addresses[result.get_address(i)])
+        return result
+
+
+# Indexed by opcode: (command, argument decoder) and the address shift (None for other commands)
+InstructionBuffer.DECODING = [
+    (command, InstructionBuffer.DECODERS[command])
+    for command in ByteCompiler.COMMANDS
+]
+InstructionBuffer.OPCODE_ADDRESS_SHIFTS = [
+    InstructionBuffer.ADDRESS_SHIFTS.get(command)
+    for command in ByteCompiler.COMMANDS
+]
+# For the analyses of the cfg module: whether a command is in cfg.TERMINATOR_COMMANDS and its
+# stack effect if it doesn't depend on the argument (None otherwise)
+InstructionBuffer.OPCODE_TERMINATORS = [
+    command in cfg.TERMINATOR_COMMANDS
+    for command in ByteCompiler.COMMANDS
+]
+InstructionBuffer.OPCODE_STACK_EFFECTS = [
+    cfg.STACK_EFFECTS.get(command)
+    for command in ByteCompiler.COMMANDS
+]
+assert InstructionBuffer.ADDRESS_SHIFTS.keys() == cfg.JUMP_COMMANDS
+# Encoded arguments and format 0.2 instruction words are 32-bit
+assert array('I').itemsize == 4
+
+class CompiledCode(object):
+    """A code object which is already compiled to bytes, e.g. taken from the compile cache"""
+    __slots__ = ['blob']
+
+    def __init__(self, blob):
+        self.blob = blob
+
+    def __repr__(self):
+        return f'CompiledCode(<{len(self.blob)} bytes>)'
+
+
+class ConstantPool(object):
+    """Module-wide table of constants shared by all code objects of an image
+
+    Every distinct constant is serialized once into the `pool` section and code objects refer
+    to it by index, so the runtime can intern names once at load time (pex-loader decodes the
+    section with `read_constant_pool`).
+
+    The pool is opt-in (`--constant-pool`): pooled code objects depend on the rest of the module,
+    so they can't be cached one by one and only whole images are cached
+    """
+    __slots__ = ['values', 'indices']
+
+    def __init__(self):
+        self.values = []
+        self.indices = {}
+
+    @staticmethod
+    def is_poolable(value):
+        # None and booleans are encoded in one byte, a reference would only make them larger
+        return not isinstance(value, bool) and isinstance(value, (int, float, complex, str, bytes))
+
+    def add(self, value):
+        if cid(value) not in self.indices:
+            self.indices[cid(value)] = len(self.values)
+            self.values.append(value)
+        return self.indices[cid(value)]
+
+    def write(self, writer, byte_compiler):
+        byte_compiler.write_count(writer, len(self.values))
+        for value in self.values:
+            writer.write(byte_compiler.encode_const(value))
+
+
+class LineTable(object):
+    """Source lines of all code objects of an image, stored in the `line` debug section
+
+    Like ConstantPool, it is filled while the code is written. Code objects are identified by
+    their offset from `origin`, the beginning of the code section, and come in the order of their
+    offsets. The lines of a code object are (address delta, line delta) pairs, one wherever the
+    line changes, with addresses measured in the same units as jump addresses. All numbers are
+    LEB128 varints, line deltas are signed
+    """
+    __slots__ = ['origin', 'entries']
+
+    def __init__(self):
+        self.origin = 0
+        self.entries = []
+
+    def add(self, offset, lines, instruction_offsets):
+        if lines is None:
+            return
+        changes = []
+        previous_address = 0
+        previous_line = 0
+        for address, line in zip(instruction_offsets, lines):
+            # Instructions with an unknown line (0) are attributed to the line before them
+            if not line or line == previous_line:
+                continue
+            changes.append((address - previous_address, line - previous_line))
+            previous_address = address
+            previous_line = line
+        if changes:
+            self.entries.append((offset - self.origin, changes))
+
+    def write(self, writer):
+        writer.write_uvarint(len(self.entries))
+        for offset, changes in self.entries:
+            writer.write_uvarint(offset)
+            writer.write_uvarint(len(changes))
+            for address_delta, line_delta in changes:
+                writer.write_uvarint(address_delta)
+                writer.write(pex_writer.encode_svarint(line_delta))
+
 
 class LinkedCode(object):
-    def __init__(self, type, instructions, constants):
+    def __init__(self, type, instructions, constants, local_names=(), cache_key=None, lines=None,
+                 local_count=None):
         self.type = type
-        self.instructions = instructions
+        # Instructions are stored as an InstructionBuffer, `instructions` reads them as tuples
+        self.buffer = InstructionBuffer.from_instructions(instructions)
         self.constants = constants
+        self.local_names = local_names
+        # Number of fast local slots. Images store only the count, so code read back from an
+        # image has a count but no local names
+        self.local_count = len(local_names) if local_count is None else local_count
+        # Compile cache key of the function or class the code was compiled from
+        self.cache_key = cache_key
+        # Source line of every instruction (0 where unknown), or None if there are no lines at all
+        self.lines = lines
     
+    @property
+    def instructions(self):
+        return self.buffer
+
     def __hash__(self):
-        return hash(('LinkedCode', self.type, self.instructions))
+        return hash(('LinkedCode', self.type, self.buffer.key()))
+
+    def replace(self, **changes):
+        attributes = {
+            'type':         self.type,
+            'instructions': self.buffer,
+            'constants':    self.constants,
+            'local_names':  self.local_names,
+            'cache_key':    self.cache_key,
+            'lines':        self.lines,
+            'local_count':  self.local_count,
+        }
+        attributes.update(changes)
+        return LinkedCode(**attributes)
 
     def __repr__(self):
         return self.asm()
@@ -385,17 +945,33 @@ class LinkedCode(object):
 
 
 class Code(object):
-    def __init__(self, type='module'):
+    def __init__(self, type='module', cache_key=None):
         self.reverse_constants = {}
         self.constants = []
-        self.instructions = []
-        self.label_counter = 0
+        self.buffer = InstructionBuffer()
+        # Source line of every instruction (0 where unknown). `line` is the line of the
+        # instructions being added
+        self.lines = array('I')
+        self.line = None
+        # Labels, their addresses (None until a label is placed) and indices of the instructions
+        # which jump to a label. Until link() patches them, jumps hold label ids as addresses
+        self.labels = []
+        self.label_addresses = []
+        self.fixups = []
+        # `name` instructions hold indices into `names` until link() turns the names into constants
+        self.names = []
+        self.name_indices = {}
+        self.name_sites = []
         self.type = type
+        self.cache_key = cache_key
+        self.local_names = []
+        self.local_slots = {}
 
     def new_label(self, comment=None):
-        label_name = f'L{self.label_counter}{"_" + comment if comment is not None else ""}'
-        self.label_counter += 1
-        return Label(label_name)
+        label = Label(len(self.labels), comment)
+        self.labels.append(label)
+        self.label_addresses.append(None)
+        return label
 
     def get_const_id(self, const):
         if cid(const) not in self.reverse_constants:
@@ -403,47 +979,91 @@ class Code(object):
             self.constants.append(const)
         return self.reverse_constants[cid(const)]
     
+    def add_local(self, name, shared=False):
+        """Add a fast local slot. The slot of a `shared` name is not returned by get_local_slot:
+        such a name is accessed by name, the slot only receives its argument"""
+        slot = len(self.local_names)
+        self.local_names.append(name)
+        if not shared:
+            self.local_slots[name] = slot
+        return slot
+
+    def get_local_slot(self, name):
+        return self.local_slots.get(name)
+
     def add_const(self, const):     # const is the constant itself! Not its ID
         self.add('load_const', self.get_const_id(const))
 
+    def add_name(self, name):
+        if name not in self.name_indices:
+            self.name_indices[name] = len(self.names)
+            self.names.append(name)
+        return self.name_indices[name]
+
     def add(self, command, argument):
-        self.instructions.append((command, argument))
+        if command in cfg.JUMP_COMMANDS:
+            self.fixups.append(len(self.buffer))
+            argument = cfg.set_address(argument, cfg.get_address(argument).id)
+        elif command == 'name':
+            action, name = argument
+            self.name_sites.append(len(self.buffer))
+            argument = action, self.add_name(name)
+        self.buffer.append(command, argument)
+        self.lines.append(self.line or 0)
+
+    @property
+    def instructions(self):
+        """The added instructions as (command, argument) tuples, with labels and names in place"""
+        instructions = list(self.buffer)
+        for i in self.fixups:
+            command, argument = instructions[i]
+            instructions[i] = command, cfg.set_address(argument, self.labels[cfg.get_address(argument)])
+        for i in self.name_sites:
+            command, (action, name_index) = instructions[i]
+            instructions[i] = command, (action, self.names[name_index])
+        return instructions
 
     def __repr__(self):
         return f'Code(instructions: {repr(self.instructions)}, constants: {repr(self.constants)})'
 
     def asm(self):
-        cmds = '\n'.join([
-            str(opname) + ('' if arg is None else (' '+str(arg)))
-            for opname, arg in self.instructions
-        ])
+        labels = {}
+        for label, address in zip(self.labels, self.label_addresses):
+            labels.setdefault(address, []).append(f'{label}:')
+        lines = []
+        instructions = self.instructions
+        for address, (opname, arg) in enumerate(instructions):
+            lines.extend(labels.get(address, ()))
+            lines.append(str(opname) + ('' if arg is None else (' '+str(arg))))
+        lines.extend(labels.get(len(instructions), ()))
+        cmds = '\n'.join(lines)
         consts = '\n'.join([str(x) for x in enumerate(self.constants)])
         return cmds + '\n\n' + consts
 
     def add_label(self, label):
-        self.add('DEFINE_LABEL', label)
+        """Place the label at the address of the next added instruction"""
+        assert self.label_addresses[label.id] is None, f'{label} is placed twice'
+        self.label_addresses[label.id] = len(self.buffer)
 
     def link(self):
-        label_values = {}
-        names_values = {}
-        instructions = []
-        address = 0
-        for command, argument in self.instructions:
-            if command == 'DEFINE_LABEL':
-                assert argument not in label_values
-                label_values[argument] = address
-            else:
-                instructions.append((command, argument))
-                address += 1
-        
-        map_function = lambda x: label_values[x] if isinstance(x, Label) else x
-
-        for i, instruction in enumerate(instructions):
-            instructions[i] = recursive_map(instruction, map_function)
-            command, argument = instructions[i]
-            if command == 'name':
-                action, name = argument
-                name_id = self.get_const_id(name)
-                instructions[i] = command, (action, name_id)
-
-        return LinkedCode(type=self.type, instructions=tuple(instructions), constants=self.constants)
+        buffer = self.buffer.copy()
+        # Only the instructions recorded by add() refer to labels and names, the rest are kept as
+        # they are
+        for i in self.fixups:
+            address = self.label_addresses[buffer.get_address(i)]
+            assert address is not None, f'{self.labels[buffer.get_address(i)]} is never placed'
+            buffer.set_address(i, address)
+
+        for i in self.name_sites:
+            command, (action, name_index) = buffer[i]
+            buffer[i] = command, (action, self.get_const_id(self.names[name_index]))
+
+        removed = cfg.find_unreachable(buffer)
+        return LinkedCode(
+            type=self.type,
+            instructions=buffer.remove(removed) if removed else buffer,
+            constants=self.constants,
+            local_names=tuple(self.local_names),
+            cache_key=self.cache_key,
+            lines=cfg.remove_lines(self.lines, removed),
+        )
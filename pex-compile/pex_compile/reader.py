@@ -0,0 +1,53 @@
+class Reader(object):
+    """Sequential binary reader over bytes, the counterpart of writer.Writer
+
+    Reading past the end raises EOFError and leaves the reader unchanged
+    """
+    __slots__ = ['data', 'offset']
+
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+
+    def tell(self):
+        return self.offset
+
+    def bytes_left(self):
+        return len(self.data) - self.offset
+
+    def read(self, size):
+        if self.bytes_left() < size:
+            raise EOFError(f'not enough data to read {size} bytes')
+        data = self.data[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def skip(self, size):
+        self.read(size)
+
+    def read_uint(self, size=8):
+        return int.from_bytes(self.read(size), 'big')
+
+    def read_int(self, size):
+        return int.from_bytes(self.read(size), 'big', signed=True)
+
+    def read_uvarint(self):
+        value = 0
+        shift = 0
+        for position in range(self.offset, len(self.data)):
+            byte = self.data[position]
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                self.offset = position + 1
+                return value
+        raise EOFError('not enough data to read a varint')
+
+    def read_svarint(self):
+        start = self.offset
+        value = self.read_uvarint()
+        # The sign is bit 6 of the last byte
+        bits = 7 * (self.offset - start)
+        if value & (1 << (bits - 1)):
+            value -= 1 << bits
+        return value
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+from pex_compile import ast_to_pykebc
+from pex_compile import cfg
+from pex_compile import peephole
+from pex_compile import pykebc
+
+import ast
+from argparse import ArgumentParser
+from collections import Counter
+
+
+def fuse_load_attr_name(instructions, i):
+    (command1, argument1), (command2, argument2) = instructions[i:i + 2]
+    if command1 != 'name' or argument1[0] != 'load':
+        return None
+    if command2 != 'attribute' or argument2[0] != 'get':
+        return None
+    name_id = argument1[1]
+    attribute_id = argument2[1]
+    if name_id >= 2**12 or attribute_id >= 2**12:
+        return None
+    return 'load_attr_name', (name_id, attribute_id)
+
+
+def fuse_load_attr_fast(instructions, i):
+    (command1, argument1), (command2, argument2) = instructions[i:i + 2]
+    if command1 != 'load_fast' or command2 != 'attribute' or argument2[0] != 'get':
+        return None
+    slot = argument1
+    attribute_id = argument2[1]
+    if slot >= 2**12 or attribute_id >= 2**12:
+        return None
+    return 'load_attr_fast', (slot, attribute_id)
+
+
+def fuse_binop_const(instructions, i):
+    (command1, argument1), (command2, argument2) = instructions[i:i + 2]
+    if command1 != 'load_const' or command2 != 'binop':
+        return None
+    const_id = argument1
+    if const_id >= 2**19:
+        return None
+    return 'binop_const', (argument2, const_id)
+
+
+def fuse_binop_fast(instructions, i):
+    (command1, argument1), (command2, argument2), (command3, argument3) = instructions[i:i + 3]
+    if command1 != 'load_fast' or command2 != 'load_fast' or command3 != 'binop':
+        return None
+    if argument1 >= 2**9 or argument2 >= 2**9:
+        return None
+    return 'binop_fast', (argument3, argument1, argument2)
+
+
+# (number of fused instructions, fusion function). Longer patterns are tried first
+FUSIONS = [
+    (3, fuse_binop_fast),
+    (2, fuse_load_attr_name),
+    (2, fuse_load_attr_fast),
+    (2, fuse_binop_const),
+]
+
+
+def fuse_instructions(instructions, lines=None):
+    """Returns the fused instructions and their source lines
+
+    A superinstruction takes the line of the first instruction it replaces
+    """
+    targets = {
+        cfg.get_address(argument)
+        for command, argument in instructions
+        if command in cfg.JUMP_COMMANDS
+    }
+    result = list(instructions)
+    removed = set()
+    i = 0
+    while i < len(instructions):
+        for length, fuse in FUSIONS:
+            if i + length > len(instructions):
+                continue
+            # Only the first instruction of a fused sequence may be a jump target
+            if any(address in targets for address in range(i + 1, i + length)):
+                continue
+            fused = fuse(instructions, i)
+            if fused is not None:
+                result[i] = fused
+                removed.update(range(i + 1, i + length))
+                i += length
+                break
+        else:
+            i += 1
+    return cfg.remove_instructions(tuple(result), removed), cfg.remove_lines(lines, removed)
+
+
+def fuse(code):
+    """Replace frequent instruction sequences with superinstructions in LinkedCode and all nested code objects"""
+    constants = [
+        fuse(value) if isinstance(value, pykebc.LinkedCode) else value
+        for value in code.constants
+    ]
+    instructions, lines = fuse_instructions(tuple(code.instructions), code.lines)
+    return code.replace(
+        instructions=instructions,
+        constants=constants,
+        lines=lines,
+    )
+
+
+def opcode_key(command, argument):
+    # Distinguish e.g. `name load` from `name store`: they are different fusion candidates
+    if command in ('name', 'attribute'):
+        return f'{command} {argument[0]}'
+    if command in ('stack', 'index', 'pseudo_call', 'unpack'):
+        return f'{command} {argument}'
+    return command
+
+
+def count_opcode_pairs(code, counter=None):
+    """Count how often each pair of adjacent instructions occurs in LinkedCode and all nested code objects"""
+    if counter is None:
+        counter = Counter()
+    keys = [opcode_key(command, argument) for command, argument in code.instructions]
+    counter.update(zip(keys, keys[1:]))
+    for value in code.constants:
+        if isinstance(value, pykebc.LinkedCode):
+            count_opcode_pairs(value, counter)
+    return counter
+
+
+def parse_args():
+    ap = ArgumentParser(description='Count opcode pair frequencies over a corpus of Python files')
+    ap.add_argument('--optimize', '-O', action='store_true', help='Optimize the code before counting')
+    ap.add_argument('--top', '-n', type=int, default=30, help='Number of most frequent pairs to print')
+    ap.add_argument('sources', nargs='+', help='Input file names')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    counter = Counter()
+    for source in options.sources:
+        with open(source, 'r') as f:
+            tree = ast.parse(f.read())
+        linked_code = ast_to_pykebc.translate(tree, optimize=options.optimize).link()
+        if options.optimize:
+            linked_code = peephole.optimize(linked_code)
+        count_opcode_pairs(linked_code, counter)
+
+    total = sum(counter.values())
+    for (first, second), count in counter.most_common(options.top):
+        print(f'{count:10} {100 * count / total:6.2f}%  {first} -> {second}')
+
+
+if __name__ == '__main__':
+    main()
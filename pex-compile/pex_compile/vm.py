@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+
+from pex_compile import ast_to_pykebc
+from pex_compile import peephole
+from pex_compile import pykebc
+from pex_compile import superinstructions
+
+import ast
+import builtins
+import contextlib
+import io
+import operator
+import sys
+from argparse import ArgumentParser
+
+
+BINARY_OPERATORS = {
+    '+':        operator.add,
+    '-':        operator.sub,
+    '*':        operator.mul,
+    '/':        operator.truediv,
+    '//':       operator.floordiv,
+    '%':        operator.mod,
+    '**':       operator.pow,
+    '<<':       operator.lshift,
+    '>>':       operator.rshift,
+    '|':        operator.or_,
+    '^':        operator.xor,
+    '&':        operator.and_,
+    '@':        operator.matmul,
+    # The left operand has already been checked by `cjump`, these only pick the result
+    'and':      lambda a, b: a and b,
+    'or':       lambda a, b: a or b,
+    '==':       operator.eq,
+    '!=':       operator.ne,
+    '<':        operator.lt,
+    '<=':       operator.le,
+    '>':        operator.gt,
+    '>=':       operator.ge,
+    'is':       operator.is_,
+    'is_not':   operator.is_not,
+    'in':       lambda a, b: a in b,
+    'not_in':   lambda a, b: a not in b,
+}
+
+UNARY_OPERATORS = {
+    '+':        operator.pos,
+    '-':        operator.neg,
+    '!':        operator.not_,
+    '~':        operator.invert,
+}
+
+PSEUDO_FUNCTIONS = {
+    'iter':     iter,
+    'next':     next,
+}
+
+
+# Value of a fast local slot which has not been assigned yet
+UNBOUND = object()
+
+
+class Unpacked(object):
+    """A stack value marked by `unpack`: it is spread into the enclosing call, collection or dict"""
+    __slots__ = ['value']
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Function(object):
+    """A code object together with the scopes it was created in
+
+    Both functions and class bodies are represented this way. Like Python functions, Function
+    objects are descriptors, so they become bound methods when accessed through an instance
+    """
+    __slots__ = ['vm', 'code', 'globals', 'enclosing']
+
+    def __init__(self, vm, code, globals, enclosing):
+        self.vm = vm
+        self.code = code
+        self.globals = globals
+        self.enclosing = enclosing
+
+    def __call__(self, *args, **kwargs):
+        frame = Frame(self.code, self.globals, {}, self.enclosing, arguments=(args, kwargs))
+        return self.vm.execute(frame)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        return lambda *args, **kwargs: self(instance, *args, **kwargs)
+
+    def __repr__(self):
+        return f'<pyke {self.code.type} at {id(self):#x}>'
+
+
+class Frame(object):
+    """Execution state of a code object
+
+    `blocks` holds the active `try` handlers as (handler address, stack depth, finally depth).
+    `finally_stack` holds what `end_finally` has to do: ('return', address) to continue after
+    the `finally (False, ...)` that entered the block, or ('raise', exception)
+    """
+    __slots__ = [
+        'code',
+        'globals',
+        'names',
+        'enclosing',
+        'arguments',
+        'fast',
+        'stack',
+        'blocks',
+        'finally_stack',
+        'exception',
+        'pc',
+        'return_value',
+    ]
+
+    def __init__(self, code, globals, names, enclosing=(), arguments=None):
+        if isinstance(code, pykebc.CompiledCode):
+            raise TypeError('Cannot execute a CompiledCode constant, compile without the cache')
+        self.code = code
+        self.globals = globals
+        self.names = names
+        self.enclosing = enclosing
+        self.arguments = arguments
+        self.fast = [UNBOUND] * code.local_count
+        self.stack = []
+        self.blocks = []
+        self.finally_stack = []
+        self.exception = None
+        self.pc = 0
+        self.return_value = None
+
+
+class VirtualMachine(object):
+    """Reference interpreter of LinkedCode
+
+    Meant for measuring the compiler, not for speed: every instruction is dispatched through a
+    table of `op_<command>` methods and counted in `instruction_count`. Values are ordinary
+    Python objects and names are resolved in ordinary dicts, with Python builtins as the
+    outermost scope. Class bodies don't know the class name, so classes are named '<class>'
+
+    A `tracer` gets `enter_frame(frame)` and `leave_frame(frame)` around every executed code
+    object and `instruction(frame, address)` before every instruction
+    """
+
+    def __init__(self, tracer=None):
+        self.instruction_count = 0
+        self.tracer = tracer
+        self.dispatch = {
+            command: getattr(self, 'op_' + command)
+            for command in pykebc.ByteCompiler.COMMANDS
+        }
+        # id(code object) -> (code object, its decoded instructions)
+        self.decoded = {}
+
+    def decode(self, code):
+        """Instructions of LinkedCode as a tuple, decoded once per code object rather than on every step"""
+        entry = self.decoded.get(id(code))
+        if entry is None:
+            entry = self.decoded[id(code)] = code, tuple(code.instructions)
+        return entry[1]
+
+    def run_module(self, code, name='__main__'):
+        """Execute module LinkedCode and return its globals"""
+        globals = {'__name__': name}
+        self.execute(Frame(code, globals, globals))
+        return globals
+
+    def execute(self, frame):
+        dispatch = self.dispatch
+        instructions = self.decode(frame.code)
+        end = len(instructions)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.enter_frame(frame)
+        try:
+            while frame.pc < end:
+                if tracer is not None:
+                    tracer.instruction(frame, frame.pc)
+                command, argument = instructions[frame.pc]
+                frame.pc += 1
+                self.instruction_count += 1
+                try:
+                    dispatch[command](frame, argument)
+                except Exception as e:
+                    exception = e
+                else:
+                    continue
+                # Raised outside of the `except` clause, so the exception is not chained to itself
+                if not self.handle_exception(frame, exception):
+                    raise exception
+        finally:
+            if tracer is not None:
+                tracer.leave_frame(frame)
+        return frame.return_value
+
+    @staticmethod
+    def handle_exception(frame, exception):
+        if not frame.blocks:
+            return False
+        handler, depth, finally_depth = frame.blocks.pop()
+        del frame.stack[depth:]
+        del frame.finally_stack[finally_depth:]
+        frame.stack.append(exception)
+        frame.exception = exception
+        frame.pc = handler
+        return True
+
+    # Names
+
+    def lookup(self, frame, name, scopes):
+        for scope in scopes:
+            if name in scope:
+                return scope[name]
+        try:
+            return getattr(builtins, name)
+        except AttributeError:
+            raise NameError(f"name '{name}' is not defined") from None
+
+    def op_name(self, frame, argument):
+        action, name_id = argument
+        name = frame.code.constants[name_id]
+        if action == 'load':
+            frame.stack.append(self.lookup(frame, name, (frame.names, *frame.enclosing, frame.globals)))
+        elif action == 'load_global':
+            frame.stack.append(self.lookup(frame, name, (frame.globals,)))
+        elif action == 'store':
+            frame.names[name] = frame.stack.pop()
+        elif action == 'del':
+            try:
+                del frame.names[name]
+            except KeyError:
+                raise NameError(f"name '{name}' is not defined") from None
+        else:
+            raise ValueError(f'Invalid name action: {action}')
+
+    def load_fast(self, frame, slot):
+        value = frame.fast[slot]
+        if value is UNBOUND:
+            # Code read back from an image has no local names
+            names = frame.code.local_names
+            name = names[slot] if slot < len(names) else f'<local {slot}>'
+            raise UnboundLocalError(f"local variable '{name}' referenced before assignment")
+        return value
+
+    def op_load_fast(self, frame, argument):
+        frame.stack.append(self.load_fast(frame, argument))
+
+    def op_store_fast(self, frame, argument):
+        frame.fast[argument] = frame.stack.pop()
+
+    def op_del_fast(self, frame, argument):
+        self.load_fast(frame, argument)
+        frame.fast[argument] = UNBOUND
+
+    def op_load_const(self, frame, argument):
+        value = frame.code.constants[argument]
+        if isinstance(value, (pykebc.LinkedCode, pykebc.CompiledCode)):
+            # Functions capture the scopes they are created in. Like in Python, the namespace
+            # of a class body is not visible to the functions defined in it
+            if frame.code.type == 'function':
+                enclosing = (frame.names, *frame.enclosing)
+            else:
+                enclosing = frame.enclosing
+            value = Function(self, value, frame.globals, enclosing)
+        frame.stack.append(value)
+
+    # Objects
+
+    def op_attribute(self, frame, argument):
+        action, name_id = argument
+        name = frame.code.constants[name_id]
+        stack = frame.stack
+        if action == 'get':
+            stack.append(getattr(stack.pop(), name))
+        elif action == 'set':
+            obj = stack.pop()
+            value = stack.pop()
+            setattr(obj, name, value)
+        elif action == 'del':
+            delattr(stack.pop(), name)
+        else:
+            raise ValueError(f'Invalid attribute action: {action}')
+
+    def op_index(self, frame, argument):
+        stack = frame.stack
+        index = stack.pop()
+        obj = stack.pop()
+        if argument == 'get':
+            stack.append(obj[index])
+        elif argument == 'set':
+            obj[index] = stack.pop()
+        elif argument == 'del':
+            del obj[index]
+        else:
+            raise ValueError(f'Invalid index action: {argument}')
+
+    def op_get_exception(self, frame, argument):
+        if frame.exception is None:
+            raise RuntimeError('No active exception to reraise')
+        frame.stack.append(frame.exception)
+
+    # Stack and structures
+
+    @staticmethod
+    def spread(values):
+        result = []
+        for value in values:
+            if isinstance(value, Unpacked):
+                result.extend(value.value)
+            else:
+                result.append(value)
+        return result
+
+    @staticmethod
+    def pop_values(frame, count):
+        if count == 0:
+            return []
+        values = frame.stack[-count:]
+        del frame.stack[-count:]
+        return values
+
+    def op_make_struct(self, frame, argument):
+        struct, elements_count = argument
+        if struct == 'dict':
+            values = self.pop_values(frame, 2 * elements_count)
+            result = {}
+            for key, value in zip(values[::2], values[1::2]):
+                if isinstance(key, Unpacked):
+                    result.update(key.value)
+                else:
+                    result[key] = value
+        else:
+            values = self.spread(self.pop_values(frame, elements_count))
+            result = {'list': list, 'tuple': tuple, 'set': set}[struct](values)
+        frame.stack.append(result)
+
+    def op_unpack(self, frame, argument):
+        frame.stack.append(Unpacked(frame.stack.pop()))
+        if argument == 'dict':
+            # `make_struct dict` takes a key/value pair for every entry
+            frame.stack.append(None)
+
+    def op_eager_unpack_list(self, frame, argument):
+        values = list(frame.stack.pop())
+        if len(values) != argument:
+            raise ValueError(f'expected {argument} values to unpack, got {len(values)}')
+        frame.stack.extend(values)
+
+    def op_stack(self, frame, argument):
+        stack = frame.stack
+        if argument == 'pop':
+            stack.pop()
+        elif argument == 'dup':
+            stack.append(stack[-1])
+        elif argument == 'dupdown3':
+            stack.insert(-3, stack[-1])
+        elif argument == 'swap2':
+            stack[-1], stack[-2] = stack[-2], stack[-1]
+        else:
+            raise ValueError(f'Invalid stack action: {argument}')
+
+    # Operations
+
+    def op_binop(self, frame, argument):
+        rhs = frame.stack.pop()
+        lhs = frame.stack.pop()
+        frame.stack.append(BINARY_OPERATORS[argument](lhs, rhs))
+
+    def op_unop(self, frame, argument):
+        frame.stack.append(UNARY_OPERATORS[argument](frame.stack.pop()))
+
+    def op_pseudo_call(self, frame, argument):
+        frame.stack.append(PSEUDO_FUNCTIONS[argument](frame.stack.pop()))
+
+    def op_call_function(self, frame, argument):
+        args = self.spread(self.pop_values(frame, argument))
+        function = frame.stack.pop()
+        frame.stack.append(function(*args))
+
+    # Control flow
+
+    def op_nop(self, frame, argument):
+        pass
+
+    def op_jump(self, frame, argument):
+        frame.pc = argument
+
+    def op_cjump(self, frame, argument):
+        jump_if, pop_value, address = argument
+        value = frame.stack[-1]
+        if pop_value:
+            frame.stack.pop()
+        if bool(value) == jump_if:
+            frame.pc = address
+
+    def op_for_iter(self, frame, argument):
+        try:
+            frame.stack.append(next(frame.stack[-1]))
+        except StopIteration:
+            frame.stack.pop()
+            frame.pc = argument
+
+    def op_return(self, frame, argument):
+        frame.return_value = frame.stack.pop()
+        frame.pc = len(frame.code.instructions)
+
+    def op_raise(self, frame, argument):
+        exception = frame.stack.pop()
+        if isinstance(exception, type) and issubclass(exception, BaseException):
+            exception = exception()
+        if not isinstance(exception, BaseException):
+            raise TypeError('exceptions must derive from BaseException')
+        raise exception
+
+    def op_try(self, frame, argument):
+        frame.blocks.append((argument, len(frame.stack), len(frame.finally_stack)))
+
+    def op_end_try(self, frame, argument):
+        frame.blocks.pop()
+
+    def op_except(self, frame, argument):
+        exception_type = frame.stack.pop()
+        if isinstance(frame.stack[-1], exception_type):
+            frame.pc = argument
+
+    def op_except_all(self, frame, argument):
+        frame.pc = argument
+
+    def op_finally(self, frame, argument):
+        is_handling_exception, address = argument
+        if is_handling_exception:
+            frame.finally_stack.append(('raise', frame.stack.pop()))
+        else:
+            frame.finally_stack.append(('return', frame.pc))
+        frame.pc = address
+
+    def op_end_finally(self, frame, argument):
+        action, value = frame.finally_stack.pop()
+        if action == 'raise':
+            raise value
+        frame.pc = value
+
+    # Functions and classes
+
+    def op_init_function(self, frame, argument):
+        # The prologue pushes the parameter names, the number of positional parameters, the default
+        # values, their number, then (name, False) or (name, True, default) for every keyword-only
+        # parameter and their number. It is parsed from the top: an entry without a default ends
+        # with a name followed by False, an entry with a default has True right before its value
+        stack = frame.stack
+        keyword_only = []
+        for _ in range(stack.pop()):
+            if stack[-1] is False and isinstance(stack[-2], str):
+                stack.pop()
+                keyword_only.append((stack.pop(), UNBOUND))
+            else:
+                default = stack.pop()
+                stack.pop()
+                keyword_only.append((stack.pop(), default))
+        keyword_only.reverse()
+        defaults = self.pop_values(frame, stack.pop())
+        positional = self.pop_values(frame, stack.pop())
+        assert not stack
+
+        args, kwargs = frame.arguments
+        if len(args) > len(positional):
+            raise TypeError(f'takes {len(positional)} positional arguments but {len(args)} were given')
+        values = dict(zip(positional, args))
+        for name, value in kwargs.items():
+            if name in values:
+                raise TypeError(f"got multiple values for argument '{name}'")
+            if name not in positional and name not in dict(keyword_only):
+                raise TypeError(f"got an unexpected keyword argument '{name}'")
+            values[name] = value
+        for name, default in zip(positional[len(positional) - len(defaults):], defaults):
+            values.setdefault(name, default)
+        for name, default in keyword_only:
+            if default is not UNBOUND:
+                values.setdefault(name, default)
+
+        # Parameters occupy the first slots in declaration order. Those used by nested scopes are
+        # copied into `names` by the instructions that follow
+        for slot, name in enumerate(positional + [name for name, default in keyword_only]):
+            if name not in values:
+                raise TypeError(f"missing required argument: '{name}'")
+            frame.fast[slot] = values[name]
+
+    def op_make_class(self, frame, argument):
+        body = frame.stack.pop()
+        bases = tuple(self.spread(self.pop_values(frame, argument)))
+        namespace = {}
+        self.execute(Frame(body.code, body.globals, namespace, body.enclosing))
+        metaclass = type(bases[0]) if bases else type
+        frame.stack.append(metaclass('<class>', bases, namespace))
+
+    # Superinstructions
+
+    def op_binop_const(self, frame, argument):
+        op, const_id = argument
+        lhs = frame.stack.pop()
+        frame.stack.append(BINARY_OPERATORS[op](lhs, frame.code.constants[const_id]))
+
+    def op_binop_fast(self, frame, argument):
+        op, lhs_slot, rhs_slot = argument
+        lhs = self.load_fast(frame, lhs_slot)
+        rhs = self.load_fast(frame, rhs_slot)
+        frame.stack.append(BINARY_OPERATORS[op](lhs, rhs))
+
+    def op_load_attr_fast(self, frame, argument):
+        slot, attribute_id = argument
+        frame.stack.append(getattr(self.load_fast(frame, slot), frame.code.constants[attribute_id]))
+
+    def op_load_attr_name(self, frame, argument):
+        name_id, attribute_id = argument
+        self.op_name(frame, ('load', name_id))
+        frame.stack.append(getattr(frame.stack.pop(), frame.code.constants[attribute_id]))
+
+
+def compile_linked(source, optimize=False):
+    linked_code = ast_to_pykebc.translate(ast.parse(source), optimize=optimize).link()
+    if optimize:
+        linked_code = peephole.optimize(linked_code)
+        linked_code = superinstructions.fuse(linked_code)
+    return linked_code
+
+
+def run(source, optimize=False):
+    """Compile and run a program. Returns (printed output, executed instruction count)"""
+    vm = VirtualMachine()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        vm.run_module(compile_linked(source, optimize=optimize))
+    return output.getvalue(), vm.instruction_count
+
+
+def parse_args():
+    ap = ArgumentParser(description='Run Python files on the reference PEX virtual machine')
+    ap.add_argument('--optimize', '-O', action='store_true', help='Optimize the code before running it')
+    ap.add_argument(
+        '--compare',
+        action='store_true',
+        help='Run both unoptimized and optimized code and check that they print the same',
+    )
+    ap.add_argument('sources', nargs='+', help='Input file names')
+    return ap.parse_args()
+
+
+def main():
+    options = parse_args()
+    success = True
+    for source_path in options.sources:
+        with open(source_path, 'r') as f:
+            source = f.read()
+        if not options.compare:
+            vm = VirtualMachine()
+            vm.run_module(compile_linked(source, optimize=options.optimize))
+            print(f'{source_path}: {vm.instruction_count} instructions', file=sys.stderr)
+            continue
+
+        output, count = run(source)
+        optimized_output, optimized_count = run(source, optimize=True)
+        same = output == optimized_output
+        success = success and same
+        print(
+            f'{source_path}: {count} -> {optimized_count} instructions, '
+            f'output {"matches" if same else "DIFFERS"}',
+            file=sys.stderr,
+        )
+    if not success:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
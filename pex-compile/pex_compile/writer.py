@@ -0,0 +1,106 @@
+def encode_uvarint(value, size=None):
+    """Unsigned LEB128: 7 bits per byte, least significant group first, high bit set on all bytes but the last
+
+    If `size` is given, the number is padded with redundant continuation bytes to exactly `size` bytes
+    """
+    assert value >= 0
+    encoded = bytearray()
+    while value >= 0x80 or (size is not None and len(encoded) < size - 1):
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+    encoded.append(value)
+    assert size is None or (len(encoded) == size and value < 0x80)
+    return bytes(encoded)
+
+
+def encode_svarint(value):
+    """Signed LEB128: like encode_uvarint, but bit 6 of the last byte is the sign"""
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if (value == 0 and not byte & 0x40) or (value == -1 and byte & 0x40):
+            encoded.append(byte)
+            return bytes(encoded)
+        encoded.append(byte | 0x80)
+
+
+class Writer(object):
+    """Sequential binary writer over a bytearray or a seekable binary file
+
+    A length field is written as a placeholder by `begin_length()` and patched by `end_length()`
+    once everything it covers has been written, so nested objects can be emitted in place instead
+    of being built separately just to learn their size
+    """
+    __slots__ = ['output', 'is_buffer', 'origin']
+
+    def __init__(self, output=None):
+        if output is None:
+            output = bytearray()
+        self.output = output
+        self.is_buffer = isinstance(output, bytearray)
+        # Alignment is relative to the position the writer started at, i.e. the beginning of the image
+        self.origin = self.tell()
+
+    def tell(self):
+        if self.is_buffer:
+            return len(self.output)
+        return self.output.tell()
+
+    def write(self, data):
+        if self.is_buffer:
+            self.output += data
+        else:
+            self.output.write(data)
+
+    def write_uint(self, value, size=8):
+        self.write(value.to_bytes(size, 'big'))
+
+    def padding_size(self, alignment, offset=0):
+        """Number of bytes to skip after `offset` more bytes so that the next write is aligned"""
+        return -(self.tell() + offset - self.origin) % alignment
+
+    def align(self, alignment):
+        self.write(bytes(self.padding_size(alignment)))
+
+    def patch(self, position, data):
+        if self.is_buffer:
+            self.output[position:position + len(data)] = data
+        else:
+            end = self.output.tell()
+            self.output.seek(position)
+            self.output.write(data)
+            self.output.seek(end)
+
+    def read(self, position, size):
+        """Read back `size` bytes written at `position`. A file has to be opened for reading too"""
+        if self.is_buffer:
+            return bytes(self.output[position:position + size])
+        end = self.output.tell()
+        self.output.seek(position)
+        data = self.output.read(size)
+        self.output.seek(end)
+        return data
+
+    def write_uvarint(self, value):
+        self.write(encode_uvarint(value))
+
+    def begin_varint_length(self, size=5):
+        # A LEB128 number may have redundant continuation bytes, so the length can be patched
+        # in place once it is known, as long as it fits into `size` bytes
+        position = self.tell()
+        self.write(bytes(size))
+        return position
+
+    def end_varint_length(self, position, size=5):
+        length = self.tell() - position - size
+        self.patch(position, encode_uvarint(length, size))
+
+    def begin_length(self, size=8):
+        position = self.tell()
+        self.write(bytes(size))
+        return position
+
+    def end_length(self, position, size=8):
+        length = self.tell() - position - size
+        self.patch(position, length.to_bytes(size, 'big'))
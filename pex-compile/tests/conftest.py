@@ -0,0 +1,14 @@
+import sys
+
+import pytest
+
+from pex_compile import __main__ as pex_main
+
+
+@pytest.fixture
+def parse_options(monkeypatch):
+    """Parse a pex-compile command line into the options object of __main__"""
+    def parse(*args):
+        monkeypatch.setattr(sys, 'argv', ['pex-compile', *args])
+        return pex_main.parse_args()
+    return parse
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from pex_compile import __main__ as pex_main
+from pex_compile import cache
+from pex_compile import pykebc
+from pex_compile import writer as pex_writer
+
+
+SOURCE = '\n'.join([
+    'def f(a):',
+    '    return a + 1',
+    'class C(object):',
+    '    def g(self):',
+    '        return 2',
+    'print(f(1))',
+])
+
+
+def test_get_and_put(tmp_path):
+    compile_cache = cache.CompileCache(str(tmp_path))
+    key = compile_cache.module_key(SOURCE)
+    assert compile_cache.get(key) is None
+    compile_cache.put(key, b'blob')
+    assert compile_cache.get(key) == b'blob'
+
+
+def test_keys_depend_on_options_and_source(tmp_path):
+    plain = cache.CompileCache(str(tmp_path), options='optimize=False')
+    optimized = cache.CompileCache(str(tmp_path), options='optimize=True')
+    assert plain.module_key(SOURCE) != optimized.module_key(SOURCE)
+    assert plain.module_key(SOURCE) != plain.module_key(SOURCE + '\n')
+    assert plain.module_key(SOURCE) == cache.CompileCache(str(tmp_path), options='optimize=False').module_key(SOURCE)
+
+
+def test_trim_evicts_least_recently_used(tmp_path):
+    compile_cache = cache.CompileCache(str(tmp_path), max_size=250)
+    keys = [compile_cache.key('module', str(i)) for i in range(3)]
+    for i, key in enumerate(keys):
+        compile_cache.put(key, bytes(100))
+        os.utime(compile_cache.path(key), (i, i))
+    compile_cache.trim()
+    assert compile_cache.get(keys[0]) is None
+    assert compile_cache.get(keys[1]) is not None
+    assert compile_cache.get(keys[2]) is not None
+
+
+def test_cached_output_is_identical(tmp_path, parse_options):
+    source_path = tmp_path / 'module.py'
+    source_path.write_text(SOURCE)
+    options = parse_options('--cache-dir', str(tmp_path / 'cache'), '-o', 'out.pex', str(source_path))
+    expected = pex_main.compile_source(SOURCE, options)
+
+    compile_cache = pex_main.make_cache(options)
+    assert pex_main.compile_file(str(source_path), options, compile_cache) == expected
+    entry_count = len(list(compile_cache.entries()))
+    # The module image, f, C and C.g
+    assert entry_count == 4
+    assert pex_main.compile_file(str(source_path), options, compile_cache) == expected
+
+
+def test_unchanged_functions_are_reused(tmp_path, parse_options):
+    options = parse_options('--cache-dir', str(tmp_path), '-o', 'out.pex', 'module.py')
+    compile_cache = pex_main.make_cache(options)
+    pex_main.compile_source(SOURCE, options, compile_cache)
+    entry_count = len(list(compile_cache.entries()))
+
+    changed_source = SOURCE.replace('return 2', 'return 3')
+    output = pex_main.compile_source(changed_source, options, compile_cache)
+    assert output == pex_main.compile_source(changed_source, options)
+    # Only C and C.g are compiled again
+    assert len(list(compile_cache.entries())) == entry_count + 2
+
+
+@pytest.mark.parametrize('arguments', [[], ['--compact'], ['-O', '--compact']])
+def test_cold_and_warm_cache_output_is_identical(tmp_path, parse_options, arguments):
+    options = parse_options(*arguments, '--cache-dir', str(tmp_path), '-o', 'out.pex', 'module.py')
+    expected = pex_main.compile_source(SOURCE, options)
+    compile_cache = pex_main.make_cache(options)
+    # Cold: code objects are written in place and read back into the cache
+    assert pex_main.compile_source(SOURCE, options, compile_cache) == expected
+    # Warm: translation takes f and C from the cache
+    assert pex_main.compile_source(SOURCE, options, compile_cache) == expected
+
+
+def test_code_is_cached_as_written_in_place(tmp_path):
+    compile_cache = cache.CompileCache(str(tmp_path))
+    code = pykebc.LinkedCode('function', [('load_const', 0), ('return', None)], [1], cache_key='key')
+    byte_compiler = pykebc.CompactByteCompiler(cache=compile_cache)
+    writer = pex_writer.Writer()
+    byte_compiler.write_linked_code(code, writer)
+    assert compile_cache.get('key') == pykebc.CompactByteCompiler().compile(code)
+    # A hit is written with the same length field as code written in place
+    cached_writer = pex_writer.Writer()
+    byte_compiler.write_linked_code(code, cached_writer)
+    assert cached_writer.output == writer.output
@@ -0,0 +1,105 @@
+import pytest
+
+from pex_compile import cfg
+from pex_compile import pykebc
+from pex_compile import vm
+
+
+LOOP = (
+    ('load_const', 0),          # 0
+    ('cjump', (False, True, 4)),
+    ('load_const', 1),          # 2
+    ('jump', 0),
+    ('load_const', 2),          # 4
+    ('return', None),
+    ('load_const', 3),          # 6, unreachable
+    ('return', None),
+)
+
+
+def test_blocks_and_edges():
+    graph = cfg.ControlFlowGraph.build(LOOP, tuple(range(len(LOOP))))
+    assert [block.start for block in graph.blocks] == [0, 2, 4, 6]
+    first, body, exit, dead = graph.blocks
+    assert first.successors == [body, exit]
+    assert body.successors == [first]
+    assert exit.successors == []
+    assert first.predecessors == [body]
+    assert exit.lines == [4, 5]
+    assert first.instructions[1] == ('cjump', (False, True, exit))
+
+
+def test_remove_unreachable_and_serialize():
+    graph = cfg.ControlFlowGraph.build(LOOP, tuple(range(len(LOOP))))
+    graph.remove_unreachable()
+    assert graph.to_instructions() == LOOP[:6]
+    assert graph.to_lines() == (0, 1, 2, 3, 4, 5)
+
+
+def test_round_trip_keeps_addresses():
+    assert cfg.ControlFlowGraph.build(LOOP).to_instructions() == LOOP
+
+
+def test_jump_past_the_end():
+    instructions = (
+        ('load_const', 0),
+        ('cjump', (True, True, 3)),
+        ('nop', None),
+    )
+    graph = cfg.ControlFlowGraph.build(instructions)
+    assert graph.blocks[0].instructions[1] == ('cjump', (True, True, None))
+    assert graph.to_instructions() == instructions
+
+
+def test_successors():
+    assert cfg.get_successors(3, 'jump', 7) == (7,)
+    assert cfg.get_successors(3, 'cjump', (True, False, 7)) == (4, 7)
+    assert cfg.get_successors(3, 'return', None) == ()
+    assert cfg.get_successors(3, 'finally', (True, 7)) == (7,)
+    assert cfg.get_successors(3, 'finally', (False, 7)) == (4, 7)
+
+
+def test_remove_instructions_redirects_addresses():
+    instructions = (
+        ('jump', 2),
+        ('nop', None),
+        ('nop', None),
+        ('return', None),
+    )
+    assert cfg.remove_instructions(instructions, {1, 2}) == (
+        ('jump', 1),
+        ('return', None),
+    )
+
+
+def test_buffer_analyses():
+    buffer = pykebc.InstructionBuffer.from_instructions(LOOP)
+    assert cfg.find_block_starts(buffer) == [0, 2, 4, 6, 8]
+    assert cfg.find_unreachable(buffer) == {6, 7}
+    # The loop body leaves a value on the stack
+    with pytest.raises(Exception, match='Unbounded stack growth'):
+        cfg.max_stack_depth(buffer)
+    assert cfg.max_stack_depth(pykebc.InstructionBuffer()) == 0
+    assert cfg.find_unreachable(pykebc.InstructionBuffer()) == set()
+
+
+def test_buffer_stack_depth_matches_the_graph():
+    source = '\n'.join([
+        'class C(object):',
+        '    def m(self, items, *, k=1):',
+        '        for item in items:',
+        '            try:',
+        '                self.x = [item, (k, {1: item})]',
+        '            except E as e:',
+        '                continue',
+        '            finally:',
+        '                k = k + 1',
+        '        return k if k else None',
+        'print(C().m([1, 2]))',
+    ])
+    pending = [vm.compile_linked(source), vm.compile_linked(source, optimize=True)]
+    while pending:
+        code = pending.pop()
+        graph = cfg.ControlFlowGraph.from_linked_code(code)
+        assert cfg.max_stack_depth(code.buffer) == graph.max_stack_depth()
+        pending.extend(value for value in code.constants if isinstance(value, pykebc.LinkedCode))
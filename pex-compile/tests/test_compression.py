@@ -0,0 +1,52 @@
+import pytest
+
+from pex_compile import __main__ as pex_main
+from pex_compile import compression
+from pex_compile import disassembler
+
+
+SOURCE = 'def f(a):\n    return a + 1\nprint(f(1))\n'
+
+
+class ReversingCodec(object):
+    id = 0x7F
+    name = 'reverse'
+
+    def compress(self, data):
+        return bytes(reversed(data))
+
+    def decompress(self, data):
+        return bytes(reversed(data))
+
+
+def compile_image(parse_options, *args):
+    return pex_main.compile_source(SOURCE, parse_options(*args, '-o', 'out.pex', 'module.py'))
+
+
+def section_contents(data):
+    return [(section.name, bytes(section.data)) for section in disassembler.read_image(data).sections]
+
+
+def test_zlib_sections_decompress_to_the_original(parse_options):
+    plain = compile_image(parse_options)
+    compressed = compile_image(parse_options, '--compress', 'zlib')
+    assert compressed != plain
+    assert section_contents(compressed) == section_contents(plain)
+
+
+def test_custom_codec(parse_options, monkeypatch):
+    monkeypatch.setattr(compression, 'CODECS', dict(compression.CODECS))
+    compression.register_codec(ReversingCodec())
+    assert compression.get_codec('reverse').id == 0x7F
+    assert compression.get_codec_by_id(0x7F).name == 'reverse'
+    plain = compile_image(parse_options)
+    options = parse_options('-o', 'out.pex', 'module.py')
+    options.compress = 'reverse'
+    assert section_contents(pex_main.compile_source(SOURCE, options)) == section_contents(plain)
+
+
+def test_unknown_codecs():
+    with pytest.raises(ValueError):
+        compression.get_codec('unknown')
+    with pytest.raises(ValueError):
+        compression.get_codec_by_id(0x7E)
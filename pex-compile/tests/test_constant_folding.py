@@ -0,0 +1,87 @@
+import ast
+
+from pex_compile import constant_folding
+from pex_compile import vm
+
+
+def fold_expression(source):
+    return constant_folding.fold(ast.parse(source, mode='eval')).body
+
+
+def folded_value(source):
+    tree = fold_expression(source)
+    assert constant_folding.is_constant(tree), ast.dump(tree)
+    return constant_folding.get_constant(tree)
+
+
+def test_arithmetic():
+    assert folded_value('2 * 3 + 1') == 7
+    assert folded_value('-(1 << 4) // 3') == -6
+    assert folded_value('"ab" * 2 + "c"') == 'ababc'
+    assert folded_value('not 0') is True
+
+
+def test_comparisons():
+    assert folded_value('1 < 2 < 3') is True
+    assert folded_value('1 < 2 > 3') is False
+    assert folded_value('"a" in "abc"') is True
+    assert not constant_folding.is_constant(fold_expression('1 is 1'))
+    assert not constant_folding.is_constant(fold_expression('1 < x'))
+
+
+def test_boolean_operations():
+    assert folded_value('1 or x') == 1
+    assert folded_value('0 and x') == 0
+    assert ast.dump(fold_expression('0 or x')) == ast.dump(ast.parse('x', mode='eval').body)
+    tree = fold_expression('1 and x and y')
+    assert isinstance(tree, ast.BoolOp) and len(tree.values) == 2
+
+
+def test_conditional_expression():
+    assert folded_value('1 if 2 > 1 else x') == 1
+    assert isinstance(fold_expression('x if 0 else y'), ast.Name)
+
+
+def test_unsafe_operations_are_left_for_runtime():
+    for source in ['1 / 0', '2 ** 1000', '"x" * 5000', '"%s" % 1', '-0.0', '1 << 200']:
+        assert not constant_folding.is_constant(fold_expression(source)), source
+
+
+def test_constant_branches_are_dropped():
+    tree = constant_folding.fold(ast.parse('if 0:\n    a = 1\nelse:\n    b = 2\nwhile 0:\n    c = 3\n'))
+    assert [type(node) for node in tree.body] == [ast.Assign]
+    assert tree.body[0].targets[0].id == 'b'
+
+
+def test_folded_program_behaves_the_same():
+    source = '\n'.join([
+        'x = 3',
+        'print(2 * 3 + x)',
+        'print(1 if 2 > 1 else x)',
+        'print(0 or x, 1 and x)',
+        'if 1 < 0:',
+        '    print("never")',
+        'print(1 / 2, 7 // 2, "a" + "b")',
+    ])
+    output, count = vm.run(source)
+    optimized_output, optimized_count = vm.run(source, optimize=True)
+    assert output == '9\n1\n3 3\n0.5 3 ab\n'
+    assert optimized_output == output
+    assert optimized_count < count
+
+
+def test_true_while_test_is_dropped_only_when_optimizing():
+    source = '\n'.join([
+        'i = 0',
+        'while True:',
+        '    i = i + 1',
+        '    if i == 3:',
+        '        break',
+        'print(i)',
+    ])
+    plain = vm.compile_linked(source)
+    optimized = vm.compile_linked(source, optimize=True)
+    # `True == 1`, so look the constant up by identity
+    assert any(constant is True for constant in plain.constants)
+    assert not any(constant is True for constant in optimized.constants)
+    assert vm.run(source)[0] == vm.run(source, optimize=True)[0] == '3\n'
@@ -0,0 +1,37 @@
+import io
+
+from pex_compile import __main__ as pex_main
+from pex_compile import disassembler
+
+
+SOURCE = '\n'.join([
+    'def f(a):',
+    '    return a + "text" + "text"',
+    'def g(b):',
+    '    return b * 2.5 + "text"',
+    'print(f("x"), g(1))',
+])
+
+
+def compile_image(parse_options, *args):
+    options = parse_options(*args, '-o', 'out.pex', 'module.py')
+    return pex_main.compile_source(SOURCE, options)
+
+
+def listing(data):
+    # Only the code: the section layout differs
+    output = io.StringIO()
+    disassembler.disassemble(data, output)
+    return [line for line in output.getvalue().splitlines() if not line.startswith(';')]
+
+
+def test_pool_is_opt_in(parse_options):
+    image = disassembler.read_image(compile_image(parse_options))
+    assert image.get_section(b'pool') is None
+
+
+def test_pooled_image_has_the_same_code(parse_options):
+    plain = compile_image(parse_options)
+    pooled = compile_image(parse_options, '--constant-pool')
+    assert disassembler.read_image(pooled).get_section(b'pool') is not None
+    assert listing(pooled) == listing(plain)
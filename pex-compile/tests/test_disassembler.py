@@ -0,0 +1,85 @@
+import io
+
+import pytest
+
+from pex_compile import __main__ as pex_main
+from pex_compile import disassembler
+
+
+SOURCE = '\n'.join([
+    'class Counter(object):',
+    '    def count(self, items, *, start=0):',
+    '        total = start',
+    '        for item in items:',
+    '            try:',
+    '                total = total + item * 2.5',
+    '            except TypeError as e:',
+    '                total = -1',
+    '        return total',
+    'def f(a, b=None):',
+    '    while a > 0:',
+    '        a = a - 1',
+    '    return [a, (b, 2j), {"k": b"v"}, 12345678901234567890, -7]',
+    'print(Counter().count([1, 2]), f(3))',
+])
+
+
+VARIANTS = [
+    [],
+    ['--compact'],
+    ['-O'],
+    ['--align', '4096'],
+    ['--constant-pool'],
+    ['--compress', 'zlib'],
+    ['--debug'],
+    ['-O', '--compact', '--align', '64', '--constant-pool', '--compress', 'zlib', '--debug'],
+]
+
+
+def compile_with_listing(parse_options, arguments):
+    options = parse_options(*arguments, '-o', 'out.pex', 'module.py')
+    listing = io.StringIO()
+    data = pex_main.compile_source(SOURCE, options, listing=listing)
+    return data, listing.getvalue()
+
+
+def code_lines(listing):
+    # Local names are not stored in images, and ByteCompiler.encode_const stores booleans as
+    # integers (bool is a subclass of int)
+    lines = []
+    for line in listing.splitlines():
+        if line.startswith(';') or line.strip().startswith('local '):
+            continue
+        if line.strip().startswith('const ') and line.endswith((' = True', ' = False')):
+            line = line.replace(' = True', ' = 1').replace(' = False', ' = 0')
+        lines.append(line)
+    return lines
+
+
+@pytest.mark.parametrize('arguments', VARIANTS, ids=lambda arguments: ' '.join(arguments) or 'default')
+def test_disassembly_matches_the_compiler_listing(parse_options, arguments):
+    data, listing = compile_with_listing(parse_options, arguments)
+    output = io.StringIO()
+    disassembler.disassemble(data, output)
+    assert code_lines(output.getvalue()) == code_lines(listing)
+
+
+def test_header_sections_and_exports(parse_options):
+    data, listing = compile_with_listing(parse_options, ['--compact', '--debug'])
+    output = io.StringIO()
+    disassembler.disassemble(data, output)
+    comments = [line for line in output.getvalue().splitlines() if line.startswith(';')]
+    assert comments[0] == '; PEX exec image, format 0.3, section alignment 1, code alignment 1'
+    assert [line.split(':')[0] for line in comments[1:4]] == [
+        '; section code',
+        '; section syms',
+        '; section line',
+    ]
+    assert comments[4:] == ['; export class Counter', '; export function f']
+
+
+def test_invalid_images():
+    with pytest.raises(ValueError):
+        disassembler.read_image(b'XYZ' + bytes(29))
+    with pytest.raises(EOFError):
+        disassembler.read_image(b'PEX')
@@ -0,0 +1,126 @@
+import ast
+import contextlib
+import io
+
+import pytest
+
+from pex_compile import __main__ as pex_main
+from pex_compile import ast_to_pykebc
+from pex_compile import disassembler
+from pex_compile import vm
+from pex_compile.reader import Reader
+
+
+def local_names(source):
+    return ast_to_pykebc.find_local_names(ast.parse(source).body[0])
+
+
+def test_parameters_come_first():
+    source = '\n'.join([
+        'def f(a, b, *, c):',
+        '    x = a',
+        '    for y in b:',
+        '        del x',
+        '    try:',
+        '        pass',
+        '    except E as e:',
+        '        pass',
+    ])
+    assert local_names(source) == ['a', 'b', 'c', 'x', 'y', 'e']
+
+
+def test_names_used_by_nested_scopes_are_not_local():
+    source = '\n'.join([
+        'def f(a, b):',
+        '    x = 1',
+        '    y = 2',
+        '    def g():',
+        '        return a + x',
+        '    return g',
+    ])
+    # Parameters keep their slots even when nested scopes use them
+    assert local_names(source) == ['a', 'b', 'y', 'g']
+
+
+def test_global_and_nonlocal_names_are_not_local():
+    source = '\n'.join([
+        'def f(a):',
+        '    global x',
+        '    x = a',
+        '    y = a',
+    ])
+    assert local_names(source) == ['a', 'y']
+
+
+def test_captured_parameters():
+    source = '\n'.join([
+        'def outer(x, y):',
+        '    def inner():',
+        '        return x',
+        '    return inner() + y',
+        'print(outer(5, 1))',
+    ])
+    assert vm.run(source)[0] == '6\n'
+    assert vm.run(source, optimize=True)[0] == '6\n'
+
+
+def test_fast_locals_are_used():
+    source = '\n'.join([
+        'def f(a):',
+        '    b = a + 1',
+        '    return b',
+        'print(f(1))',
+    ])
+    function = vm.compile_linked(source).constants[0]
+    commands = [command for command, argument in function.instructions]
+    assert 'name' not in commands
+    assert 'load_fast' in commands and 'store_fast' in commands
+    assert vm.run(source)[0] == '2\n'
+
+
+CAPTURED_PARAMETERS_SOURCE = '\n'.join([
+    'def outer(a, b, c=10, *, d=100):',
+    '    def inner():',
+    '        return a * 1000 + c',
+    '    b = b + d',
+    '    return inner() + b',
+    'print(outer(1, 2), outer(3, 4, 5))',
+])
+
+
+def test_parameters_keep_their_slots():
+    function = vm.compile_linked(CAPTURED_PARAMETERS_SOURCE).constants[0]
+    assert function.local_names[:4] == ('a', 'b', 'c', 'd')
+    instructions = list(function.instructions)
+    prologue_end = instructions.index(('init_function', None)) + 1
+    # The captured parameters are copied from their slots into names right after the prologue
+    assert instructions[prologue_end:prologue_end + 4] == [
+        ('load_fast', 0),
+        ('name', ('store', function.constants.index('a'))),
+        ('load_fast', 2),
+        ('name', ('store', function.constants.index('c'))),
+    ]
+    assert vm.run(CAPTURED_PARAMETERS_SOURCE)[0] == '1112 3109\n'
+
+
+@pytest.mark.parametrize('arguments', [[], ['-O'], ['--compact'], ['-O', '--compact', '--constant-pool']])
+def test_parameters_round_trip_through_the_image(parse_options, arguments):
+    # The image stores only the number of slots, so the code read back from it has to run
+    # without local names
+    options = parse_options(*arguments, '-o', 'out.pex', 'module.py')
+    image = disassembler.read_image(pex_main.compile_source(CAPTURED_PARAMETERS_SOURCE, options))
+    decoder = disassembler.DECODERS[image.format_version]()
+    pool_section = image.get_section(b'pool')
+    if pool_section is not None:
+        reader = Reader(pool_section.data)
+        decoder.pool = [decoder.read_const(reader) for _ in range(decoder.read_count(reader))]
+    module = decoder.read_code(Reader(image.get_section(b'code').data))
+
+    function = module.constants[0]
+    assert function.local_names == ()
+    assert function.local_count == 5
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        vm.VirtualMachine().run_module(module)
+    assert output.getvalue() == '1112 3109\n'
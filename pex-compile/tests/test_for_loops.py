@@ -0,0 +1,47 @@
+from pex_compile import cfg
+from pex_compile import pykebc
+from pex_compile import vm
+
+
+SOURCE = '\n'.join([
+    'def f(items):',
+    '    total = 0',
+    '    for item in items:',
+    '        if item < 0:',
+    '            break',
+    '        total = total + item',
+    '    else:',
+    '        total = total + 100',
+    '    return total',
+    'print(f([1, 2, 3]), f([1, -1, 5]), f([]))',
+    'for x in (1, 2):',
+    '    for y in (3, 4):',
+    '        print(x * y)',
+])
+
+
+def test_for_loops_use_for_iter():
+    function = vm.compile_linked(SOURCE).constants[0]
+    commands = [command for command, argument in function.instructions]
+    assert commands.count('for_iter') == 1
+
+
+def test_for_loops_run():
+    expected = '106 1 100\n3\n4\n6\n8\n'
+    assert vm.run(SOURCE)[0] == expected
+    assert vm.run(SOURCE, optimize=True)[0] == expected
+
+
+def test_for_iter_stack_effect():
+    assert cfg.stack_effect('for_iter', 5) == 1
+    assert cfg.stack_effect('for_iter', 5, jump=True) == -1
+    function = vm.compile_linked(SOURCE).constants[0]
+    graph = cfg.ControlFlowGraph.from_linked_code(function)
+    assert graph.max_stack_depth() >= 2
+
+
+def test_for_iter_is_encoded():
+    buffer = pykebc.InstructionBuffer.from_instructions((('for_iter', 7), ('jump', 0)))
+    assert tuple(buffer) == (('for_iter', 7), ('jump', 0))
+    opcode = pykebc.ByteCompiler.COMMANDS.index('for_iter')
+    assert pykebc.ByteCompiler().instructions(buffer)[:4] == bytes([opcode, 0, 0, 7])
@@ -0,0 +1,79 @@
+from pex_compile import __main__ as pex_main
+from pex_compile import disassembler
+from pex_compile import pykebc
+from pex_compile import vm
+from pex_compile.reader import Reader
+
+
+SOURCE = '\n'.join([
+    'def f(a):',
+    '    b = a + 1',
+    '    if b:',
+    '        return b',
+    '    return 0',
+    'x = f(',
+    '    2)',
+    'print(x)',
+])
+
+
+def read_line_tables(data):
+    tables = {}
+    reader = Reader(disassembler.read_image(data).get_section(b'line').data)
+    for _ in range(reader.read_uvarint()):
+        offset = reader.read_uvarint()
+        changes = [(reader.read_uvarint(), reader.read_svarint()) for _ in range(reader.read_uvarint())]
+        tables[offset] = changes
+    return tables
+
+
+def expand(changes):
+    """(address, line) of every change"""
+    address = 0
+    line = 0
+    result = []
+    for address_delta, line_delta in changes:
+        address += address_delta
+        line += line_delta
+        result.append((address, line))
+    return result
+
+
+def test_every_instruction_has_a_line():
+    for optimize in [False, True]:
+        module = vm.compile_linked(SOURCE, optimize=optimize)
+        function = module.constants[0]
+        for code in [module, function]:
+            assert len(code.lines) == len(code.instructions)
+        assert set(function.lines) == {1, 2, 3, 4, 5}
+        assert set(module.lines) == {1, 6, 7, 8}
+
+
+def test_line_table_changes():
+    table = pykebc.LineTable()
+    table.origin = 10
+    table.add(10, (1, 1, None, 3, 2, 2), range(6))
+    table.add(30, (5, 5), range(0, 8, 4))
+    table.add(40, None, range(3))
+    assert table.entries == [
+        (0, [(0, 1), (3, 2), (1, -1)]),
+        (20, [(0, 5)]),
+    ]
+
+
+def test_line_section(parse_options):
+    for compact in [[], ['--compact']]:
+        options = parse_options('--debug', *compact, '-o', 'out.pex', 'module.py')
+        tables = read_line_tables(pex_main.compile_source(SOURCE, options))
+        # The module starts the code section, the function is nested into its constants
+        assert sorted(tables)[0] == 0
+        # The argument on line 7 is evaluated in the middle of the call on line 6
+        module_lines = [line for address, line in expand(tables[0])]
+        assert module_lines == [1, 6, 7, 6, 8]
+        function_offset = sorted(tables)[1]
+        assert [line for address, line in expand(tables[function_offset])] == [1, 2, 3, 4, 5]
+
+
+def test_no_line_section_without_debug(parse_options):
+    data = pex_main.compile_source(SOURCE, parse_options('-o', 'out.pex', 'module.py'))
+    assert disassembler.read_image(data).get_section(b'line') is None
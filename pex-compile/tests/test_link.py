@@ -0,0 +1,69 @@
+from array import array
+
+from pex_compile import pykebc
+from pex_compile import vm
+
+
+def function_instructions(source):
+    return list(vm.compile_linked(source).constants[0].instructions)
+
+
+def test_code_after_return_is_dropped():
+    instructions = function_instructions('\n'.join([
+        'def f(a):',
+        '    return a',
+        '    print(a)',
+    ]))
+    assert [command for command, argument in instructions][-2:] == ['load_fast', 'return']
+    assert 'call_function' not in [command for command, argument in instructions]
+
+
+def test_code_after_raise_and_break_is_dropped():
+    instructions = function_instructions('\n'.join([
+        'def f(a):',
+        '    while a:',
+        '        break',
+        '        a = a - 1',
+        '    raise a',
+        '    a = 2',
+    ]))
+    assert 'binop' not in [command for command, argument in instructions]
+    assert [command for command, argument in instructions][-1] == 'raise'
+
+
+def test_addresses_and_lines_follow_removed_instructions():
+    code = pykebc.Code()
+    code.line = 1
+    end = code.new_label()
+    code.add_const(True)
+    code.add('cjump', (True, True, end))
+    code.add('jump', end)
+    code.line = 2
+    code.add_const(1)
+    code.add('stack', 'pop')
+    code.line = 3
+    code.add_label(end)
+    code.add_const(None)
+    code.add('return', None)
+    linked = code.link()
+    assert list(linked.instructions) == [
+        ('load_const', 0),
+        ('cjump', (True, True, 3)),
+        ('jump', 3),
+        ('load_const', 2),
+        ('return', None),
+    ]
+    assert linked.lines == array('I', [1, 1, 1, 3, 3])
+
+
+def test_linked_program_runs():
+    source = '\n'.join([
+        'def f(a):',
+        '    if a:',
+        '        return 1',
+        '    else:',
+        '        return 2',
+        '    print("unreachable")',
+        'print(f(0), f(1))',
+    ])
+    assert vm.run(source)[0] == '2 1\n'
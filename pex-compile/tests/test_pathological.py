@@ -0,0 +1,123 @@
+"""Machine-generated code with very long or deeply nested expressions
+
+CPython's parser rejects such sources long before these sizes, so the trees are built directly
+"""
+
+import ast
+import contextlib
+import io
+
+import pytest
+
+from pex_compile import ast_to_pykebc
+from pex_compile import peephole
+from pex_compile import pykebc
+from pex_compile import superinstructions
+from pex_compile import vm
+
+
+SIZE = 5000
+
+
+def load(name):
+    return ast.Name(id=name, ctx=ast.Load())
+
+
+def locate(tree):
+    # ast.fix_missing_locations is recursive
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if 'lineno' in node._attributes:
+            node.lineno = node.end_lineno = 1
+            node.col_offset = node.end_col_offset = 0
+        pending.extend(ast.iter_child_nodes(node))
+    return tree
+
+
+def program(setup, expr):
+    """`setup`, then `x = <expr>` and `print(<result>)`"""
+    body = ast.parse(setup).body
+    body.append(ast.Assign(targets=[ast.Name(id='x', ctx=ast.Store())], value=expr))
+    return locate(ast.Module(body=body, type_ignores=[]))
+
+
+def run(tree, optimize):
+    linked_code = ast_to_pykebc.translate(tree, optimize=optimize).link()
+    if optimize:
+        linked_code = peephole.optimize(linked_code)
+        linked_code = superinstructions.fuse(linked_code)
+    pykebc.ByteCompiler().compile(linked_code)
+    pykebc.CompactByteCompiler().compile(linked_code)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        vm.VirtualMachine().run_module(linked_code)
+    return output.getvalue()
+
+
+def printed(tree, expr):
+    tree.body.append(locate(ast.Expr(value=ast.Call(func=load('print'), args=[expr], keywords=[]))))
+    return tree
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'optimized'])
+def optimize(request):
+    return request.param
+
+
+def test_long_addition_chain(optimize):
+    expr = load('a')
+    for _ in range(SIZE - 1):
+        expr = ast.BinOp(left=expr, op=ast.Add(), right=load('a'))
+    assert run(printed(program('a = 1', expr), load('x')), optimize) == f'{SIZE}\n'
+
+
+def test_long_constant_addition_chain(optimize):
+    expr = ast.Constant(value=1)
+    for _ in range(SIZE - 1):
+        expr = ast.BinOp(left=expr, op=ast.Add(), right=ast.Constant(value=1))
+    assert run(printed(program('', expr), load('x')), optimize) == f'{SIZE}\n'
+
+
+def test_long_and_chain(optimize):
+    expr = ast.BoolOp(op=ast.And(), values=[load('a') for _ in range(SIZE)])
+    assert run(printed(program('a = 2', expr), load('x')), optimize) == '2\n'
+
+
+def test_long_comparison_chain(optimize):
+    expr = ast.Compare(left=load('a'), ops=[ast.LtE()] * SIZE, comparators=[load('a')] * SIZE)
+    assert run(printed(program('a = 2', expr), load('x')), optimize) == 'True\n'
+
+
+def test_deep_unary_nesting(optimize):
+    expr = ast.Constant(value=1)
+    for _ in range(SIZE):
+        expr = ast.UnaryOp(op=ast.USub(), operand=expr)
+    assert run(printed(program('', expr), load('x')), optimize) == '1\n'
+
+
+def test_deep_attribute_nesting(optimize):
+    expr = load('c')
+    for _ in range(SIZE):
+        expr = ast.Attribute(value=expr, attr='b', ctx=ast.Load())
+    expr = ast.Attribute(value=expr, attr='v', ctx=ast.Load())
+    setup = 'class C(object):\n    pass\nc = C()\nc.b = c\nc.v = 7'
+    assert run(printed(program(setup, expr), load('x')), optimize) == '7\n'
+
+
+def test_deep_tuple_nesting(optimize):
+    # Tuple displays nested deeper than Python's stack, through emission, linking and encoding
+    expr = ast.Constant(value=1)
+    for _ in range(SIZE):
+        expr = ast.Tuple(elts=[expr, load('a')], ctx=ast.Load())
+    length = ast.Call(func=load('len'), args=[load('x')], keywords=[])
+    assert run(printed(program('a = 1', expr), length), optimize) == '2\n'
+
+
+def test_deep_conditional_expression_nesting(optimize):
+    # Every level ends with a jump to the end of the enclosing level, so jump threading sees
+    # chains as long as the nesting is deep
+    expr = load('a')
+    for _ in range(2 * SIZE):
+        expr = ast.IfExp(test=load('a'), body=expr, orelse=load('b'))
+    assert run(printed(program('a = 1\nb = 2', expr), load('x')), optimize) == '1\n'
@@ -0,0 +1,161 @@
+from pex_compile import peephole
+from pex_compile import vm
+
+
+def test_thread_jumps_follows_chains():
+    instructions = (
+        ('jump', 2),
+        ('cjump', (True, True, 3)),
+        ('jump', 3),
+        ('jump', 4),
+        ('return', None),
+    )
+    threaded, lines = peephole.thread_jumps(instructions, None)
+    assert threaded == (
+        ('jump', 4),
+        ('cjump', (True, True, 4)),
+        ('jump', 4),
+        ('jump', 4),
+        ('return', None),
+    )
+    assert lines is None
+
+
+def test_thread_jumps_leaves_jump_loops():
+    instructions = (
+        ('jump', 1),
+        ('jump', 2),
+        ('jump', 1),
+    )
+    threaded, lines = peephole.thread_jumps(instructions, None)
+    assert threaded == (
+        ('jump', 1),
+        ('jump', 2),
+        ('jump', 1),
+    )
+
+
+def test_thread_jumps_stops_at_loop_entry():
+    instructions = (
+        ('jump', 1),
+        ('jump', 2),
+        ('jump', 3),
+        ('jump', 2),
+    )
+    threaded, lines = peephole.thread_jumps(instructions, None)
+    assert threaded == (
+        ('jump', 2),
+        ('jump', 2),
+        ('jump', 3),
+        ('jump', 2),
+    )
+
+
+def test_thread_jumps_long_chain():
+    count = 100000
+    instructions = tuple(('jump', i + 1) for i in range(count)) + (('return', None),)
+    threaded, lines = peephole.thread_jumps(instructions, None)
+    assert threaded == (('jump', count),) * count + (('return', None),)
+
+
+def test_thread_jumps_keeps_jumps_past_the_end():
+    instructions = (
+        ('jump', 1),
+        ('jump', 2),
+    )
+    threaded, lines = peephole.thread_jumps(instructions, None)
+    assert threaded == (
+        ('jump', 2),
+        ('jump', 2),
+    )
+
+
+def test_remove_jumps_to_next():
+    instructions = (
+        ('jump', 1),
+        ('cjump', (True, False, 2)),
+        ('cjump', (True, True, 3)),
+        ('return', None),
+    )
+    optimized, lines = peephole.remove_jumps_to_next(instructions, (1, 2, 3, 4))
+    assert optimized == (
+        ('stack', 'pop'),
+        ('return', None),
+    )
+    assert lines == (3, 4)
+
+
+def test_remove_push_pop():
+    instructions = (
+        ('load_const', 0),
+        ('stack', 'pop'),
+        ('stack', 'dup'),
+        ('stack', 'pop'),
+        ('jump', 6),
+        ('load_const', 0),
+        ('stack', 'pop'),
+        ('return', None),
+    )
+    optimized, lines = peephole.remove_push_pop(instructions, None)
+    # The `stack pop` at address 6 is a jump target, so its `load_const` must stay
+    assert optimized == (
+        ('jump', 2),
+        ('load_const', 0),
+        ('stack', 'pop'),
+        ('return', None),
+    )
+
+
+def test_remove_nops_fixes_addresses():
+    instructions = (
+        ('nop', None),
+        ('jump', 3),
+        ('nop', None),
+        ('return', None),
+    )
+    optimized, lines = peephole.remove_nops(instructions, (1, 2, 3, 4))
+    assert optimized == (
+        ('jump', 1),
+        ('return', None),
+    )
+    assert lines == (2, 4)
+
+
+def test_optimize_instructions_reaches_fixpoint():
+    instructions = (
+        ('jump', 1),
+        ('jump', 2),
+        ('load_const', 0),
+        ('stack', 'pop'),
+        ('nop', None),
+        ('load_const', 1),
+        ('return', None),
+    )
+    optimized, lines = peephole.optimize_instructions(instructions, (1, 2, 3, 4, 5, 6, 7))
+    assert optimized == (
+        ('load_const', 1),
+        ('return', None),
+    )
+    assert lines == (6, 7)
+
+
+def test_optimized_program_behaves_the_same():
+    source = '\n'.join([
+        'def f(n):',
+        '    total = 0',
+        '    i = 0',
+        '    while i < n:',
+        '        if i % 2 == 0:',
+        '            total = total + i',
+        '        else:',
+        '            total = total - 1',
+        '        i = i + 1',
+        '    return total',
+        'print(f(10))',
+        'print(1 if f(3) else 2)',
+    ])
+    output, count = vm.run(source)
+    optimized_output, optimized_count = vm.run(source, optimize=True)
+    assert output == '15\n1\n'
+    assert optimized_output == output
+    assert optimized_count <= count
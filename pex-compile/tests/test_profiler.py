@@ -0,0 +1,54 @@
+import contextlib
+import io
+
+from pex_compile import profiler
+from pex_compile import pykebc
+from pex_compile import vm
+
+
+SOURCE = '\n'.join([
+    'def f(n):',
+    '    total = 0',
+    '    while n > 0:',
+    '        n = n - 1',
+    '        total = total + n',
+    '    return total',
+    'print(f(10))',
+])
+
+
+def profile(source):
+    code = vm.compile_linked(source)
+    result = profiler.Profile()
+    with contextlib.redirect_stdout(io.StringIO()):
+        vm.VirtualMachine(tracer=result).run_module(code)
+    return code, result
+
+
+def test_counts():
+    code, result = profile(SOURCE)
+    function = code.constants[0]
+    total = sum(result.opcodes.values())
+    assert sum(result.code_totals.values()) == total
+    assert sum(result.instructions.values()) == total
+    assert result.code_totals[id(function)] > result.code_totals[id(code)]
+    assert result.code_objects[id(function)] is function
+    # The loop test runs 11 times, the jump back to it 10 times
+    assert result.line_counts()[id(function), 3] == 11 * 4 + 10
+
+    report = io.StringIO()
+    result.report(profiler.name_code_objects(code), file=report)
+    assert 'Executed instructions: ' + str(total) in report.getvalue()
+    assert '%  f:3\n' in report.getvalue()
+
+
+def test_steps_do_not_hash_code_objects(monkeypatch):
+    # Hashing LinkedCode encodes its whole instruction stream, so it must not happen per step
+    hashes = []
+    original_hash = pykebc.LinkedCode.__hash__
+    def counting_hash(code):
+        hashes.append(code)
+        return original_hash(code)
+    monkeypatch.setattr(pykebc.LinkedCode, '__hash__', counting_hash)
+    code, result = profile(SOURCE)
+    assert len(hashes) < 10 < sum(result.opcodes.values())
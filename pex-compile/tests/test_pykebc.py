@@ -0,0 +1,150 @@
+from pex_compile import pykebc
+
+
+# Opcodes of format 0.0. New commands are appended, so these must never change
+FORMAT_0_0_COMMANDS = [
+    'nop',
+    'attribute',
+    'get_exception',
+    'index',
+    'load_const',
+    'name',
+    'eager_unpack_list',
+    'make_struct',
+    'stack',
+    'unpack',
+    'binop',
+    'call_function',
+    'pseudo_call',
+    'unop',
+    'cjump',
+    'end_finally',
+    'end_try',
+    'except',
+    'except_all',
+    'finally',
+    'jump',
+    'raise',
+    'return',
+    'try',
+    'init_function',
+    'make_class',
+]
+
+
+def test_opcodes_are_stable():
+    commands = pykebc.ByteCompiler.COMMANDS
+    assert commands[:len(FORMAT_0_0_COMMANDS)] == FORMAT_0_0_COMMANDS
+    assert commands.index('del_fast') == 26
+    assert commands.index('load_fast') == 27
+    assert commands.index('store_fast') == 28
+    assert commands.index('for_iter') == 33
+    assert len(set(commands)) == len(commands)
+
+
+# One instruction of every command, with arguments near the limits of their encodings
+SAMPLE_INSTRUCTIONS = [
+    ('nop', None),
+    ('attribute', ('del', 2**22 - 1)),
+    ('get_exception', None),
+    ('index', 'set'),
+    ('load_const', 2**24 - 1),
+    ('name', ('load_global', 7)),
+    ('eager_unpack_list', 3),
+    ('make_struct', ('set', 5)),
+    ('stack', 'swap2'),
+    ('unpack', 'iterable'),
+    ('binop', 'not_in'),
+    ('call_function', 2),
+    ('pseudo_call', 'next'),
+    ('unop', '~'),
+    ('cjump', (False, True, 2**22 - 1)),
+    ('end_finally', None),
+    ('end_try', None),
+    ('except', 9),
+    ('except_all', 10),
+    ('finally', (True, 11)),
+    ('jump', 12),
+    ('raise', None),
+    ('return', None),
+    ('try', 13),
+    ('init_function', None),
+    ('make_class', 1),
+    ('del_fast', 4),
+    ('load_fast', 5),
+    ('store_fast', 6),
+    ('binop_const', ('@', 2**19 - 1)),
+    ('binop_fast', ('or', 511, 510)),
+    ('load_attr_fast', (4095, 4094)),
+    ('load_attr_name', (1, 2)),
+    ('for_iter', 14),
+]
+
+
+def test_samples_cover_every_command():
+    assert sorted(command for command, argument in SAMPLE_INSTRUCTIONS) == sorted(pykebc.ByteCompiler.COMMANDS)
+
+
+def test_instruction_buffer_round_trip():
+    buffer = pykebc.InstructionBuffer.from_instructions(SAMPLE_INSTRUCTIONS)
+    assert len(buffer) == len(SAMPLE_INSTRUCTIONS)
+    assert list(buffer) == SAMPLE_INSTRUCTIONS
+    assert [buffer[i] for i in range(len(buffer))] == SAMPLE_INSTRUCTIONS
+    assert buffer[3:7] == SAMPLE_INSTRUCTIONS[3:7]
+    assert pykebc.InstructionBuffer.from_instructions(buffer) is buffer
+
+
+def test_instruction_buffer_matches_instruction_words():
+    byte_compiler = pykebc.ByteCompiler()
+    buffer = pykebc.InstructionBuffer.from_instructions(SAMPLE_INSTRUCTIONS)
+    # An instruction word is the opcode in the most significant byte and the 24-bit argument
+    words = b''
+    for command, argument in SAMPLE_INSTRUCTIONS:
+        opcode, encode_argument = pykebc.ByteCompiler.ENCODING[command]
+        words += ((opcode << 24) | encode_argument(argument)).to_bytes(4, 'big')
+    assert bytes(byte_compiler.instructions(buffer)) == words
+    assert bytes(byte_compiler.instructions(SAMPLE_INSTRUCTIONS)) == words
+
+
+def test_instruction_buffer_editing():
+    buffer = pykebc.InstructionBuffer.from_instructions(SAMPLE_INSTRUCTIONS)
+    copy = buffer.copy()
+    assert copy.key() == buffer.key()
+    copy[0] = ('load_fast', 1)
+    assert copy[0] == ('load_fast', 1)
+    assert buffer[0] == ('nop', None)
+    assert copy.key() != buffer.key()
+
+    cjump = SAMPLE_INSTRUCTIONS.index(('cjump', (False, True, 2**22 - 1)))
+    assert buffer.get_address(cjump) == 2**22 - 1
+    buffer.set_address(cjump, 3)
+    assert buffer[cjump] == ('cjump', (False, True, 3))
+
+
+def test_instruction_buffer_remove_fixes_addresses():
+    buffer = pykebc.InstructionBuffer.from_instructions([
+        ('jump', 3),
+        ('nop', None),
+        ('finally', (True, 2)),
+        ('cjump', (True, False, 4)),
+        ('return', None),
+    ])
+    assert list(buffer.remove({1, 2})) == [
+        ('jump', 1),
+        ('cjump', (True, False, 2)),
+        ('return', None),
+    ]
+
+
+def test_code_instructions_are_buffers():
+    code = pykebc.Code()
+    label = code.new_label()
+    code.add('jump', label)
+    code.add_label(label)
+    code.add_const(None)
+    code.add('return', None)
+    # Before linking, jumps show their labels
+    assert code.instructions == [('jump', label), ('load_const', 0), ('return', None)]
+    linked = code.link()
+    assert isinstance(linked.buffer, pykebc.InstructionBuffer)
+    assert list(linked.instructions) == [('jump', 1), ('load_const', 0), ('return', None)]
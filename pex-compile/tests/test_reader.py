@@ -0,0 +1,47 @@
+import pytest
+
+from pex_compile import writer as pex_writer
+from pex_compile.reader import Reader
+
+
+VALUES = [0, 1, 63, 64, 127, 128, 300, 2**31, 2**64 + 5]
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_uvarint_round_trip(value):
+    reader = Reader(pex_writer.encode_uvarint(value) + b'rest')
+    assert reader.read_uvarint() == value
+    assert reader.read(4) == b'rest'
+
+
+@pytest.mark.parametrize('value', VALUES + [-value for value in VALUES])
+def test_svarint_round_trip(value):
+    reader = Reader(pex_writer.encode_svarint(value))
+    assert reader.read_svarint() == value
+    assert reader.bytes_left() == 0
+
+
+def test_padded_uvarint():
+    assert Reader(pex_writer.encode_uvarint(5, 5)).read_uvarint() == 5
+
+
+def test_fixed_width_numbers():
+    writer = pex_writer.Writer()
+    writer.write_uint(258, 2)
+    writer.write_uint(7)
+    writer.write((-3).to_bytes(4, 'big', signed=True))
+    reader = Reader(bytes(writer.output))
+    assert reader.read_uint(2) == 258
+    assert reader.read_uint() == 7
+    assert reader.read_int(4) == -3
+
+
+def test_eof_leaves_the_reader_unchanged():
+    reader = Reader(b'\x01\x80\x80')
+    reader.skip(1)
+    with pytest.raises(EOFError):
+        reader.read_uvarint()
+    with pytest.raises(EOFError):
+        reader.read(3)
+    assert reader.tell() == 1
+    assert reader.read(2) == b'\x80\x80'
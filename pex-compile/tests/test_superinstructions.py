@@ -0,0 +1,92 @@
+from pex_compile import pykebc
+from pex_compile import superinstructions
+from pex_compile import vm
+
+
+def test_patterns_are_fused():
+    instructions = (
+        ('load_fast', 0),
+        ('load_fast', 1),
+        ('binop', '+'),
+        ('name', ('load', 2)),
+        ('attribute', ('get', 3)),
+        ('load_fast', 1),
+        ('attribute', ('get', 4)),
+        ('load_const', 5),
+        ('binop', '*'),
+        ('return', None),
+    )
+    fused, lines = superinstructions.fuse_instructions(instructions, tuple(range(10)))
+    assert fused == (
+        ('binop_fast', ('+', 0, 1)),
+        ('load_attr_name', (2, 3)),
+        ('load_attr_fast', (1, 4)),
+        ('binop_const', ('*', 5)),
+        ('return', None),
+    )
+    assert lines == (0, 3, 5, 7, 9)
+
+
+def test_jump_targets_are_not_fused_away():
+    instructions = (
+        ('jump', 2),
+        ('load_const', 0),
+        ('binop', '+'),
+        ('load_const', 0),
+        ('binop', '+'),
+        ('return', None),
+    )
+    fused, lines = superinstructions.fuse_instructions(instructions)
+    assert fused == (
+        ('jump', 2),
+        ('load_const', 0),
+        ('binop', '+'),
+        ('binop_const', ('+', 0)),
+        ('return', None),
+    )
+
+
+def test_large_arguments_are_not_fused():
+    instructions = (
+        ('load_fast', 2**9),
+        ('load_fast', 0),
+        ('binop', '+'),
+        ('name', ('load', 2**12)),
+        ('attribute', ('get', 0)),
+    )
+    fused, lines = superinstructions.fuse_instructions(instructions)
+    assert fused == instructions
+
+
+def test_superinstructions_are_encoded():
+    instructions = (
+        ('binop_fast', ('-', 3, 511)),
+        ('load_attr_name', (4095, 1)),
+        ('load_attr_fast', (2, 4095)),
+        ('binop_const', ('**', 2**19 - 1)),
+    )
+    buffer = pykebc.InstructionBuffer.from_instructions(instructions)
+    assert tuple(buffer) == instructions
+    assert len(pykebc.ByteCompiler().instructions(buffer)) == 4 * len(instructions)
+
+
+def test_fused_program_behaves_the_same():
+    source = '\n'.join([
+        'class Point(object):',
+        '    pass',
+        'def f(p, n):',
+        '    total = 0',
+        '    i = 0',
+        '    while i < n:',
+        '        total = total + i * p.x',
+        '        i = i + 1',
+        '    return total - n',
+        'p = Point()',
+        'p.x = 2',
+        'print(f(p, 5))',
+    ])
+    output, count = vm.run(source)
+    optimized_output, optimized_count = vm.run(source, optimize=True)
+    assert output == '15\n'
+    assert optimized_output == output
+    assert optimized_count < count
@@ -0,0 +1,86 @@
+import io
+
+import pytest
+
+from pex_compile import writer as pex_writer
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (0, b'\x00'),
+    (1, b'\x01'),
+    (127, b'\x7f'),
+    (128, b'\x80\x01'),
+    (300, b'\xac\x02'),
+    (2**32, b'\x80\x80\x80\x80\x10'),
+])
+def test_encode_uvarint(value, encoded):
+    assert pex_writer.encode_uvarint(value) == encoded
+
+
+def test_encode_uvarint_padded():
+    assert pex_writer.encode_uvarint(1, 3) == b'\x81\x80\x00'
+    assert pex_writer.encode_uvarint(300, 5) == b'\xac\x82\x80\x80\x00'
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (0, b'\x00'),
+    (1, b'\x01'),
+    (-1, b'\x7f'),
+    (63, b'\x3f'),
+    (64, b'\xc0\x00'),
+    (-64, b'\x40'),
+    (-65, b'\xbf\x7f'),
+    (-123456, b'\xc0\xbb\x78'),
+])
+def test_encode_svarint(value, encoded):
+    assert pex_writer.encode_svarint(value) == encoded
+
+
+def test_lengths_are_patched_in_place():
+    writer = pex_writer.Writer()
+    position = writer.begin_length()
+    writer.write(b'abc')
+    varint_position = writer.begin_varint_length()
+    writer.write(b'de')
+    writer.end_varint_length(varint_position)
+    writer.end_length(position)
+    assert bytes(writer.output) == (
+        b'\x00\x00\x00\x00\x00\x00\x00\x0a' + b'abc' + b'\x82\x80\x80\x80\x00' + b'de'
+    )
+
+
+def test_file_output_matches_buffer_output():
+    def write(writer):
+        writer.write_uint(7, 4)
+        position = writer.begin_length()
+        writer.write_uvarint(300)
+        writer.align(8)
+        writer.end_length(position)
+
+    buffer_writer = pex_writer.Writer()
+    write(buffer_writer)
+    file = io.BytesIO()
+    file.write(b'prefix')
+    file_writer = pex_writer.Writer(file)
+    write(file_writer)
+    assert file.getvalue() == b'prefix' + bytes(buffer_writer.output)
+    assert file_writer.tell() == len(file.getvalue())
+
+
+def test_alignment_is_relative_to_the_origin():
+    file = io.BytesIO(b'xyz')
+    file.seek(3)
+    writer = pex_writer.Writer(file)
+    writer.write(b'a')
+    assert writer.padding_size(4) == 3
+    assert writer.padding_size(4, offset=2) == 1
+
+
+@pytest.mark.parametrize('output', [None, io.BytesIO()], ids=['buffer', 'file'])
+def test_read_back(output):
+    writer = pex_writer.Writer(output)
+    writer.write(b'abc')
+    writer.write(b'def')
+    assert writer.read(2, 3) == b'cde'
+    writer.write(b'g')
+    assert writer.read(0, 7) == b'abcdefg'
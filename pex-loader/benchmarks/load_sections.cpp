@@ -0,0 +1,67 @@
+#include <pex_loader/pex_loader.hpp>
+
+#include <algorithm>
+#include <chrono>
+#include <cstdint>
+#include <fstream>
+#include <iostream>
+#include <stdexcept>
+#include <string>
+
+
+// Time to load (and decompress) all sections of PEX images with v0::StreamLoader
+//
+// Usage: load_sections [--repeat N] image...
+//
+// Prints one tab-separated line per image: file name, number of loaded bytes and the best
+// time over N runs (20 by default) in milliseconds
+
+
+namespace
+{
+    double load_all_sections(const std::string& path, uint64_t& loaded_size)
+    {
+        auto start = std::chrono::steady_clock::now();
+        std::ifstream input(path, std::ios::binary);
+        if (!input) {
+            throw std::runtime_error("Cannot open " + path);
+        }
+        pex::loader::v0::StreamLoader loader(input);
+        loaded_size = 0;
+        for (const auto& section : loader.get_sections()) {
+            loaded_size += loader.load_section(section).size();
+        }
+        auto elapsed = std::chrono::steady_clock::now() - start;
+        return std::chrono::duration<double, std::milli>(elapsed).count();
+    }
+}
+
+
+int main(int argc, char** argv)
+{
+    int repeat = 20;
+    int first_image = 1;
+    if (argc > 2 && std::string(argv[1]) == "--repeat") {
+        repeat = std::max(1, std::stoi(argv[2]));
+        first_image = 3;
+    }
+    if (first_image >= argc) {
+        std::cerr << "Usage: " << argv[0] << " [--repeat N] image...\n";
+        return 2;
+    }
+
+    try {
+        for (int i = first_image; i < argc; ++i) {
+            uint64_t loaded_size = 0;
+            double best = load_all_sections(argv[i], loaded_size);
+            for (int run = 1; run < repeat; ++run) {
+                best = std::min(best, load_all_sections(argv[i], loaded_size));
+            }
+            std::cout << argv[i] << '\t' << loaded_size << '\t' << best << '\n';
+        }
+    } catch (const std::exception& e) {
+        std::cerr << e.what() << '\n';
+        return 1;
+    }
+    return 0;
+}
@@ -5,6 +5,7 @@
 #include <stdexcept>
 #include <string>
 #include <string_view>
+#include <type_traits>
 #include <utility>
 
 
@@ -63,6 +64,90 @@ public:
         return value;
     }
 
+    /// Read an unsigned LEB128 integer (7 bits per byte, least significant group first)
+    /// @throws DataReader::EofError if the data ends inside the integer
+    /// @throws std::overflow_error if the value does not fit into Uint
+    ///
+    /// Exception safety: strong guarantee: if an exception is thrown, DataReader object is unchanged
+    template <typename Uint>
+    Uint read_uvarint()
+    {
+        static_assert(std::is_integral_v<Uint>);
+        static_assert(std::is_unsigned_v<Uint>);
+
+        Uint value = 0;
+        size_t shift = 0;
+        for (size_t position = offset; ; ++position) {
+            if (position >= data.size()) {
+                throw EofError("not enough data to read a varint");
+            }
+            auto byte = static_cast<uint8_t>(data[position]);
+            auto bits = Uint(byte & 0x7Fu);
+            // Redundant continuation bytes (zero groups) are allowed past the width of Uint
+            auto overflows = shift >= sizeof(Uint) * 8 || (shift > 0 && (bits >> (sizeof(Uint) * 8 - shift)) != 0);
+            if (bits != 0 && overflows) {
+                throw std::overflow_error("varint does not fit into a " + std::to_string(sizeof(Uint) * 8) + "-bit integer");
+            }
+            if (shift < sizeof(Uint) * 8) {
+                value |= Uint(bits << shift);
+            }
+            shift += 7;
+            if ((byte & 0x80u) == 0) {
+                offset = position + 1;
+                return value;
+            }
+        }
+    }
+
+    /// Read a signed LEB128 integer (like read_uvarint, bit 6 of the last byte is the sign)
+    /// @throws DataReader::EofError if the data ends inside the integer
+    /// @throws std::overflow_error if the value does not fit into Int
+    ///
+    /// Exception safety: strong guarantee: if an exception is thrown, DataReader object is unchanged
+    template <typename Int>
+    Int read_svarint()
+    {
+        static_assert(std::is_integral_v<Int>);
+        static_assert(std::is_signed_v<Int>);
+        using Uint = std::make_unsigned_t<Int>;
+        constexpr size_t width = sizeof(Int) * 8;
+        constexpr size_t max_size = (width + 6) / 7;
+
+        // Decoded in 64 bits and truncated to the width of Int at the end
+        uint64_t value = 0;
+        for (size_t i = 0; i < max_size; ++i) {
+            auto position = offset + i;
+            if (position >= data.size()) {
+                throw EofError("not enough data to read a varint");
+            }
+            auto byte = static_cast<uint8_t>(data[position]);
+            auto bits = uint64_t(byte & 0x7Fu);
+            auto shift = 7 * i;
+            value |= bits << shift;
+            if ((byte & 0x80u) != 0) {
+                continue;
+            }
+
+            if (shift + 7 < width) {
+                if ((bits & 0x40u) != 0) {
+                    value |= ~uint64_t(0) << (shift + 7);
+                }
+            } else {
+                // The last group reaches past the width: the bits from the sign bit of Int up
+                // have to be all zeros or all ones
+                auto sign_position = width - 1 - shift;
+                auto high_bits = bits >> sign_position;
+                auto all_ones = (uint64_t(1) << (7 - sign_position)) - 1;
+                if (high_bits != 0 && high_bits != all_ones) {
+                    throw std::overflow_error("varint does not fit into a " + std::to_string(width) + "-bit integer");
+                }
+            }
+            offset = position + 1;
+            return static_cast<Int>(static_cast<Uint>(value));
+        }
+        throw std::overflow_error("varint does not fit into a " + std::to_string(width) + "-bit integer");
+    }
+
     /// Read a sequence of byte and write it to a buffer pointed to by a forward iterator
     ///
     /// Buffer must have enough space to store `length` bytes, otherwise behavior is undefined
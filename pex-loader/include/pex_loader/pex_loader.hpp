@@ -5,6 +5,10 @@
 #include <array>
 #include <cstdint>
 #include <exception>
+#include <functional>
+#include <istream>
+#include <memory>
+#include <optional>
 #include <string>
 #include <string_view>
 #include <vector>
@@ -50,15 +54,377 @@ EarlyHeaderInfo read_early_header(const std::string_view& data);
 /// Format major version 0
 namespace v0
 {
+    /// Flags of a section directory entry (format 0.1 and later)
+    namespace section_flags
+    {
+        /// The section is not needed for execution (e.g. debug information) and may be skipped
+        constexpr uint32_t debug = 1;
+
+        /// Bits 8-15 hold the id of the codec the section is compressed with, 0 if it is stored as is.
+        /// A compressed section is the uncompressed size (u64) followed by the compressed data
+        constexpr uint32_t codec_mask = 0xFF00;
+        constexpr unsigned codec_shift = 8;
+    }
+
+    /// Ids of the built-in compression codecs
+    namespace codecs
+    {
+        constexpr uint8_t none = 0;
+        constexpr uint8_t zlib = 1;
+    }
+
     /// Section in PEX file
     struct Section
     {
         uint64_t offset;
         uint64_t size;
         std::array<char, 4> name;
+        uint32_t flags = 0;
     };
 
+    /// Read the sections of a format 0.0 file by walking over all of them
+    ///
+    /// @param data: the file contents starting at the section count
     std::vector<Section> read_sections(const std::string_view& data);
+
+    /// Read the section directory of a format 0.1 or 0.2 file
+    ///
+    /// Unlike `read_sections`, only the directory is read: section contents are not touched
+    ///
+    /// @param data: the whole file. Section offsets are relative to its beginning
+    ///
+    /// @throws LoaderError if the directory is truncated or a section lies outside of the file
+    std::vector<Section> read_section_directory(const std::string_view& data);
+
+    /// Read the section directory of a file which is not completely in memory
+    ///
+    /// @param data: the beginning of the file, at least the header and the directory
+    /// @param file_size: size of the whole file
+    std::vector<Section> read_section_directory(const std::string_view& data, uint64_t file_size);
+
+    /// Find a section by name
+    ///
+    /// @returns the first section with the given name or std::nullopt if there is no such section
+    std::optional<Section> find_section(const std::vector<Section>& sections, const std::string_view& name);
+
+    /// Entry of the symbol/export table (`syms` section)
+    struct Export
+    {
+        enum class Kind
+        {
+            variable = 0,
+            function = 1,
+            class_ = 2,
+        };
+
+        std::string name;
+        Kind kind;
+    };
+
+    /// Read the symbol/export table
+    ///
+    /// @param data: contents of the `syms` section
+    /// @param version: format version of the file. Since format 0.3 the counts are LEB128 varints
+    ///
+    /// @throws LoaderError if the kind of a symbol is invalid or the data is truncated
+    std::vector<Export> read_exports(
+        const std::string_view& data,
+        EarlyHeaderInfo::FormatVersion version = {0, 1}
+    );
+
+    /// Header of a serialized code object
+    struct CodeHeader
+    {
+        enum class CodeType
+        {
+            module = 0,
+            function = 1,
+            class_body = 2,
+        };
+
+        CodeType code_type;
+
+        /// Number of fast local variable slots. Stored since format 0.1, zero for format 0.0
+        ///
+        /// The parameters of a function occupy the first slots in declaration order (positional
+        /// ones, then keyword-only ones), so `init_function` binds argument i to slot i
+        uint64_t local_count;
+
+        /// Maximal depth the value stack can reach while executing the code object,
+        /// so a frame can preallocate its value stack in one shot. Stored since format 0.1,
+        /// zero for format 0.0
+        uint64_t max_stack_depth;
+
+        /// Number of instructions (4-byte big-endian words). In the compact format 0.3 this is
+        /// the number of 2-byte units, each `extended_arg` prefix taking one unit
+        uint64_t instruction_count;
+
+        /// Offset of the instruction stream, relative to the beginning of the code object
+        uint64_t instructions_offset;
+
+        /// Size of the instruction stream in bytes
+        uint64_t instructions_size;
+    };
+
+    /// Read the header of a code object and check that its instruction stream is present
+    ///
+    /// @param version: format version of the file. Since format 0.1 the type is followed by
+    /// the local count and the max stack depth, since format 0.2 the instruction stream
+    /// is preceded by padding, since format 0.3 the counts are LEB128 varints
+    ///
+    /// @throws LoaderError if the code type is invalid or the data is truncated
+    CodeHeader read_code_header(
+        const std::string_view& data,
+        EarlyHeaderInfo::FormatVersion version = {0, 1}
+    );
+
+    /// Constant from the constant pool (`pool` section)
+    ///
+    /// Code objects of an image with a pool refer to its constants with the `p` tag followed by
+    /// the index in the pool (u32, a LEB128 varint since format 0.3), so every pooled constant is
+    /// decoded once per image
+    struct Constant
+    {
+        enum class Type
+        {
+            integer,
+            floating_point,
+            complex,
+            string,
+            bytes,
+        };
+
+        Type type;
+
+        /// integer: the shortest big-endian two's complement representation, string: UTF-8,
+        /// bytes: the value. Empty for the other types
+        std::string data;
+
+        /// floating_point: the value, complex: the real part
+        double real = 0;
+
+        /// complex: the imaginary part
+        double imag = 0;
+    };
+
+    /// Read the constant pool
+    ///
+    /// The section holds the number of constants, then every constant as a tag and its value:
+    /// `i` integer (byte count and big-endian two's complement bytes, a signed LEB128 varint
+    /// since format 0.3), `f` float (8-byte IEEE 754 double), `c` complex (two doubles),
+    /// `u` string (length and UTF-8 bytes), `b` bytes (length and bytes). Counts and lengths
+    /// are u64, LEB128 varints since format 0.3. Doubles are stored in the byte order of the
+    /// compiling machine, which is little-endian on all supported platforms
+    ///
+    /// @param data: contents of the `pool` section
+    /// @param version: format version of the file
+    ///
+    /// @throws LoaderError if a tag is invalid or the data is truncated
+    std::vector<Constant> read_constant_pool(
+        const std::string_view& data,
+        EarlyHeaderInfo::FormatVersion version = {0, 1}
+    );
+
+    /// Decoded instruction
+    struct Instruction
+    {
+        uint8_t opcode;
+        uint32_t argument;
+    };
+
+    /// Opcode of the prefix carrying the higher bytes of an argument in the compact format 0.3
+    constexpr uint8_t extended_arg_opcode = 0xFF;
+
+    /// Decode the instruction at `offset` in an instruction stream and advance `offset` past it
+    ///
+    /// Before format 0.3 an instruction is a big-endian word: 8-bit opcode and 24-bit argument.
+    /// In format 0.3 it is a 1-byte opcode and a 1-byte argument, preceded by up to two
+    /// `extended_arg` prefixes with the higher argument bytes
+    ///
+    /// @throws LoaderError if the stream ends inside the instruction or the argument is too long
+    Instruction read_instruction(
+        const std::string_view& instructions,
+        uint64_t& offset,
+        EarlyHeaderInfo::FormatVersion version = {0, 1}
+    );
+
+    /// Source lines of a code object, from the `line` debug section
+    struct LineTable
+    {
+        struct Entry
+        {
+            /// Address of the first instruction of the line, in the units of jump addresses
+            uint64_t address;
+            uint64_t line;
+        };
+
+        /// Offset of the code object from the beginning of the `code` section
+        uint64_t code_offset;
+
+        /// Entries sorted by address. An entry covers the instructions up to the next entry
+        std::vector<Entry> entries;
+
+        /// @returns the line of the instruction at `address` or std::nullopt if it precedes the first entry
+        std::optional<uint64_t> find_line(uint64_t address) const;
+    };
+
+    /// Read the line tables of all code objects
+    ///
+    /// The section holds the number of tables, then for every code object its offset, the number
+    /// of entries and (address delta, line delta) pairs. All numbers are LEB128 varints in every
+    /// format version, line deltas are signed. Tables are sorted by code offset
+    ///
+    /// @param data: contents of the `line` section
+    ///
+    /// @throws LoaderError if the data is truncated, the tables are not sorted or a line is negative
+    std::vector<LineTable> read_line_tables(const std::string_view& data);
+
+    /// Find the line table of the code object at `code_offset` in tables returned by read_line_tables
+    ///
+    /// @returns the table or nullptr if the code object has none
+    const LineTable* find_line_table(const std::vector<LineTable>& tables, uint64_t code_offset);
+
+    /// @returns the id of the codec the section is compressed with (codecs::none if it is not compressed)
+    uint8_t get_codec(const Section& section) noexcept;
+
+    /// Incremental decompressor of a section
+    class Decoder
+    {
+    public:
+        virtual ~Decoder() = default;
+
+        /// Decompress the next chunk of compressed data and append the result to `output`
+        ///
+        /// @throws LoaderError if the data is corrupted
+        virtual void decode(const std::string_view& input, std::string& output) = 0;
+
+        /// Check that the compressed data has ended
+        ///
+        /// @throws LoaderError if the compressed data is truncated
+        virtual void finish() = 0;
+    };
+
+    using DecoderFactory = std::function<std::unique_ptr<Decoder>()>;
+
+    /// Register a decoder for a codec, replacing the previously registered one
+    ///
+    /// Thread safety: not thread safe, codecs should be registered before loading starts
+    void register_codec(uint8_t codec_id, DecoderFactory factory);
+
+    /// @throws LoaderError if no decoder is registered for the codec
+    std::unique_ptr<Decoder> create_decoder(uint8_t codec_id);
+
+    /// Get the contents of a section which is completely in memory, decompressing it if needed
+    ///
+    /// @param data: the section as stored in the file
+    ///
+    /// @throws LoaderError if the compressed data is corrupted or its size does not match
+    std::string decompress_section(const std::string_view& data, const Section& section);
+
+    /// Loader reading a PEX image from a stream section by section
+    ///
+    /// Only the header and the section directory are read upfront. Sections are read when
+    /// requested, and compressed ones are read and decompressed in chunks, so neither the whole
+    /// image nor the whole compressed form of a section has to be in memory
+    class StreamLoader
+    {
+    public:
+        static constexpr size_t default_chunk_size = 64 * 1024;
+
+        /// Read the header and the section directory
+        ///
+        /// @param input: a seekable binary stream positioned at the beginning of the image.
+        /// Must outlive the StreamLoader
+        ///
+        /// @throws LoaderError if the header or the directory is malformed
+        explicit StreamLoader(std::istream& input, size_t chunk_size = default_chunk_size);
+
+        const EarlyHeaderInfo& get_info() const noexcept;
+
+        const std::vector<Section>& get_sections() const noexcept;
+
+        /// Read a section, decompressing it if needed
+        ///
+        /// @returns the section contents or std::nullopt if there is no such section
+        std::optional<std::string> load_section(const std::string_view& name);
+
+        /// Read a section, decompressing it if needed
+        ///
+        /// @throws LoaderError if the stream ends early or the compressed data is corrupted
+        std::string load_section(const Section& section);
+
+    private:
+        std::istream& input;
+        size_t chunk_size;
+        std::istream::pos_type start;
+        EarlyHeaderInfo info;
+        std::vector<Section> sections;
+    };
+
+    /// A PEX image in memory, e.g. an mmap'ed file
+    ///
+    /// Sections and instruction streams are handed out as views into the image data, nothing is
+    /// copied. The data must outlive the Image object and all views obtained from it
+    ///
+    /// Thread safety: all methods are const, so an Image may be shared between threads
+    class Image
+    {
+    public:
+        /// @throws LoaderError if the image is malformed or its sections violate
+        /// the declared alignment
+        explicit Image(std::string_view data);
+
+        const EarlyHeaderInfo& get_info() const noexcept;
+
+        /// Alignment of sections relative to the beginning of the image (1 for format 0.1)
+        uint32_t get_section_alignment() const noexcept;
+
+        /// Alignment of instruction streams relative to the beginning of the image (1 for format 0.1)
+        uint32_t get_code_alignment() const noexcept;
+
+        const std::vector<Section>& get_sections() const noexcept;
+
+        /// Whether the image data starts at an address which is a multiple of the section
+        /// alignment, so that aligned sections and instruction streams are aligned in memory too.
+        /// This is the case for mmap'ed files as long as the alignment does not exceed the page size
+        bool is_aligned() const noexcept;
+
+        /// @returns a view of the section contents or std::nullopt if there is no such section
+        ///
+        /// @throws LoaderError if the section is compressed: such sections can't be viewed in place
+        /// and have to be decompressed with `decompress_section`
+        std::optional<std::string_view> get_section(const std::string_view& name) const;
+
+        /// Read the header of a code object stored in this image
+        ///
+        /// @param code: view of the code object, e.g. the `code` section
+        CodeHeader read_code_header(const std::string_view& code) const;
+
+        /// Read the symbol/export table of this image
+        ///
+        /// @returns the exports or an empty vector if the image has no `syms` section
+        std::vector<Export> read_exports() const;
+
+        /// Read the constant pool of this image
+        ///
+        /// @returns the constants or an empty vector if the image has no `pool` section
+        std::vector<Constant> read_constant_pool() const;
+
+        /// Read the line tables of this image
+        ///
+        /// @returns the tables or an empty vector if the image has no `line` section
+        std::vector<LineTable> read_line_tables() const;
+
+        /// @returns a view of the instruction stream of a code object
+        static std::string_view get_instructions(const std::string_view& code, const CodeHeader& header);
+
+    private:
+        std::string_view data;
+        EarlyHeaderInfo info;
+        uint32_t section_alignment = 1;
+        uint32_t code_alignment = 1;
+        std::vector<Section> sections;
+    };
 }
 
 
@@ -0,0 +1,136 @@
+#include <pex_loader/pex_loader.hpp>
+
+#include <zlib.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <map>
+
+
+namespace pex::loader::v0
+{
+
+namespace
+{
+    class ZlibDecoder : public Decoder
+    {
+    public:
+        ZlibDecoder()
+        {
+            if (inflateInit(&stream) != Z_OK) {
+                throw LoaderError("Cannot initialize zlib decoder");
+            }
+        }
+
+        ~ZlibDecoder() override
+        {
+            inflateEnd(&stream);
+        }
+
+        ZlibDecoder(const ZlibDecoder&) = delete;
+        ZlibDecoder& operator=(const ZlibDecoder&) = delete;
+
+        void decode(const std::string_view& input, std::string& output) override
+        {
+            if (finished) {
+                if (!input.empty()) {
+                    throw LoaderError("Invalid zlib stream: trailing data");
+                }
+                return;
+            }
+
+            stream.next_in = reinterpret_cast<Bytef*>(const_cast<char*>(input.data()));
+            stream.avail_in = static_cast<uInt>(input.size());
+            // A full output buffer may mean that more output is pending, so keep inflating
+            // until zlib leaves some of the buffer unused
+            do {
+                char buffer[16 * 1024];
+                stream.next_out = reinterpret_cast<Bytef*>(buffer);
+                stream.avail_out = sizeof(buffer);
+                auto status = inflate(&stream, Z_NO_FLUSH);
+                if (status == Z_STREAM_END) {
+                    finished = true;
+                } else if (status != Z_OK && status != Z_BUF_ERROR) {
+                    throw LoaderError(
+                        std::string("Invalid zlib stream: ")
+                        + (stream.msg != nullptr ? stream.msg : "error " + std::to_string(status))
+                    );
+                }
+                output.append(buffer, sizeof(buffer) - stream.avail_out);
+            } while (!finished && stream.avail_out == 0);
+
+            if (finished && stream.avail_in != 0) {
+                throw LoaderError("Invalid zlib stream: trailing data");
+            }
+        }
+
+        void finish() override
+        {
+            if (!finished) {
+                throw LoaderError("Invalid zlib stream: unexpected end of data");
+            }
+        }
+
+    private:
+        z_stream stream = {};
+        bool finished = false;
+    };
+
+
+    std::map<uint8_t, DecoderFactory>& get_codec_registry()
+    {
+        static std::map<uint8_t, DecoderFactory> registry = {
+            {codecs::zlib, []() { return std::make_unique<ZlibDecoder>(); }},
+        };
+        return registry;
+    }
+}
+
+
+uint8_t get_codec(const Section& section) noexcept
+{
+    return static_cast<uint8_t>((section.flags & section_flags::codec_mask) >> section_flags::codec_shift);
+}
+
+
+void register_codec(uint8_t codec_id, DecoderFactory factory)
+{
+    get_codec_registry()[codec_id] = std::move(factory);
+}
+
+
+std::unique_ptr<Decoder> create_decoder(uint8_t codec_id)
+{
+    const auto& registry = get_codec_registry();
+    auto it = registry.find(codec_id);
+    if (it == registry.end()) {
+        throw LoaderError("Unsupported compression codec: " + std::to_string(static_cast<unsigned int>(codec_id)));
+    }
+    return it->second();
+}
+
+
+std::string decompress_section(const std::string_view& data, const Section& section)
+{
+    auto codec_id = get_codec(section);
+    if (codec_id == codecs::none) {
+        return std::string(data);
+    }
+    if (data.size() < 8) {
+        throw LoaderError("Unexpected EOF while reading compressed section size");
+    }
+    auto uncompressed_size = pex::util::read_uint<uint64_t>(data);
+
+    auto decoder = create_decoder(codec_id);
+    std::string output;
+    // The declared size is not trusted for the allocation, it is only checked in the end
+    output.reserve(std::min<uint64_t>(uncompressed_size, 16 * data.size()));
+    decoder->decode(data.substr(8), output);
+    decoder->finish();
+    if (output.size() != uncompressed_size) {
+        throw LoaderError("Decompressed section size does not match the declared size");
+    }
+    return output;
+}
+
+}
@@ -0,0 +1,139 @@
+#include <pex_loader/pex_loader.hpp>
+#include <pex_loader/read_uint.hpp>
+
+#include <cstdint>
+
+
+namespace pex::loader::v0
+{
+
+namespace
+{
+    bool is_valid_alignment(uint32_t alignment)
+    {
+        return alignment != 0 && (alignment & (alignment - 1)) == 0;
+    }
+}
+
+
+Image::Image(std::string_view data):
+    data(data),
+    info(read_early_header(data))
+{
+    if (info.format_version.major != 0 || info.format_version.minor < 1 || info.format_version.minor > 3) {
+        throw LoaderError(
+            "Unsupported format version: "
+            + std::to_string(info.format_version.major) + "." + std::to_string(info.format_version.minor)
+        );
+    }
+
+    sections = read_section_directory(data);
+
+    if (info.format_version.minor >= 2) {
+        // read_section_directory has already checked that the header is complete
+        section_alignment = pex::util::read_uint<uint32_t>(data.substr(16));
+        code_alignment = pex::util::read_uint<uint32_t>(data.substr(20));
+    }
+    if (!is_valid_alignment(section_alignment) || !is_valid_alignment(code_alignment)) {
+        throw LoaderError("Invalid alignment: must be a power of two");
+    }
+
+    for (const auto& section : sections) {
+        if (section.offset % section_alignment != 0) {
+            throw LoaderError(
+                "Section '" + std::string(section.name.begin(), section.name.end())
+                + "' is not aligned to " + std::to_string(section_alignment) + " bytes"
+            );
+        }
+    }
+}
+
+
+const EarlyHeaderInfo& Image::get_info() const noexcept
+{
+    return info;
+}
+
+
+uint32_t Image::get_section_alignment() const noexcept
+{
+    return section_alignment;
+}
+
+
+uint32_t Image::get_code_alignment() const noexcept
+{
+    return code_alignment;
+}
+
+
+const std::vector<Section>& Image::get_sections() const noexcept
+{
+    return sections;
+}
+
+
+bool Image::is_aligned() const noexcept
+{
+    return reinterpret_cast<uintptr_t>(data.data()) % section_alignment == 0;
+}
+
+
+std::optional<std::string_view> Image::get_section(const std::string_view& name) const
+{
+    auto section = find_section(sections, name);
+    if (!section.has_value()) {
+        return std::nullopt;
+    }
+    if (get_codec(*section) != codecs::none) {
+        throw LoaderError(
+            "Section '" + std::string(section->name.begin(), section->name.end())
+            + "' is compressed and can't be viewed in place"
+        );
+    }
+    return data.substr(section->offset, section->size);
+}
+
+
+CodeHeader Image::read_code_header(const std::string_view& code) const
+{
+    return v0::read_code_header(code, info.format_version);
+}
+
+
+std::vector<Export> Image::read_exports() const
+{
+    auto section = get_section("syms");
+    if (!section.has_value()) {
+        return {};
+    }
+    return v0::read_exports(*section, info.format_version);
+}
+
+
+std::vector<Constant> Image::read_constant_pool() const
+{
+    auto section = get_section("pool");
+    if (!section.has_value()) {
+        return {};
+    }
+    return v0::read_constant_pool(*section, info.format_version);
+}
+
+
+std::vector<LineTable> Image::read_line_tables() const
+{
+    auto section = get_section("line");
+    if (!section.has_value()) {
+        return {};
+    }
+    return v0::read_line_tables(*section);
+}
+
+
+std::string_view Image::get_instructions(const std::string_view& code, const CodeHeader& header)
+{
+    return code.substr(header.instructions_offset, header.instructions_size);
+}
+
+}
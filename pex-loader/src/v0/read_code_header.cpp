@@ -0,0 +1,77 @@
+#include <pex_loader/data_reader.hpp>
+#include <pex_loader/pex_loader.hpp>
+
+#include <cstdint>
+#include <limits>
+
+
+namespace pex::loader::v0
+{
+
+CodeHeader read_code_header(const std::string_view& data, EarlyHeaderInfo::FormatVersion version)
+{
+    pex::util::DataReader r(data);
+    CodeHeader header;
+
+    try {
+        auto encoded_code_type = r.read_uint<uint8_t>();
+        switch (encoded_code_type) {
+            case 0: {
+                header.code_type = CodeHeader::CodeType::module;
+                break;
+            }
+            case 1: {
+                header.code_type = CodeHeader::CodeType::function;
+                break;
+            }
+            case 2: {
+                header.code_type = CodeHeader::CodeType::class_body;
+                break;
+            }
+            default: {
+                throw LoaderError(
+                    "Invalid code object type: "
+                    + std::to_string(static_cast<unsigned int>(encoded_code_type))
+                );
+            }
+        }
+
+        uint64_t instruction_size = 4;
+        if (version.minor >= 3) {
+            header.local_count = r.read_uvarint<uint64_t>();
+            header.max_stack_depth = r.read_uvarint<uint64_t>();
+            header.instruction_count = r.read_uvarint<uint64_t>();
+            auto padding = r.read_uvarint<uint64_t>();
+            r.skip(padding);
+            instruction_size = 2;
+        } else if (version.minor == 0) {
+            // The code objects of format 0.0 don't store the local count and the stack depth
+            header.local_count = 0;
+            header.max_stack_depth = 0;
+            header.instruction_count = r.read_uint<uint64_t>();
+        } else {
+            header.local_count = r.read_uint<uint64_t>();
+            header.max_stack_depth = r.read_uint<uint64_t>();
+            header.instruction_count = r.read_uint<uint64_t>();
+            if (version.minor >= 2) {
+                auto padding = r.read_uint<uint32_t>();
+                r.skip(padding);
+            }
+        }
+        header.instructions_offset = r.get_offset();
+
+        if (header.instruction_count > std::numeric_limits<uint64_t>::max() / instruction_size) {
+            throw LoaderError("Invalid instruction count: " + std::to_string(header.instruction_count));
+        }
+        header.instructions_size = header.instruction_count * instruction_size;
+        r.skip(header.instructions_size);
+    } catch (const pex::util::DataReader::EofError& e) {
+        throw LoaderError(std::string("Unexpected EOF while reading code object header: ") + e.what());
+    } catch (const std::overflow_error& e) {
+        throw LoaderError(std::string("Invalid code object header: ") + e.what());
+    }
+
+    return header;
+}
+
+}
@@ -0,0 +1,148 @@
+#include <pex_loader/data_reader.hpp>
+#include <pex_loader/pex_loader.hpp>
+
+#include <cstdint>
+#include <cstring>
+
+
+namespace pex::loader::v0
+{
+
+namespace
+{
+    double read_double(pex::util::DataReader& r)
+    {
+        char bytes[sizeof(double)];
+        r.read_bytes(sizeof(bytes), bytes);
+        double value;
+        std::memcpy(&value, bytes, sizeof(value));
+        return value;
+    }
+
+    /// Drop the leading bytes of a big-endian two's complement integer which only repeat the sign
+    /// of the byte after them
+    std::string shorten_integer(const std::string& bytes)
+    {
+        size_t start = 0;
+        while (start + 1 < bytes.size()) {
+            auto byte = static_cast<uint8_t>(bytes[start]);
+            auto next_is_negative = (static_cast<uint8_t>(bytes[start + 1]) & 0x80u) != 0;
+            if (!((byte == 0x00 && !next_is_negative) || (byte == 0xFF && next_is_negative))) {
+                break;
+            }
+            ++start;
+        }
+        return bytes.substr(start);
+    }
+
+    /// Read a signed LEB128 integer of any size into big-endian two's complement bytes
+    std::string read_svarint_bytes(pex::util::DataReader& r)
+    {
+        // Collected least significant byte first
+        std::string bytes;
+        uint32_t bits = 0;
+        unsigned bit_count = 0;
+        uint8_t byte;
+        do {
+            byte = r.read_uint<uint8_t>();
+            bits |= uint32_t(byte & 0x7Fu) << bit_count;
+            bit_count += 7;
+            if (bit_count >= 8) {
+                bytes.push_back(static_cast<char>(bits & 0xFFu));
+                bits >>= 8;
+                bit_count -= 8;
+            }
+        } while ((byte & 0x80u) != 0);
+        // Bit 6 of the last group is the sign
+        if ((byte & 0x40u) != 0) {
+            bits |= ~uint32_t(0) << bit_count;
+        }
+        bytes.push_back(static_cast<char>(bits & 0xFFu));
+        return std::string(bytes.rbegin(), bytes.rend());
+    }
+}
+
+
+std::vector<Constant> read_constant_pool(const std::string_view& data, EarlyHeaderInfo::FormatVersion version)
+{
+    pex::util::DataReader r(data);
+    std::vector<Constant> constants;
+
+    try {
+        auto read_count = [&r, &version]() {
+            return version.minor >= 3 ? r.read_uvarint<uint64_t>() : r.read_uint<uint64_t>();
+        };
+        auto read_data = [&r, &read_count](std::string& data) {
+            auto length = read_count();
+            if (length > r.get_number_of_bytes_left()) {
+                throw pex::util::DataReader::EofError("cannot read " + std::to_string(length) + " bytes");
+            }
+            data.resize(length);
+            r.read_bytes(length, data.begin());
+        };
+
+        auto constant_count = read_count();
+        // Every constant takes at least 9 bytes (tag and length or value), 2 bytes in format 0.3
+        auto min_constant_size = version.minor >= 3 ? 2 : 9;
+        if (constant_count > r.get_number_of_bytes_left() / min_constant_size) {
+            throw LoaderError("Invalid constant count: " + std::to_string(constant_count));
+        }
+        constants.reserve(constant_count);
+
+        for (decltype(constant_count) i = 0; i < constant_count; ++i) {
+            Constant constant;
+            auto tag = r.read_uint<uint8_t>();
+            switch (tag) {
+                case 'i': {
+                    constant.type = Constant::Type::integer;
+                    if (version.minor >= 3) {
+                        constant.data = read_svarint_bytes(r);
+                    } else {
+                        read_data(constant.data);
+                        if (constant.data.empty()) {
+                            throw LoaderError("Invalid integer constant: no bytes");
+                        }
+                    }
+                    constant.data = shorten_integer(constant.data);
+                    break;
+                }
+                case 'f': {
+                    constant.type = Constant::Type::floating_point;
+                    constant.real = read_double(r);
+                    break;
+                }
+                case 'c': {
+                    constant.type = Constant::Type::complex;
+                    constant.real = read_double(r);
+                    constant.imag = read_double(r);
+                    break;
+                }
+                case 'u': {
+                    constant.type = Constant::Type::string;
+                    read_data(constant.data);
+                    break;
+                }
+                case 'b': {
+                    constant.type = Constant::Type::bytes;
+                    read_data(constant.data);
+                    break;
+                }
+                default: {
+                    throw LoaderError(
+                        "Invalid constant tag: "
+                        + std::to_string(static_cast<unsigned int>(tag))
+                    );
+                }
+            }
+            constants.push_back(std::move(constant));
+        }
+    } catch (const pex::util::DataReader::EofError& e) {
+        throw LoaderError(std::string("Unexpected EOF while reading constant pool: ") + e.what());
+    } catch (const std::overflow_error& e) {
+        throw LoaderError(std::string("Invalid constant pool: ") + e.what());
+    }
+
+    return constants;
+}
+
+}
@@ -0,0 +1,69 @@
+#include <pex_loader/data_reader.hpp>
+#include <pex_loader/pex_loader.hpp>
+
+#include <cstdint>
+
+
+namespace pex::loader::v0
+{
+
+std::vector<Export> read_exports(const std::string_view& data, EarlyHeaderInfo::FormatVersion version)
+{
+    pex::util::DataReader r(data);
+    std::vector<Export> exports;
+
+    try {
+        auto read_count = [&r, &version]() {
+            return version.minor >= 3 ? r.read_uvarint<uint64_t>() : r.read_uint<uint64_t>();
+        };
+
+        auto export_count = read_count();
+        // Every entry takes at least 9 bytes (name length and kind), 2 bytes in format 0.3
+        auto min_entry_size = version.minor >= 3 ? 2 : 9;
+        if (export_count > r.get_number_of_bytes_left() / min_entry_size) {
+            throw LoaderError("Invalid export count: " + std::to_string(export_count));
+        }
+        exports.reserve(export_count);
+
+        for (decltype(export_count) i = 0; i < export_count; ++i) {
+            Export entry;
+            auto name_length = read_count();
+            if (name_length > r.get_number_of_bytes_left()) {
+                throw pex::util::DataReader::EofError("cannot read a " + std::to_string(name_length) + "-byte name");
+            }
+            entry.name.resize(name_length);
+            r.read_bytes(name_length, entry.name.begin());
+
+            auto encoded_kind = r.read_uint<uint8_t>();
+            switch (encoded_kind) {
+                case 0: {
+                    entry.kind = Export::Kind::variable;
+                    break;
+                }
+                case 1: {
+                    entry.kind = Export::Kind::function;
+                    break;
+                }
+                case 2: {
+                    entry.kind = Export::Kind::class_;
+                    break;
+                }
+                default: {
+                    throw LoaderError(
+                        "Invalid export kind: "
+                        + std::to_string(static_cast<unsigned int>(encoded_kind))
+                    );
+                }
+            }
+            exports.push_back(std::move(entry));
+        }
+    } catch (const pex::util::DataReader::EofError& e) {
+        throw LoaderError(std::string("Unexpected EOF while reading export table: ") + e.what());
+    } catch (const std::overflow_error& e) {
+        throw LoaderError(std::string("Invalid export table: ") + e.what());
+    }
+
+    return exports;
+}
+
+}
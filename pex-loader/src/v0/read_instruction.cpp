@@ -0,0 +1,45 @@
+#include <pex_loader/pex_loader.hpp>
+#include <pex_loader/read_uint.hpp>
+
+#include <cstdint>
+
+
+namespace pex::loader::v0
+{
+
+Instruction read_instruction(
+    const std::string_view& instructions,
+    uint64_t& offset,
+    EarlyHeaderInfo::FormatVersion version
+)
+{
+    if (version.minor < 3) {
+        if (offset > instructions.size() || instructions.size() - offset < 4) {
+            throw LoaderError("Unexpected EOF while reading instruction");
+        }
+        auto word = pex::util::read_uint<uint32_t>(instructions.substr(offset));
+        offset += 4;
+        return Instruction{uint8_t(word >> 24), word & 0xFF'FFFFu};
+    }
+
+    // The argument is 24-bit at most, so at most two prefixes are allowed
+    uint32_t argument = 0;
+    auto position = offset;
+    for (int prefix_count = 0; ; ++prefix_count) {
+        if (position > instructions.size() || instructions.size() - position < 2) {
+            throw LoaderError("Unexpected EOF while reading instruction");
+        }
+        auto opcode = static_cast<uint8_t>(instructions[position]);
+        argument = (argument << 8) | static_cast<uint8_t>(instructions[position + 1]);
+        position += 2;
+        if (opcode != extended_arg_opcode) {
+            offset = position;
+            return Instruction{opcode, argument};
+        }
+        if (prefix_count == 2) {
+            throw LoaderError("Too many extended_arg prefixes");
+        }
+    }
+}
+
+}
@@ -0,0 +1,95 @@
+#include <pex_loader/data_reader.hpp>
+#include <pex_loader/pex_loader.hpp>
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+
+
+namespace pex::loader::v0
+{
+
+std::optional<uint64_t> LineTable::find_line(uint64_t address) const
+{
+    // The first entry which starts after the address is right past the one covering it
+    auto entry = std::upper_bound(
+        entries.begin(),
+        entries.end(),
+        address,
+        [](uint64_t address, const Entry& entry) { return address < entry.address; }
+    );
+    if (entry == entries.begin()) {
+        return std::nullopt;
+    }
+    return std::prev(entry)->line;
+}
+
+std::vector<LineTable> read_line_tables(const std::string_view& data)
+{
+    pex::util::DataReader r(data);
+    std::vector<LineTable> tables;
+
+    try {
+        auto table_count = r.read_uvarint<uint64_t>();
+        // Every table takes at least 2 bytes (code offset and entry count)
+        if (table_count > r.get_number_of_bytes_left() / 2) {
+            throw LoaderError("Invalid line table count: " + std::to_string(table_count));
+        }
+        tables.reserve(table_count);
+
+        for (decltype(table_count) i = 0; i < table_count; ++i) {
+            LineTable table;
+            table.code_offset = r.read_uvarint<uint64_t>();
+            if (!tables.empty() && table.code_offset <= tables.back().code_offset) {
+                throw LoaderError("Line tables are not sorted by code offset");
+            }
+
+            auto entry_count = r.read_uvarint<uint64_t>();
+            // Every entry takes at least 2 bytes (address delta and line delta)
+            if (entry_count > r.get_number_of_bytes_left() / 2) {
+                throw LoaderError("Invalid line table entry count: " + std::to_string(entry_count));
+            }
+            table.entries.reserve(entry_count);
+
+            uint64_t address = 0;
+            int64_t line = 0;
+            for (decltype(entry_count) j = 0; j < entry_count; ++j) {
+                auto address_delta = r.read_uvarint<uint64_t>();
+                auto line_delta = r.read_svarint<int64_t>();
+                if (address_delta > std::numeric_limits<uint64_t>::max() - address) {
+                    throw LoaderError("Line table address is out of range");
+                }
+                address += address_delta;
+                // `line` is never negative, so adding a delta can only overflow upwards
+                if (line_delta > std::numeric_limits<int64_t>::max() - line || line + line_delta < 0) {
+                    throw LoaderError("Line number is out of range");
+                }
+                line += line_delta;
+                table.entries.push_back({address, static_cast<uint64_t>(line)});
+            }
+            tables.push_back(std::move(table));
+        }
+    } catch (const pex::util::DataReader::EofError& e) {
+        throw LoaderError(std::string("Unexpected EOF while reading line tables: ") + e.what());
+    } catch (const std::overflow_error& e) {
+        throw LoaderError(std::string("Invalid line tables: ") + e.what());
+    }
+
+    return tables;
+}
+
+const LineTable* find_line_table(const std::vector<LineTable>& tables, uint64_t code_offset)
+{
+    auto table = std::lower_bound(
+        tables.begin(),
+        tables.end(),
+        code_offset,
+        [](const LineTable& table, uint64_t code_offset) { return table.code_offset < code_offset; }
+    );
+    if (table == tables.end() || table->code_offset != code_offset) {
+        return nullptr;
+    }
+    return &*table;
+}
+
+}
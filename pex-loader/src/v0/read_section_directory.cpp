@@ -0,0 +1,81 @@
+#include <pex_loader/data_reader.hpp>
+#include <pex_loader/pex_loader.hpp>
+
+#include <algorithm>
+#include <cstdint>
+
+
+namespace pex::loader::v0
+{
+
+namespace
+{
+    constexpr size_t directory_entry_size = 24;
+}
+
+
+std::vector<Section> read_section_directory(const std::string_view& data)
+{
+    return read_section_directory(data, data.size());
+}
+
+
+std::vector<Section> read_section_directory(const std::string_view& data, uint64_t file_size)
+{
+    auto info = read_early_header(data);
+    pex::util::DataReader r(data);
+    std::vector<Section> sections;
+
+    try {
+        r.skip(8);
+        auto section_count = r.read_uint<uint64_t>();
+        if (info.format_version.minor >= 2) {
+            // Section and code alignment
+            r.skip(8);
+        }
+        if (section_count > r.get_number_of_bytes_left() / directory_entry_size) {
+            throw LoaderError("Invalid section count: " + std::to_string(section_count));
+        }
+        sections.reserve(section_count);
+
+        for (decltype(section_count) i = 0; i < section_count; ++i) {
+            Section section;
+            r.read_bytes(4, section.name.begin());
+            section.flags = r.read_uint<uint32_t>();
+            section.offset = r.read_uint<uint64_t>();
+            section.size = r.read_uint<uint64_t>();
+            sections.push_back(section);
+        }
+    } catch (const pex::util::DataReader::EofError& e) {
+        throw LoaderError(std::string("Unexpected EOF while reading section directory: ") + e.what());
+    }
+
+    auto directory_end = r.get_offset();
+    for (const auto& section : sections) {
+        if (section.offset < directory_end
+            || section.offset > file_size
+            || section.size > file_size - section.offset)
+        {
+            throw LoaderError(
+                "Section '" + std::string(section.name.begin(), section.name.end())
+                + "' lies outside of the file"
+            );
+        }
+    }
+
+    return sections;
+}
+
+
+std::optional<Section> find_section(const std::vector<Section>& sections, const std::string_view& name)
+{
+    auto it = std::find_if(sections.begin(), sections.end(), [&name](const Section& section) {
+        return std::string_view(section.name.data(), section.name.size()) == name;
+    });
+    if (it == sections.end()) {
+        return std::nullopt;
+    }
+    return *it;
+}
+
+}
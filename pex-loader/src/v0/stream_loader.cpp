@@ -0,0 +1,103 @@
+#include <pex_loader/pex_loader.hpp>
+#include <pex_loader/read_uint.hpp>
+
+#include <algorithm>
+#include <cstdint>
+
+
+namespace pex::loader::v0
+{
+
+namespace
+{
+    std::string read_exactly(std::istream& input, uint64_t size)
+    {
+        std::string data(size, '\0');
+        if (!input.read(data.data(), static_cast<std::streamsize>(size))) {
+            throw LoaderError("Unexpected EOF while reading PEX stream");
+        }
+        return data;
+    }
+}
+
+
+StreamLoader::StreamLoader(std::istream& input, size_t chunk_size):
+    input(input),
+    chunk_size(chunk_size),
+    start(input.tellg())
+{
+    if (!input.seekg(0, std::ios::end)) {
+        throw LoaderError("PEX stream is not seekable");
+    }
+    auto file_size = static_cast<uint64_t>(input.tellg() - start);
+    input.seekg(start);
+
+    // The early header and the section count, then the alignment fields and the directory
+    auto head = read_exactly(input, 16);
+    info = read_early_header(head);
+    auto section_count = pex::util::read_uint<uint64_t>(std::string_view(head).substr(8));
+    auto rest_size = (info.format_version.minor >= 2 ? 8 : 0) + section_count * 24;
+    if (section_count > file_size / 24 || rest_size > file_size - head.size()) {
+        throw LoaderError("Invalid section count: " + std::to_string(section_count));
+    }
+    head += read_exactly(input, rest_size);
+    sections = read_section_directory(head, file_size);
+}
+
+
+const EarlyHeaderInfo& StreamLoader::get_info() const noexcept
+{
+    return info;
+}
+
+
+const std::vector<Section>& StreamLoader::get_sections() const noexcept
+{
+    return sections;
+}
+
+
+std::optional<std::string> StreamLoader::load_section(const std::string_view& name)
+{
+    auto section = find_section(sections, name);
+    if (!section.has_value()) {
+        return std::nullopt;
+    }
+    return load_section(*section);
+}
+
+
+std::string StreamLoader::load_section(const Section& section)
+{
+    input.clear();
+    input.seekg(start + static_cast<std::streamoff>(section.offset));
+
+    auto codec_id = get_codec(section);
+    if (codec_id == codecs::none) {
+        return read_exactly(input, section.size);
+    }
+
+    if (section.size < 8) {
+        throw LoaderError("Unexpected EOF while reading compressed section size");
+    }
+    auto uncompressed_size = pex::util::read_uint<uint64_t>(read_exactly(input, 8));
+
+    auto decoder = create_decoder(codec_id);
+    std::string output;
+    // The declared size is not trusted for the allocation, it is only checked in the end
+    output.reserve(std::min<uint64_t>(uncompressed_size, 16 * section.size));
+    std::string chunk;
+    for (auto left = section.size - 8; left > 0; ) {
+        auto size = std::min<uint64_t>(left, chunk_size);
+        chunk = read_exactly(input, size);
+        decoder->decode(chunk, output);
+        left -= size;
+    }
+    decoder->finish();
+    if (output.size() != uncompressed_size) {
+        throw LoaderError("Decompressed section size does not match the declared size");
+    }
+    return output;
+}
+
+}
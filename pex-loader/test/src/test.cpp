@@ -6,7 +6,11 @@
 #include <pex_loader/pex_loader.hpp>
 #include <pex_loader/read_uint.hpp>
 
+#include <algorithm>
+#include <cctype>
+#include <limits>
 #include <list>
+#include <sstream>
 #include <string_view>
 #include <vector>
 
@@ -307,3 +311,896 @@ TEST_CASE("v0::read_sections is working", "[read_sections]") {
         REQUIRE_THROWS(v0::read_sections(blob));
     }
 }
+
+TEST_CASE("v0::read_code_header is working", "[read_code_header]") {
+    using namespace pex::loader;
+    SECTION("function, valid") {
+        auto blob = (
+            // Type: function
+            "\x01"
+            // Local count: 3
+            "\x00\x00\x00\x00\x00\x00\x00\x03"
+            // Max stack depth: 5
+            "\x00\x00\x00\x00\x00\x00\x00\x05"
+            // Instruction count: 2
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+            // Offset: 1 + 8 + 8 + 8 = 25
+            // Instructions
+            "\x05\x00\x00\x00"
+            "\x16\x00\x00\x00"
+            // Constant count: 0
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        auto header = v0::read_code_header(blob);
+        CHECK(header.code_type == v0::CodeHeader::CodeType::function);
+        CHECK(header.local_count == 3);
+        CHECK(header.max_stack_depth == 5);
+        CHECK(header.instruction_count == 2);
+        CHECK(header.instructions_offset == 25);
+    }
+    SECTION("format 0.0, without local count and stack depth") {
+        auto blob = (
+            "\x01"
+            // Instruction count: 1
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x05\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        auto header = v0::read_code_header(blob, {0, 0});
+        CHECK(header.code_type == v0::CodeHeader::CodeType::function);
+        CHECK(header.local_count == 0);
+        CHECK(header.max_stack_depth == 0);
+        CHECK(header.instruction_count == 1);
+        CHECK(header.instructions_offset == 9);
+    }
+    SECTION("module without instructions") {
+        auto blob = (
+            "\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        auto header = v0::read_code_header(blob);
+        CHECK(header.code_type == v0::CodeHeader::CodeType::module);
+        CHECK(header.max_stack_depth == 0);
+        CHECK(header.instruction_count == 0);
+    }
+    SECTION("invalid type") {
+        auto blob = (
+            "\x03"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        CHECK_THROWS_MATCHES(
+            v0::read_code_header(blob),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("Invalid code object type") != std::string_view::npos;
+            })
+        );
+    }
+    SECTION("truncated instruction stream") {
+        auto blob = (
+            "\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+            "\x05\x00\x00\x00"
+            "\x16\x00\x00"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::read_code_header(blob), LoaderError);
+    }
+    SECTION("truncated header") {
+        auto blob = (
+            "\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::read_code_header(blob), LoaderError);
+    }
+}
+
+TEST_CASE("v0::read_section_directory is working", "[read_section_directory]") {
+    using namespace pex::loader;
+    SECTION("2 sections, valid") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+
+            // Directory entry 0: code, no flags, offset 16 + 2 * 24 = 64, size 5
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x40"
+            "\x00\x00\x00\x00\x00\x00\x00\x05"
+            // Directory entry 1: line, debug, offset 69, size 3
+            "line"
+            "\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x45"
+            "\x00\x00\x00\x00\x00\x00\x00\x03"
+
+            // Data
+            "Hello"
+            "abc"
+            ""sv
+        );
+
+        auto sections = v0::read_section_directory(blob);
+        REQUIRE(sections.size() == 2);
+        CHECK(sections[0].name == std::array<char, 4>{'c', 'o', 'd', 'e'});
+        CHECK(sections[0].flags == 0);
+        CHECK(sections[0].offset == 64);
+        CHECK(sections[0].size == 5);
+        CHECK(blob.substr(sections[0].offset, sections[0].size) == "Hello");
+
+        CHECK(sections[1].flags == v0::section_flags::debug);
+        CHECK(blob.substr(sections[1].offset, sections[1].size) == "abc");
+
+        auto line = v0::find_section(sections, "line");
+        REQUIRE(line.has_value());
+        CHECK(line->offset == 69);
+        CHECK_FALSE(v0::find_section(sections, "pool").has_value());
+    }
+    SECTION("0 sections") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        CHECK(v0::read_section_directory(blob).empty());
+    }
+    SECTION("truncated directory") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x28"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::read_section_directory(blob), LoaderError);
+    }
+    SECTION("section outside of the file") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x28"
+            "\x00\x00\x00\x00\x00\x00\x00\x06"
+            "Hello"
+            ""sv
+        );
+        CHECK_THROWS_MATCHES(
+            v0::read_section_directory(blob),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("outside of the file") != std::string_view::npos;
+            })
+        );
+    }
+}
+
+TEST_CASE("v0::read_exports is working", "[read_exports]") {
+    using namespace pex::loader;
+    SECTION("valid") {
+        auto blob = (
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+            "\x00\x00\x00\x00\x00\x00\x00\x04"
+            "main"
+            "\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x03"
+            "Foo"
+            "\x02"
+            ""sv
+        );
+        auto exports = v0::read_exports(blob);
+        REQUIRE(exports.size() == 2);
+        CHECK(exports[0].name == "main");
+        CHECK(exports[0].kind == v0::Export::Kind::function);
+        CHECK(exports[1].name == "Foo");
+        CHECK(exports[1].kind == v0::Export::Kind::class_);
+    }
+    SECTION("invalid kind") {
+        auto blob = (
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "x"
+            "\x07"
+            ""sv
+        );
+        CHECK_THROWS_MATCHES(
+            v0::read_exports(blob),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("Invalid export kind") != std::string_view::npos;
+            })
+        );
+    }
+    SECTION("truncated name") {
+        auto blob = (
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x10"
+            "abc"
+            "\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::read_exports(blob), LoaderError);
+    }
+}
+
+namespace
+{
+    // 5, -129, 2**70, -2**63, 1.5, 1-2j, 'name' and b'\x00b'
+    void check_pool(const std::vector<pex::loader::v0::Constant>& constants)
+    {
+        using pex::loader::v0::Constant;
+        REQUIRE(constants.size() == 8);
+        CHECK(constants[0].type == Constant::Type::integer);
+        CHECK(constants[0].data == "\x05"sv);
+        CHECK(constants[1].data == "\xFF\x7F"sv);
+        CHECK(constants[2].data == "\x40\x00\x00\x00\x00\x00\x00\x00\x00"sv);
+        CHECK(constants[3].data == "\x80\x00\x00\x00\x00\x00\x00\x00"sv);
+        CHECK(constants[4].type == Constant::Type::floating_point);
+        CHECK(constants[4].real == 1.5);
+        CHECK(constants[5].type == Constant::Type::complex);
+        CHECK(constants[5].real == 1.0);
+        CHECK(constants[5].imag == -2.0);
+        CHECK(constants[6].type == Constant::Type::string);
+        CHECK(constants[6].data == "name");
+        CHECK(constants[7].type == Constant::Type::bytes);
+        CHECK(constants[7].data == "\x00\x62"sv);
+    }
+}
+
+TEST_CASE("v0::read_constant_pool is working", "[read_constant_pool]") {
+    using namespace pex::loader;
+    SECTION("format 0.2") {
+        auto blob = (
+            "\x00\x00\x00\x00\x00\x00\x00\x08"
+            "i" "\x00\x00\x00\x00\x00\x00\x00\x01" "\x05"
+            "i" "\x00\x00\x00\x00\x00\x00\x00\x02" "\xFF\x7F"
+            "i" "\x00\x00\x00\x00\x00\x00\x00\x09" "\x40\x00\x00\x00\x00\x00\x00\x00\x00"
+            // Not the shortest form, the loader drops the redundant sign byte
+            "i" "\x00\x00\x00\x00\x00\x00\x00\x09" "\xFF\x80\x00\x00\x00\x00\x00\x00\x00"
+            "f" "\x00\x00\x00\x00\x00\x00\xF8\x3F"
+            "c" "\x00\x00\x00\x00\x00\x00\xF0\x3F" "\x00\x00\x00\x00\x00\x00\x00\xC0"
+            "u" "\x00\x00\x00\x00\x00\x00\x00\x04" "name"
+            "b" "\x00\x00\x00\x00\x00\x00\x00\x02" "\x00\x62"
+            ""sv
+        );
+        check_pool(v0::read_constant_pool(blob, {0, 2}));
+    }
+    SECTION("compact format 0.3") {
+        auto blob = (
+            "\x08"
+            "i" "\x05"
+            "i" "\xFF\x7E"
+            "i" "\x80\x80\x80\x80\x80\x80\x80\x80\x80\x80\x01"
+            "i" "\x80\x80\x80\x80\x80\x80\x80\x80\x80\x7F"
+            "f" "\x00\x00\x00\x00\x00\x00\xF8\x3F"
+            "c" "\x00\x00\x00\x00\x00\x00\xF0\x3F" "\x00\x00\x00\x00\x00\x00\x00\xC0"
+            "u" "\x04" "name"
+            "b" "\x02" "\x00\x62"
+            ""sv
+        );
+        check_pool(v0::read_constant_pool(blob, {0, 3}));
+    }
+    SECTION("small integers in the compact format") {
+        auto blob = "\x04" "i\x00" "i\x7F" "i\x40" "i\x3F"sv;
+        auto constants = v0::read_constant_pool(blob, {0, 3});
+        REQUIRE(constants.size() == 4);
+        CHECK(constants[0].data == "\x00"sv);
+        CHECK(constants[1].data == "\xFF"sv);
+        CHECK(constants[2].data == "\xC0"sv);
+        CHECK(constants[3].data == "\x3F"sv);
+    }
+    SECTION("invalid tag") {
+        auto blob = "\x01" "n\x00"sv;
+        CHECK_THROWS_MATCHES(
+            v0::read_constant_pool(blob, {0, 3}),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("Invalid constant tag") != std::string_view::npos;
+            })
+        );
+    }
+    SECTION("invalid count") {
+        REQUIRE_THROWS_AS(v0::read_constant_pool("\x05" "i\x01"sv, {0, 3}), LoaderError);
+    }
+    SECTION("truncated") {
+        REQUIRE_THROWS_AS(v0::read_constant_pool("\x01" "u\x10" "abc"sv, {0, 3}), LoaderError);
+        REQUIRE_THROWS_AS(v0::read_constant_pool("\x01" "i\x80"sv, {0, 3}), LoaderError);
+        REQUIRE_THROWS_AS(
+            v0::read_constant_pool("\x00\x00\x00\x00\x00\x00\x00\x01" "f\x00\x00\x00\x00\x00\x00\x00"sv, {0, 2}),
+            LoaderError
+        );
+    }
+}
+
+TEST_CASE("v0::Image is working", "[Image]") {
+    using namespace pex::loader;
+    SECTION("aligned image") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x02"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            // Section alignment: 16, code alignment: 8
+            "\x00\x00\x00\x10"
+            "\x00\x00\x00\x08"
+
+            // Directory entry 0: code, offset 24 + 24 = 48, size 48
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x30"
+            "\x00\x00\x00\x00\x00\x00\x00\x30"
+
+            // Code object: function, 0 locals, max stack depth 1, 2 instructions
+            "\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x02"
+            // Padding: 48 + 25 + 4 = 77, so 3 bytes up to 80
+            "\x00\x00\x00\x03"
+            "\x00\x00\x00"
+            // Instructions
+            "\x05\x00\x00\x00"
+            "\x16\x00\x00\x00"
+            // Constant count: 0
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+
+        // Copy the image into a buffer with a known alignment, as mmap would give
+        alignas(64) static char buffer[128];
+        std::copy(blob.begin(), blob.end(), buffer);
+        v0::Image image(std::string_view(buffer, blob.size()));
+
+        CHECK(image.get_section_alignment() == 16);
+        CHECK(image.get_code_alignment() == 8);
+        CHECK(image.is_aligned());
+        REQUIRE(image.get_sections().size() == 1);
+
+        auto code = image.get_section("code");
+        REQUIRE(code.has_value());
+        // A view into the buffer, not a copy
+        CHECK(code->data() == buffer + 48);
+        CHECK(code->size() == 48);
+        CHECK_FALSE(image.get_section("syms").has_value());
+
+        auto header = image.read_code_header(*code);
+        CHECK(header.code_type == v0::CodeHeader::CodeType::function);
+        CHECK(header.max_stack_depth == 1);
+        CHECK(header.instruction_count == 2);
+        CHECK(header.instructions_offset == 32);
+
+        auto instructions = v0::Image::get_instructions(*code, header);
+        CHECK(instructions.data() == buffer + 80);
+        CHECK(reinterpret_cast<uintptr_t>(instructions.data()) % image.get_code_alignment() == 0);
+        CHECK(instructions == "\x05\x00\x00\x00\x16\x00\x00\x00"sv);
+    }
+    SECTION("unaligned image (format 0.1)") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x01"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x28"
+            "\x00\x00\x00\x00\x00\x00\x00\x25"
+            "\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x05\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        v0::Image image(blob);
+        CHECK(image.get_section_alignment() == 1);
+        CHECK(image.get_code_alignment() == 1);
+        CHECK(image.is_aligned());
+
+        auto code = image.get_section("code");
+        REQUIRE(code.has_value());
+        CHECK(code->data() == blob.data() + 40);
+        auto header = image.read_code_header(*code);
+        CHECK(header.code_type == v0::CodeHeader::CodeType::module);
+        CHECK(header.instructions_offset == 25);
+        CHECK(v0::Image::get_instructions(*code, header) == "\x05\x00\x00\x00"sv);
+    }
+    SECTION("misaligned section") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x02"
+            "\x00\x00\x00\x00\x00\x00\x00\x01"
+            "\x00\x00\x00\x10"
+            "\x00\x00\x00\x04"
+            "code"
+            "\x00\x00\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x31"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00"
+            ""sv
+        );
+        CHECK_THROWS_MATCHES(
+            v0::Image(blob),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("is not aligned") != std::string_view::npos;
+            })
+        );
+    }
+    SECTION("invalid alignment") {
+        auto blob = (
+            "PEX\x01\x00\x00\x00\x02"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            "\x00\x00\x00\x03"
+            "\x00\x00\x00\x04"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::Image(blob), LoaderError);
+    }
+    SECTION("unsupported version") {
+        auto blob = (
+            "PEX\x01\x00\x01\x00\x00"
+            "\x00\x00\x00\x00\x00\x00\x00\x00"
+            ""sv
+        );
+        REQUIRE_THROWS_AS(v0::Image(blob), LoaderError);
+    }
+}
+
+TEST_CASE("DataReader::read_uvarint is working", "[DataReader]") {
+    using namespace pex::util;
+    SECTION("single and multi-byte values") {
+        DataReader r("\x00\x7F\x80\x01\xE5\x8E\x26"sv);
+        CHECK(r.read_uvarint<uint64_t>() == 0);
+        CHECK(r.read_uvarint<uint64_t>() == 127);
+        CHECK(r.read_uvarint<uint64_t>() == 128);
+        CHECK(r.read_uvarint<uint32_t>() == 624485);
+        CHECK(r.get_number_of_bytes_left() == 0);
+    }
+    SECTION("redundant continuation bytes") {
+        DataReader r("\xC8\x81\x80\x80\x00"sv);
+        CHECK(r.read_uvarint<uint8_t>() == 200);
+        CHECK(r.get_offset() == 5);
+    }
+    SECTION("maximal 64-bit value") {
+        DataReader r("\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\x01"sv);
+        CHECK(r.read_uvarint<uint64_t>() == 0xFFFF'FFFF'FFFF'FFFFULL);
+    }
+    SECTION("overflow") {
+        DataReader r("\x80\x02"sv);
+        REQUIRE_THROWS_AS(r.read_uvarint<uint8_t>(), std::overflow_error);
+        CHECK(r.get_offset() == 0);
+        CHECK(r.read_uvarint<uint16_t>() == 256);
+    }
+    SECTION("truncated") {
+        DataReader r("\x80\x80"sv);
+        REQUIRE_THROWS_AS(r.read_uvarint<uint64_t>(), DataReader::EofError);
+        CHECK(r.get_offset() == 0);
+    }
+}
+
+TEST_CASE("v0::read_code_header supports the compact format", "[read_code_header]") {
+    using namespace pex::loader;
+    auto blob = (
+        // Type: function
+        "\x01"
+        // Local count: 3, max stack depth: 200, 3 instruction units
+        "\x03"
+        "\xC8\x01"
+        "\x03"
+        // Padding: 2 bytes
+        "\x02"
+        "\x00\x00"
+        // Instructions
+        "\x05\x07"
+        "\xFF\x01"
+        "\x16\x02"
+        // Constant count: 0
+        "\x00"
+        ""sv
+    );
+    auto header = v0::read_code_header(blob, {0, 3});
+    CHECK(header.code_type == v0::CodeHeader::CodeType::function);
+    CHECK(header.local_count == 3);
+    CHECK(header.max_stack_depth == 200);
+    CHECK(header.instruction_count == 3);
+    CHECK(header.instructions_offset == 8);
+    CHECK(header.instructions_size == 6);
+
+    REQUIRE_THROWS_AS(v0::read_code_header(blob.substr(0, 12), {0, 3}), LoaderError);
+}
+
+TEST_CASE("v0::read_instruction is working", "[read_instruction]") {
+    using namespace pex::loader;
+    SECTION("4-byte words") {
+        auto instructions = "\x05\x00\x01\x02\x16\x00\x00\x00\x01"sv;
+        uint64_t offset = 0;
+        auto instruction = v0::read_instruction(instructions, offset);
+        CHECK(instruction.opcode == 0x05);
+        CHECK(instruction.argument == 0x0102);
+        CHECK(offset == 4);
+        instruction = v0::read_instruction(instructions, offset);
+        CHECK(instruction.opcode == 0x16);
+        CHECK(instruction.argument == 0);
+        REQUIRE_THROWS_AS(v0::read_instruction(instructions, offset), LoaderError);
+    }
+    SECTION("compact with extended_arg") {
+        auto instructions = (
+            "\x05\x07"
+            "\xFF\x01"
+            "\x16\x02"
+            "\xFF\x12"
+            "\xFF\x34"
+            "\x03\x56"
+            ""sv
+        );
+        uint64_t offset = 0;
+        auto instruction = v0::read_instruction(instructions, offset, {0, 3});
+        CHECK(instruction.opcode == 0x05);
+        CHECK(instruction.argument == 0x07);
+        CHECK(offset == 2);
+        instruction = v0::read_instruction(instructions, offset, {0, 3});
+        CHECK(instruction.opcode == 0x16);
+        CHECK(instruction.argument == 0x0102);
+        CHECK(offset == 6);
+        instruction = v0::read_instruction(instructions, offset, {0, 3});
+        CHECK(instruction.opcode == 0x03);
+        CHECK(instruction.argument == 0x12'3456);
+        CHECK(offset == 12);
+    }
+    SECTION("compact, too many prefixes") {
+        auto instructions = "\xFF\x01\xFF\x02\xFF\x03\x05\x00"sv;
+        uint64_t offset = 0;
+        REQUIRE_THROWS_AS(v0::read_instruction(instructions, offset, {0, 3}), LoaderError);
+        CHECK(offset == 0);
+    }
+    SECTION("compact, truncated") {
+        auto instructions = "\xFF\x01\x05"sv;
+        uint64_t offset = 0;
+        REQUIRE_THROWS_AS(v0::read_instruction(instructions, offset, {0, 3}), LoaderError);
+    }
+}
+
+TEST_CASE("v0::Image supports the compact format", "[Image]") {
+    using namespace pex::loader;
+    auto blob = (
+        "PEX\x01\x00\x00\x00\x03"
+        "\x00\x00\x00\x00\x00\x00\x00\x02"
+        "\x00\x00\x00\x01"
+        "\x00\x00\x00\x01"
+
+        // Directory entry 0: code, offset 24 + 2 * 24 = 72, size 10
+        "code"
+        "\x00\x00\x00\x00"
+        "\x00\x00\x00\x00\x00\x00\x00\x48"
+        "\x00\x00\x00\x00\x00\x00\x00\x0A"
+        // Directory entry 1: syms, offset 82, size 7
+        "syms"
+        "\x00\x00\x00\x00"
+        "\x00\x00\x00\x00\x00\x00\x00\x52"
+        "\x00\x00\x00\x00\x00\x00\x00\x07"
+
+        // Code object: module, no locals, max stack depth 1, 2 units, no padding
+        "\x00"
+        "\x00"
+        "\x01"
+        "\x02"
+        "\x00"
+        "\xFF\x01"
+        "\x05\x02"
+        "\x00"
+
+        // Exports: main (function)
+        "\x01"
+        "\x04"
+        "main"
+        "\x01"
+        ""sv
+    );
+    v0::Image image(blob);
+    auto code = image.get_section("code");
+    REQUIRE(code.has_value());
+    auto header = image.read_code_header(*code);
+    CHECK(header.instruction_count == 2);
+
+    auto instructions = v0::Image::get_instructions(*code, header);
+    uint64_t offset = 0;
+    auto instruction = v0::read_instruction(instructions, offset, image.get_info().format_version);
+    CHECK(instruction.opcode == 0x05);
+    CHECK(instruction.argument == 0x0102);
+    CHECK(offset == instructions.size());
+
+    auto exports = image.read_exports();
+    REQUIRE(exports.size() == 1);
+    CHECK(exports[0].name == "main");
+    CHECK(exports[0].kind == v0::Export::Kind::function);
+
+    CHECK(image.read_constant_pool().empty());
+}
+
+namespace
+{
+    // "Hello, compressed PEX!" compressed with zlib
+    constexpr auto zlib_hello = (
+        "\x78\xDA\xF3\x48\xCD\xC9\xC9\xD7\x51\x48\xCE\xCF\x2D\x28\x4A\x2D"
+        "\x2E\x4E\x4D\x51\x08\x70\x8D\x50\x04\x00\x5B\x7B\x07\xA4"
+        ""sv
+    );
+
+    // "PEX!" repeated 25000 times compressed with zlib
+    constexpr auto zlib_repeated = (
+        "\x78\xDA\xED\xC3\x31\x0D\x00\x00\x08\x03\x30\x2D\x88\xE1\xDF\x39"
+        "\xFF\x4A\xB0\xC1\xD1\x26\xCD\x76\xA2\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA"
+        "\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xAA\xBE\x7C\x98\x48\x05\x3A"
+        ""sv
+    );
+
+    std::string compressed_section(uint64_t uncompressed_size, const std::string_view& compressed)
+    {
+        std::string data(8, '\0');
+        for (int i = 7; i >= 0; --i) {
+            data[i] = static_cast<char>(uncompressed_size & 0xFF);
+            uncompressed_size >>= 8;
+        }
+        return data + std::string(compressed);
+    }
+
+    pex::loader::v0::Section make_section(const std::string& data, uint32_t flags)
+    {
+        return pex::loader::v0::Section{0, data.size(), {'d', 'a', 't', 'a'}, flags};
+    }
+}
+
+TEST_CASE("v0::decompress_section is working", "[codecs]") {
+    using namespace pex::loader;
+    constexpr uint32_t zlib_flags = uint32_t(v0::codecs::zlib) << v0::section_flags::codec_shift;
+
+    SECTION("uncompressed") {
+        std::string data = "Hello";
+        auto section = make_section(data, v0::section_flags::debug);
+        CHECK(v0::get_codec(section) == v0::codecs::none);
+        CHECK(v0::decompress_section(data, section) == "Hello");
+    }
+    SECTION("zlib") {
+        auto data = compressed_section(22, zlib_hello);
+        auto section = make_section(data, zlib_flags);
+        CHECK(v0::get_codec(section) == v0::codecs::zlib);
+        CHECK(v0::decompress_section(data, section) == "Hello, compressed PEX!");
+    }
+    SECTION("zlib, output larger than the decoder buffer") {
+        auto data = compressed_section(100000, zlib_repeated);
+        auto output = v0::decompress_section(data, make_section(data, zlib_flags));
+        REQUIRE(output.size() == 100000);
+        std::string expected;
+        for (int i = 0; i < 25000; ++i) {
+            expected += "PEX!";
+        }
+        CHECK(output == expected);
+    }
+    SECTION("size mismatch") {
+        auto data = compressed_section(23, zlib_hello);
+        REQUIRE_THROWS_AS(v0::decompress_section(data, make_section(data, zlib_flags)), LoaderError);
+    }
+    SECTION("truncated stream") {
+        auto data = compressed_section(22, zlib_hello.substr(0, 20));
+        REQUIRE_THROWS_AS(v0::decompress_section(data, make_section(data, zlib_flags)), LoaderError);
+    }
+    SECTION("corrupted stream") {
+        auto data = compressed_section(22, zlib_hello);
+        data[8 + 12] ^= 0x55;
+        REQUIRE_THROWS_AS(v0::decompress_section(data, make_section(data, zlib_flags)), LoaderError);
+    }
+    SECTION("unknown codec") {
+        auto data = compressed_section(22, zlib_hello);
+        CHECK_THROWS_MATCHES(
+            v0::decompress_section(data, make_section(data, 0x7E00)),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("Unsupported compression codec") != std::string_view::npos;
+            })
+        );
+    }
+    SECTION("custom codec") {
+        class UppercaseDecoder : public v0::Decoder
+        {
+        public:
+            void decode(const std::string_view& input, std::string& output) override
+            {
+                for (auto c : input) {
+                    output += static_cast<char>(std::toupper(static_cast<unsigned char>(c)));
+                }
+            }
+
+            void finish() override
+            { }
+        };
+        v0::register_codec(0x7F, []() { return std::make_unique<UppercaseDecoder>(); });
+
+        auto data = compressed_section(5, "hello");
+        CHECK(v0::decompress_section(data, make_section(data, 0x7F00)) == "HELLO");
+    }
+}
+
+TEST_CASE("v0::StreamLoader is working", "[StreamLoader]") {
+    using namespace pex::loader;
+    auto blob = std::string(
+        "PEX\x01\x00\x00\x00\x02"
+        "\x00\x00\x00\x00\x00\x00\x00\x02"
+        "\x00\x00\x00\x01"
+        "\x00\x00\x00\x01"
+
+        // Directory entry 0: code, offset 24 + 2 * 24 = 72, size 5
+        "code"
+        "\x00\x00\x00\x00"
+        "\x00\x00\x00\x00\x00\x00\x00\x48"
+        "\x00\x00\x00\x00\x00\x00\x00\x05"
+        // Directory entry 1: data, zlib, offset 77, size 8 + 30 = 38
+        "data"
+        "\x00\x00\x01\x00"
+        "\x00\x00\x00\x00\x00\x00\x00\x4D"
+        "\x00\x00\x00\x00\x00\x00\x00\x26"
+
+        "Hello"
+        ""sv
+    ) + compressed_section(22, zlib_hello);
+
+    SECTION("valid") {
+        // A prefix before the image checks that offsets are relative to its beginning
+        std::istringstream input("garbage" + blob);
+        input.seekg(7);
+        // Tiny chunks, so the compressed section is fed to the decoder in several parts
+        v0::StreamLoader loader(input, 4);
+        CHECK(loader.get_info().format_version.minor == 2);
+        REQUIRE(loader.get_sections().size() == 2);
+        CHECK(v0::get_codec(loader.get_sections()[1]) == v0::codecs::zlib);
+
+        CHECK(loader.load_section("data") == "Hello, compressed PEX!");
+        CHECK(loader.load_section("code") == "Hello");
+        CHECK_FALSE(loader.load_section("syms").has_value());
+    }
+    SECTION("truncated") {
+        std::istringstream input(blob.substr(0, blob.size() - 1));
+        REQUIRE_THROWS_AS(v0::StreamLoader(input), LoaderError);
+    }
+    SECTION("truncated directory") {
+        std::istringstream input(blob.substr(0, 50));
+        REQUIRE_THROWS_AS(v0::StreamLoader(input), LoaderError);
+    }
+    SECTION("in-memory image") {
+        v0::Image image(blob);
+        CHECK(image.get_section("code") == "Hello"sv);
+        CHECK_THROWS_MATCHES(
+            image.get_section("data"),
+            LoaderError,
+            Predicate<LoaderError>([](const LoaderError& e) {
+                return std::string_view(e.what()).find("is compressed") != std::string_view::npos;
+            })
+        );
+        auto section = v0::find_section(image.get_sections(), "data");
+        REQUIRE(section.has_value());
+        CHECK(v0::decompress_section(std::string_view(blob).substr(section->offset, section->size), *section)
+              == "Hello, compressed PEX!");
+    }
+}
+
+TEST_CASE("DataReader::read_svarint is working", "[DataReader]") {
+    using namespace pex::util;
+    SECTION("single and multi-byte values") {
+        DataReader r("\x00\x3F\x7F\xC0\x00\x80\x7F\xE5\x8E\x26"sv);
+        CHECK(r.read_svarint<int64_t>() == 0);
+        CHECK(r.read_svarint<int64_t>() == 63);
+        CHECK(r.read_svarint<int64_t>() == -1);
+        CHECK(r.read_svarint<int64_t>() == 64);
+        CHECK(r.read_svarint<int64_t>() == -128);
+        CHECK(r.read_svarint<int32_t>() == 624485);
+        CHECK(r.get_number_of_bytes_left() == 0);
+    }
+    SECTION("limits") {
+        DataReader r("\x80\x7F\xFF\x00\x80\x80\x80\x80\x80\x80\x80\x80\x80\x7F"sv);
+        CHECK(r.read_svarint<int8_t>() == -128);
+        CHECK(r.read_svarint<int8_t>() == 127);
+        CHECK(r.read_svarint<int64_t>() == std::numeric_limits<int64_t>::min());
+    }
+    SECTION("overflow") {
+        DataReader r("\x80\x01"sv);
+        REQUIRE_THROWS_AS(r.read_svarint<int8_t>(), std::overflow_error);
+        CHECK(r.get_offset() == 0);
+        CHECK(r.read_svarint<int16_t>() == 128);
+    }
+    SECTION("too long") {
+        DataReader r("\x80\x80\x80\x00"sv);
+        REQUIRE_THROWS_AS(r.read_svarint<int8_t>(), std::overflow_error);
+        CHECK(r.get_offset() == 0);
+    }
+    SECTION("truncated") {
+        DataReader r("\x80\x80"sv);
+        REQUIRE_THROWS_AS(r.read_svarint<int64_t>(), DataReader::EofError);
+        CHECK(r.get_offset() == 0);
+    }
+}
+
+TEST_CASE("v0::read_line_tables is working", "[read_line_tables]") {
+    using namespace pex::loader;
+    SECTION("valid") {
+        auto blob = (
+            "\x02"
+            // Code object at offset 0: lines 1, 4 and 2 starting at addresses 0, 5 and 9
+            "\x00\x03"
+            "\x00\x01"
+            "\x05\x03"
+            "\x04\x7E"
+            // Code object at offset 200: line 10 from address 0
+            "\xC8\x01\x01"
+            "\x00\x0A"
+            ""sv
+        );
+        auto tables = v0::read_line_tables(blob);
+        REQUIRE(tables.size() == 2);
+        CHECK(tables[0].code_offset == 0);
+        REQUIRE(tables[0].entries.size() == 3);
+        CHECK(tables[0].entries[2].address == 9);
+        CHECK(tables[0].entries[2].line == 2);
+        CHECK(tables[0].find_line(0) == 1);
+        CHECK(tables[0].find_line(4) == 1);
+        CHECK(tables[0].find_line(5) == 4);
+        CHECK(tables[0].find_line(100) == 2);
+
+        auto table = v0::find_line_table(tables, 200);
+        REQUIRE(table != nullptr);
+        CHECK(table->find_line(3) == 10);
+        CHECK(v0::find_line_table(tables, 1) == nullptr);
+        CHECK(v0::find_line_table(tables, 1000) == nullptr);
+    }
+    SECTION("line before the first entry") {
+        auto tables = v0::read_line_tables("\x01\x00\x01\x02\x05"sv);
+        REQUIRE(tables.size() == 1);
+        CHECK_FALSE(tables[0].find_line(1).has_value());
+        CHECK(tables[0].find_line(2) == 5);
+    }
+    SECTION("unsorted tables") {
+        REQUIRE_THROWS_AS(v0::read_line_tables("\x02\x05\x00\x05\x00"sv), LoaderError);
+    }
+    SECTION("negative line") {
+        REQUIRE_THROWS_AS(v0::read_line_tables("\x01\x00\x01\x00\x7F"sv), LoaderError);
+    }
+    SECTION("truncated") {
+        REQUIRE_THROWS_AS(v0::read_line_tables("\x01\x00\x02\x00\x01"sv), LoaderError);
+    }
+}
+
+TEST_CASE("v0::Image reads line tables", "[Image]") {
+    using namespace pex::loader;
+    auto blob = (
+        "PEX\x01\x00\x00\x00\x02"
+        "\x00\x00\x00\x00\x00\x00\x00\x01"
+        "\x00\x00\x00\x01"
+        "\x00\x00\x00\x01"
+
+        // Directory entry 0: line (debug), offset 48, size 5
+        "line"
+        "\x00\x00\x00\x01"
+        "\x00\x00\x00\x00\x00\x00\x00\x30"
+        "\x00\x00\x00\x00\x00\x00\x00\x05"
+
+        "\x01\x00\x01\x00\x07"
+        ""sv
+    );
+    v0::Image image(blob);
+    REQUIRE(image.get_sections().size() == 1);
+    CHECK((image.get_sections()[0].flags & v0::section_flags::debug) != 0);
+    auto tables = image.read_line_tables();
+    REQUIRE(tables.size() == 1);
+    CHECK(tables[0].find_line(0) == 7);
+}